@@ -0,0 +1,407 @@
+"""Timings of the operations behind the GUI buttons, per ledger size.
+
+Each benchmark also checks what the timed call returned or left behind
+against a plain query of the ledger, so a fast but wrong answer fails.
+"""
+
+import asyncio
+import csv
+import datetime
+import itertools
+import json
+import re
+import shutil
+import threading
+
+import pytest
+
+from expense_core import (COLUMNS, Expense, ExpenseRepository, WriteQueue, connect, display_row, expense_filter, from_minor,
+                          import_file, load_settings)
+from expense_core.diagnostics import recorder
+from expense_core.pivot import MonthlyPivot
+from ledger import generate_rows
+from paged_table import PagedTable
+
+# Rows in the statement the bulk import benchmark loads
+STATEMENT_ROWS = 50_000
+
+# Threads adding expenses at the same time, and how many each adds
+WRITERS = 8
+WRITER_ROWS = 50
+
+# MonthlyCategoryTotals aggregated from the expenses
+MONTHLY_GROUP_BY = (
+    "SELECT IFNULL(strftime('%Y-%m', Date), ''), IFNULL(Category, ''), Currency, SUM(Amount), COUNT(*) "
+    "FROM ExpenseTracker GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+)
+
+
+# Range totals aggregated from the expenses, optionally per {group}
+RANGE_GROUP_BY = (
+    "SELECT {group}SUM(Amount), COUNT(*) FROM ExpenseTracker "
+    "WHERE Currency = 'INR' AND Date >= '2023-04-01' AND Date < '2024-04-01' GROUP BY {group}Currency"
+)
+
+
+def assert_rollups_match(connector):
+    assert connector.execute(
+        'SELECT Month, Category, Currency, Total, Entries FROM MonthlyCategoryTotals ORDER BY 1, 2, 3'
+    ).fetchall() == connector.execute(MONTHLY_GROUP_BY).fetchall()
+
+
+def count_rows(connector):
+    return connector.execute('SELECT COUNT(*) FROM ExpenseTracker').fetchone()[0]
+
+
+def shown_ids(treeview):
+    return [int(iid) for iid in treeview.get_children()]
+
+
+def ids(connector, sql, *params):
+    return [row[0] for row in connector.execute(sql, params)]
+
+
+@pytest.fixture(scope='session')
+def statement(tmp_path_factory):
+    path = tmp_path_factory.mktemp('statement') / 'statement.csv'
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(('Date', 'Payee', 'Description', 'Amount', 'Mode of Payment', 'Category', 'Currency'))
+        writer.writerows((*row[:3], from_minor(row[3]), *row[4:]) for row in generate_rows(STATEMENT_ROWS, seed=1))
+    return str(path)
+
+
+# Writing
+@pytest.mark.benchmark(group='write')
+def bench_single_insert(benchmark, ledger_copy):
+    # Like the "Add expense" button: one row, one commit
+    connector = connect(ledger_copy)
+    expenses = ExpenseRepository(connector)
+    expense = Expense(datetime.date(2024, 6, 1), 'cafe', 'coffee', '180.00', 'Cash', 'Food')
+
+    added = benchmark(lambda: expenses.add(Expense(**{**vars(expense), 'id': None})))
+    assert expenses.get(added.id) == added
+    assert_rollups_match(connector)
+    connector.close()
+
+
+def _concurrent_writers(add):
+    # WRITERS threads that each call add() WRITER_ROWS times
+    def writer():
+        for _ in range(WRITER_ROWS):
+            add()
+
+    threads = [threading.Thread(target=writer) for _ in range(WRITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.benchmark(group='write')
+def bench_concurrent_insert_per_row(benchmark, ledger_copy):
+    # Several windows or API clients, each committing its own rows
+    local = threading.local()
+
+    def add():
+        if not hasattr(local, 'expenses'):
+            local.expenses = ExpenseRepository(connect(ledger_copy))
+        local.expenses.add(Expense(datetime.date(2024, 6, 1), 'cafe', 'coffee', '180.00', 'Cash', 'Food'))
+
+    connector = connect(ledger_copy)
+    before = count_rows(connector)
+    benchmark(_concurrent_writers, add)
+    assert (count_rows(connector) - before) % (WRITERS * WRITER_ROWS) == 0 < count_rows(connector) - before
+    assert_rollups_match(connector)
+    connector.close()
+
+
+@pytest.mark.benchmark(group='write')
+def bench_concurrent_insert_queued(benchmark, ledger_copy):
+    # The same writers sharing one WriteQueue, each waiting for its row to be committed
+    writes = WriteQueue(ledger_copy)
+
+    def add():
+        writes.add(Expense(datetime.date(2024, 6, 1), 'cafe', 'coffee', '180.00', 'Cash', 'Food')).result()
+
+    connector = connect(ledger_copy)
+    before = count_rows(connector)
+    benchmark(_concurrent_writers, add)
+    writes.close()
+    assert (count_rows(connector) - before) % (WRITERS * WRITER_ROWS) == 0 < count_rows(connector) - before
+    assert_rollups_match(connector)
+    connector.close()
+
+
+@pytest.mark.benchmark(group='write')
+def bench_bulk_import(benchmark, ledger, statement, tmp_path):
+    copies = itertools.count()
+
+    def fresh_copy():
+        path = tmp_path / f'import-{next(copies)}.db'
+        shutil.copyfile(ledger, path)
+        return (connect(str(path)),), {}
+
+    def load(connector):
+        imported = import_file(connector, statement)
+        connector.close()
+        return imported
+
+    assert benchmark.pedantic(load, setup=fresh_copy, rounds=3) == STATEMENT_ROWS
+    connector = connect(str(tmp_path / 'import-0.db'))
+    assert count_rows(connector) == count_rows(original := connect(ledger)) + STATEMENT_ROWS
+    assert_rollups_match(connector)
+    connector.close()
+    original.close()
+
+
+# Maintenance
+@pytest.mark.benchmark(group='maintenance')
+def bench_online_backup(benchmark, connector, tmp_path):
+    # The snapshot Maintenance takes in the background, and before "Remove All Expenses"
+    from expense_core.backup import backup
+
+    benchmark.pedantic(backup, args=(connector, str(tmp_path / 'backup.db')), rounds=3)
+    copy = connect(str(tmp_path / 'backup.db'))
+    totals = 'SELECT COUNT(*), SUM(Amount) FROM ExpenseTracker'
+    assert copy.execute(totals).fetchone() == connector.execute(totals).fetchone()
+    copy.close()
+
+
+# Listing
+@pytest.mark.benchmark(group='listing')
+def bench_list_first_page(benchmark, connector, treeview):
+    # What list_all_expenses() does
+    view = PagedTable(treeview, connector, COLUMNS, format_row=display_row)
+    benchmark(view.reset)
+    first_page = connector.execute('SELECT * FROM ExpenseTracker ORDER BY ID LIMIT ?', (view.page_size,))
+    assert [treeview.item(iid, 'values') for iid in treeview.get_children()] == [list(display_row(row))
+                                                                                 for row in first_page]
+
+
+@pytest.mark.benchmark(group='listing')
+def bench_list_scroll_20_pages(benchmark, connector, treeview):
+    view = PagedTable(treeview, connector, COLUMNS)
+
+    def scroll():
+        view.reset()
+        for _ in range(20):
+            view.load_next_page()
+
+    benchmark(scroll)
+    # The last max_pages of the 21 pages read, in order and without gaps
+    kept = view.page_size * view.max_pages
+    assert shown_ids(treeview) == ids(connector, 'SELECT ID FROM ExpenseTracker ORDER BY ID LIMIT ? OFFSET ?',
+                                      kept, 21 * view.page_size - kept)
+
+
+@pytest.fixture
+def traced_connector(ledger):
+    connector = connect(ledger, dict(load_settings(), diagnostics='on'))
+    yield connector
+    connector.close()
+    recorder.reset()
+
+
+@pytest.mark.benchmark(group='listing')
+def bench_list_scroll_20_pages_traced(benchmark, traced_connector, treeview):
+    # The cost of diagnostics = on
+    view = PagedTable(treeview, traced_connector, COLUMNS)
+
+    def scroll():
+        view.reset()
+        for _ in range(20):
+            view.load_next_page()
+
+    benchmark(scroll)
+
+
+@pytest.mark.benchmark(group='listing')
+def bench_list_by_date(benchmark, connector, treeview):
+    view = PagedTable(treeview, connector, COLUMNS, sort='Date')
+    benchmark(view.reset)
+    assert shown_ids(treeview) == ids(connector, 'SELECT ID FROM ExpenseTracker ORDER BY Date, ID LIMIT ?',
+                                      view.page_size)
+
+
+@pytest.mark.benchmark(group='listing')
+@pytest.mark.parametrize('text', ['s', 'super', 'cin purch'])
+def bench_search_first_page(benchmark, connector, treeview, text):
+    # Typing into the search box
+    view = PagedTable(treeview, connector, COLUMNS)
+    benchmark(view.set_filter, expense_filter(text))
+    # Expenses with a Payee or Description word starting with every word searched for
+    prefixes = text.lower().split()
+    matching = [expense_id for expense_id, payee, description in connector.execute(
+                    'SELECT ID, Payee, Description FROM ExpenseTracker ORDER BY ID')
+                if all(any(word.startswith(prefix) for word in re.findall(r'\w+', f'{payee} {description}'.lower()))
+                       for prefix in prefixes)]
+    assert shown_ids(treeview) == matching[:view.page_size]
+
+
+@pytest.mark.benchmark(group='listing')
+def bench_filter_first_page(benchmark, connector, treeview):
+    view = PagedTable(treeview, connector, COLUMNS)
+    benchmark(view.set_filter, expense_filter('s', start='2024-01-01', end='2024-06-30', categories=['Food'],
+                                              min_amount=200, max_amount=1000))
+    rows = [treeview.item(iid, 'values') for iid in treeview.get_children()]
+    assert rows
+    for _, day, _, _, amount, _, category, _ in rows:
+        assert '2024-01-01' <= day <= '2024-06-30' and category == 'Food' and 20000 <= amount <= 100000
+
+
+# Aggregation
+@pytest.mark.benchmark(group='summary')
+def bench_monthly_totals(benchmark, expenses):
+    # The rollup query behind the summary and the chart, in one currency
+    totals = benchmark(ExpenseRepository.monthly_totals.uncached, expenses)
+    assert totals == [(month or None, category or None, from_minor(total))
+                      for month, category, currency, total, _ in expenses.connector.execute(MONTHLY_GROUP_BY)
+                      if currency == 'INR']
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_monthly_group_by(benchmark, connector):
+    # The same totals aggregated from the expenses, for comparison
+    benchmark(lambda: connector.execute(
+        "SELECT strftime('%Y-%m', Date) AS month, Category, SUM(Amount) FROM ExpenseTracker GROUP BY month, Category"
+    ).fetchall())
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_converted_monthly_totals(benchmark, connector):
+    # What summarize_expenses() and the chart read: the totals in the reporting currency
+    fx = pytest.importorskip('expense_core.fx')
+    totals = benchmark(fx.converted_monthly_totals.uncached, connector)
+    # The synthetic ledgers are all in rupees, so nothing needs a rate
+    assert totals == ExpenseRepository(connector).monthly_totals()
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_converted_monthly_pivot(benchmark, connector):
+    # The same totals as the month x category matrix the summary and the chart use
+    fx = pytest.importorskip('expense_core.fx')
+    pivot = benchmark(fx.converted_monthly_pivot.uncached, connector)
+    expected = MonthlyPivot.from_rows(ExpenseRepository(connector).monthly_totals())
+    assert (pivot.months, pivot.categories, pivot.totals.tolist()) == (expected.months, expected.categories,
+                                                                       expected.totals.tolist())
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_converted_monthly_pivot_cached(benchmark, connector):
+    # Summarizing again while nothing has changed
+    fx = pytest.importorskip('expense_core.fx')
+    pivot = fx.converted_monthly_pivot(connector)
+    assert benchmark(fx.converted_monthly_pivot, connector) is pivot
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_category_totals(benchmark, expenses):
+    totals = benchmark(ExpenseRepository.category_totals.uncached, expenses)
+    assert totals == [(category, from_minor(total)) for category, total in expenses.connector.execute(
+        "SELECT Category, SUM(Amount) FROM ExpenseTracker WHERE Currency = 'INR' GROUP BY Category ORDER BY 2 DESC")]
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_range_total(benchmark, expenses):
+    # "Totals by Date" and `expense-cli total`: two lookups in DailyTotals
+    total = benchmark(expenses.range_total, datetime.date(2023, 4, 1), datetime.date(2024, 3, 31))
+    amount, entries = expenses.connector.execute(RANGE_GROUP_BY.format(group='')).fetchone()
+    assert total == (from_minor(amount), entries)
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_range_category_totals(benchmark, expenses):
+    totals = benchmark(expenses.range_category_totals, datetime.date(2023, 4, 1), datetime.date(2024, 3, 31))
+    assert dict(totals) == {category: (from_minor(amount), entries) for category, amount, entries in
+                            expenses.connector.execute(RANGE_GROUP_BY.format(group='Category, '))}
+
+
+@pytest.mark.benchmark(group='summary')
+def bench_range_group_by(benchmark, connector):
+    # The same totals aggregated from the expenses, for comparison
+    benchmark(lambda: connector.execute(RANGE_GROUP_BY.format(group='Category, ')).fetchall())
+
+
+@pytest.mark.benchmark(group='analytics')
+def bench_forecast(benchmark, connector):
+    # ai_spending_suggestions()
+    forecast = pytest.importorskip('expense_core.forecast')
+    prediction = benchmark(forecast.forecast_spending.uncached, connector)
+    assert prediction is not None and prediction.total[0].expected > 0
+
+
+@pytest.mark.benchmark(group='analytics')
+def bench_chart_render(benchmark, expenses):
+    # The grouped bar chart of visualize_expenses(), drawn off screen
+    pytest.importorskip('matplotlib')
+    from chart_panel import render_chart
+
+    image = benchmark(render_chart, MonthlyPivot.from_rows(expenses.monthly_totals()))
+    assert image.startswith(b'\x89PNG')
+
+
+# API server
+API_CLIENTS = 16
+API_REQUESTS = 25
+
+
+@pytest.fixture
+def api(ledger_copy):
+    """A running ExpenseServer on a free port, and the event loop it runs on."""
+    from expense_core.server import ExpenseServer
+
+    loop = asyncio.new_event_loop()
+    server = ExpenseServer(ledger_copy)
+    loop.run_until_complete(server.start(port=0))
+    yield loop, server.port
+    loop.run_until_complete(server.close())
+    loop.close()
+
+
+async def _requests(port, request, count):
+    """Send `request` `count` times on one connection; the (status, JSON body) of each response."""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    responses = []
+    for _ in range(count):
+        writer.write(request)
+        status = int((await reader.readline()).split()[1])
+        length = 0
+        while (line := await reader.readline()) != b'\r\n':
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+        responses.append((status, json.loads(await reader.readexactly(length))))
+    writer.close()
+    await writer.wait_closed()
+    return responses
+
+
+def _request(method, path, body=b''):
+    return f'{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body
+
+
+@pytest.mark.benchmark(group='api')
+@pytest.mark.parametrize('path', ['/expenses?from=2024-06-01&limit=20', '/summary'])
+def bench_api_reads(benchmark, api, path):
+    # API_CLIENTS keep-alive clients asking at the same time
+    loop, port = api
+    request = _request('GET', path)
+
+    async def clients():
+        return await asyncio.gather(*(_requests(port, request, API_REQUESTS) for _ in range(API_CLIENTS)))
+
+    responses = [response for client in benchmark(lambda: loop.run_until_complete(clients())) for response in client]
+    assert len(responses) == API_CLIENTS * API_REQUESTS
+    assert all(response == responses[0] for response in responses) and responses[0][0] == 200
+
+
+@pytest.mark.benchmark(group='api')
+def bench_api_add_batch(benchmark, api):
+    # One POST of a thousand expenses, added in one transaction
+    loop, port = api
+    body = json.dumps([{'date': row[0], 'payee': row[1], 'description': row[2], 'amount': str(from_minor(row[3])),
+                        'mode_of_payment': row[4], 'category': row[5]}
+                       for row in generate_rows(1000, seed=2)]).encode()
+    request = _request('POST', '/expenses', body)
+    [(status, added)] = benchmark(lambda: loop.run_until_complete(_requests(port, request, 1)))
+    assert status == 201 and len(added['ids']) == 1000
@@ -0,0 +1,109 @@
+"""Fixtures for the pytest-benchmark suite.
+
+    pytest benchmarks                              # 10k and 1M row ledgers
+    pytest benchmarks --ledger-sizes 10k,1m,10m
+    pytest-benchmark compare                       # against earlier runs
+
+Every run is saved as JSON under .benchmarks/ (see pytest.ini), so results
+can be compared between commits.  Ledgers are generated once and kept in
+benchmarks/.ledgers/, or in $EXPENSE_BENCH_CACHE.  Nothing needs a display:
+the benchmarks use expense_core directly and a stand-in for the Treeview.
+"""
+
+import os
+import shutil
+import sys
+
+import pytest
+
+BENCHMARKS = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCHMARKS)
+sys.path.insert(0, os.path.dirname(BENCHMARKS))
+
+from expense_core import ExpenseRepository, connect  # noqa: E402
+from ledger import cached_ledger, parse_size  # noqa: E402
+
+DEFAULT_SIZES = '10k,1m'
+
+
+def pytest_addoption(parser):
+    parser.addoption('--ledger-sizes', default=DEFAULT_SIZES,
+                     help=f'comma separated ledger sizes to benchmark, e.g. 10k,1m,10m (default: {DEFAULT_SIZES})')
+
+
+def pytest_generate_tests(metafunc):
+    if 'ledger_size' in metafunc.fixturenames:
+        sizes = metafunc.config.getoption('ledger_sizes').split(',')
+        metafunc.parametrize('ledger_size', sizes, scope='session')
+
+
+@pytest.fixture(scope='session')
+def ledger(ledger_size):
+    """Path of the read-only synthetic ledger for this size."""
+    directory = os.environ.get('EXPENSE_BENCH_CACHE', os.path.join(BENCHMARKS, '.ledgers'))
+    return cached_ledger(directory, parse_size(ledger_size))
+
+
+@pytest.fixture(scope='session')
+def connector(ledger):
+    connector = connect(ledger)
+    yield connector
+    connector.close()
+
+
+@pytest.fixture
+def expenses(connector):
+    return ExpenseRepository(connector)
+
+
+@pytest.fixture
+def ledger_copy(ledger, tmp_path):
+    """A private copy of the ledger for benchmarks that write."""
+    path = str(tmp_path / 'ledger.db')
+    shutil.copyfile(ledger, path)
+    return path
+
+
+class HeadlessTreeview:
+    """The part of ttk.Treeview that PagedTable uses, without Tk."""
+
+    def __init__(self):
+        self._children = []
+        self._values = {}
+
+    def config(self, **options):
+        pass
+
+    configure = config
+
+    def insert(self, parent, index, iid=None, values=()):
+        if index == 'end':
+            self._children.append(iid)
+        else:
+            self._children.insert(index, iid)
+        self._values[iid] = tuple(values)
+        return iid
+
+    def delete(self, *items):
+        removed = set(items)
+        self._children = [iid for iid in self._children if iid not in removed]
+        for iid in items:
+            del self._values[iid]
+
+    def get_children(self, item=''):
+        return tuple(self._children)
+
+    def item(self, iid, option=None, **options):
+        if 'values' in options:
+            self._values[iid] = tuple(options['values'])
+            return None
+        item = {'values': list(self._values[iid])}
+        return item[option] if option else item
+
+    def see(self, iid):
+        pass
+
+
+@pytest.fixture
+def treeview():
+    return HeadlessTreeview()
@@ -0,0 +1,145 @@
+"""Synthetic ExpenseTracker databases for the benchmarks.
+
+Ledgers look like several years of one household's spending: more entries on
+weekends and in later years, a few payees per category taking most of the
+transactions, log-normally distributed amounts with a different scale per
+category, and a small share of uncategorised rows like the ones main.py
+writes.  The same size and seed always give the same ledger.
+
+    python benchmarks/ledger.py 1m ledger-1m.db
+"""
+
+import argparse
+import datetime
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from expense_core import SCHEMA_VERSION, connect, migrate  # noqa: E402
+from expense_core.importer import import_rows  # noqa: E402
+
+SIZES = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+
+FIRST_DAY = datetime.date(2020, 1, 1)
+LAST_DAY = datetime.date(2024, 12, 31)
+
+# category: (share of entries, median amount, payees)
+CATEGORIES = {
+    'Food': (0.38, 350, ('supermarket', 'bakery', 'cafe', 'restaurant', 'food delivery', 'fruit stall')),
+    'Home': (0.17, 1200, ('electricity board', 'water board', 'landlord', 'hardware store', 'internet provider')),
+    'Work': (0.12, 600, ('metro', 'taxi', 'stationery shop', 'coworking space')),
+    'Fun': (0.14, 800, ('cinema', 'streaming service', 'bookshop', 'concert hall', 'game store')),
+    'Misc': (0.18, 500, ('mall', 'pharmacy', 'saloon', 'tailor', 'gift shop', 'charity')),
+    None: (0.01, 400, ('unknown',)),
+}
+
+MODES_OF_PAYMENT = {
+    'Cash': 0.2, 'Debit Card': 0.25, 'Credit Card': 0.2, 'Google Pay': 0.2, 'Paytm': 0.1, 'Wire Transfer': 0.05,
+}
+
+CHUNK_SIZE = 200_000
+
+
+def parse_size(value):
+    """'10k', '1m', '10m' or a plain number of rows."""
+    value = value.strip().lower()
+    return SIZES[value] if value in SIZES else int(value)
+
+
+def generate_rows(rows, seed=0):
+    """Yield `rows` synthetic expenses as (Date, Payee, Description, Amount, ModeOfPayment, Category, Currency)
+    tuples, with the amounts in paise."""
+    random = np.random.default_rng(seed)
+
+    days = np.arange((LAST_DAY - FIRST_DAY).days + 1)
+    day_names = [(FIRST_DAY + datetime.timedelta(days=int(day))).isoformat() for day in days]
+    # Spending grows ~10% a year and weekends are busier
+    weekday = np.array([(FIRST_DAY + datetime.timedelta(days=int(day))).weekday() for day in days])
+    day_weights = 1.1 ** (days / 365) * np.where(weekday >= 5, 1.6, 1.0)
+    day_weights /= day_weights.sum()
+
+    categories = list(CATEGORIES)
+    category_weights = np.array([CATEGORIES[category][0] for category in categories])
+    category_weights /= category_weights.sum()
+    medians = np.array([CATEGORIES[category][1] for category in categories], dtype=float)
+
+    # Payees of a category follow a Zipf-like distribution
+    payee_weights = []
+    for category in categories:
+        weights = 1 / np.arange(1, len(CATEGORIES[category][2]) + 1)
+        payee_weights.append(weights / weights.sum())
+
+    modes = list(MODES_OF_PAYMENT)
+    mode_weights = np.array(list(MODES_OF_PAYMENT.values()))
+    mode_weights /= mode_weights.sum()
+
+    for start in range(0, rows, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, rows - start)
+        chunk_days = random.choice(len(days), size=size, p=day_weights)
+        chunk_categories = random.choice(len(categories), size=size, p=category_weights)
+        amounts = np.round(medians[chunk_categories] * random.lognormal(0, 0.8, size=size) * 100).astype(np.int64)
+        chunk_modes = random.choice(len(modes), size=size, p=mode_weights)
+        # Uniform draws turned into a payee per row through each category's weights
+        draws = random.random(size)
+        chunk_payees = np.empty(size, dtype=object)
+        for index, category in enumerate(categories):
+            mask = chunk_categories == index
+            picks = np.searchsorted(np.cumsum(payee_weights[index]), draws[mask], side='right')
+            chunk_payees[mask] = np.array(CATEGORIES[category][2], dtype=object)[
+                np.minimum(picks, len(CATEGORIES[category][2]) - 1)]
+
+        for day, payee, amount, mode, category in zip(chunk_days.tolist(), chunk_payees.tolist(), amounts.tolist(),
+                                                      chunk_modes.tolist(), chunk_categories.tolist()):
+            yield day_names[day], payee, f'{payee} purchase', amount, modes[mode], categories[category], 'INR'
+
+
+def generate_ledger(path, rows, seed=0):
+    """Create a database at `path` holding `rows` synthetic expenses."""
+    connector = connect(path)
+    try:
+        migrate(connector)
+        import_rows(connector, generate_rows(rows, seed), rebuild_indexes=True)
+        connector.execute('PRAGMA analysis_limit = 1000')
+        connector.execute('ANALYZE')
+        connector.commit()
+        # Leave a single self-contained file behind
+        connector.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        connector.close()
+
+
+def cached_ledger(directory, rows, seed=0):
+    """Path of a ledger of `rows` expenses in `directory`, generating it the first time."""
+    path = os.path.join(directory, f'ledger-{rows}-seed{seed}-v{SCHEMA_VERSION}.db')
+    if not os.path.exists(path):
+        os.makedirs(directory, exist_ok=True)
+        partial = path + '.partial'
+        for leftover in (partial, partial + '-wal', partial + '-shm'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        generate_ledger(partial, rows, seed)
+        os.replace(partial, path)
+    return path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate a synthetic expense database.')
+    parser.add_argument('size', type=parse_size, help='number of rows, or 10k, 1m, 10m')
+    parser.add_argument('database', help='database file to create')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.database):
+        parser.error(f'{args.database} already exists')
+
+    start = datetime.datetime.now()
+    generate_ledger(args.database, args.size, args.seed)
+    seconds = (datetime.datetime.now() - start).total_seconds()
+    print(f'Generated {args.size:,} expenses in {seconds:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
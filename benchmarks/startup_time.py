@@ -0,0 +1,112 @@
+"""Startup time of the GUI scripts with and without the lazy analytics imports.
+
+Each run starts a fresh interpreter in an empty temporary directory (so the
+real database is never touched), runs a script until it reaches mainloop()
+and reports the elapsed wall time and peak RSS.  The "eager" runs import
+pandas, scikit-learn, matplotlib and numpy up front, which is what every
+launch paid before those imports were deferred.
+
+Needs a display for Tk; without one only the cost of the eager imports is
+measured, which is the part of startup the lazy imports remove.
+
+    python benchmarks/startup_time.py [--runs 5]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCRIPTS = ('main_charts.py', 'ai based.py', 'import datetime.py')
+
+EAGER_IMPORTS = 'import numpy, pandas, matplotlib.pyplot, sklearn.linear_model'
+
+LAZY_IMPORTS = '''
+sys.path.insert(0, {repo!r})
+from lazy_imports import lazy_import
+modules = [lazy_import(name) for name in ('numpy', 'pandas', 'matplotlib.pyplot', 'sklearn.linear_model')]
+'''
+
+# Runs in the child interpreter: stop the script as soon as it would start
+# handling events, and report how long getting there took
+RUN_UNTIL_MAINLOOP = '''
+import json, resource, runpy, sys, time, tkinter
+start = time.perf_counter()
+sys.path.insert(0, {repo!r})
+{eager}
+
+def report(*args, **kwargs):
+    print(json.dumps({{'seconds': time.perf_counter() - start,
+                      'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+    sys.stdout.flush()
+    import os
+    os._exit(0)
+
+tkinter.Misc.mainloop = report
+runpy.run_path({script!r}, run_name='__main__')
+'''
+
+IMPORT_ONLY = '''
+import json, resource, sys, time
+start = time.perf_counter()
+{imports}
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}}))
+'''
+
+
+def run(code, cwd):
+    result = subprocess.run([sys.executable, '-c', code], cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr.strip() else 'failed')
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(code, runs, cwd):
+    samples = [run(code, cwd) for _ in range(runs)]
+    return {
+        'seconds': statistics.median(sample['seconds'] for sample in samples),
+        'max_rss_mb': statistics.median(sample['max_rss_mb'] for sample in samples),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5, help='runs per measurement (the median is reported)')
+    parser.add_argument('--json', help='also write the results to this file')
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as cwd:
+        try:
+            for script in SCRIPTS:
+                path = os.path.join(REPO, script)
+                for mode, eager in (('eager', EAGER_IMPORTS), ('lazy', '')):
+                    code = RUN_UNTIL_MAINLOOP.format(repo=REPO, script=path, eager=eager)
+                    results[f'{script} ({mode})'] = measure(code, args.runs, cwd)
+        except RuntimeError as error:
+            if 'display' not in str(error).lower():
+                raise
+            print(f'No display available ({error}); measuring the deferred imports only\n')
+            results = {
+                'analytics imports (eager)': measure(IMPORT_ONLY.format(imports=EAGER_IMPORTS), args.runs, cwd),
+                'analytics imports (lazy)': measure(IMPORT_ONLY.format(imports=LAZY_IMPORTS.format(repo=REPO)), args.runs, cwd),
+            }
+
+    width = max(len(name) for name in results)
+    print(f'{"":{width}}  {"startup":>9}  {"peak RSS":>9}')
+    for name, result in results.items():
+        print(f'{name:{width}}  {result["seconds"]:8.3f}s  {result["max_rss_mb"]:6.1f} MB')
+
+    if args.json:
+        with open(args.json, 'w') as stream:
+            json.dump(results, stream, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""The monthly spending chart, drawn off the Tk thread and cached.
+
+Drawing the grouped bar chart takes matplotlib a good fraction of a second,
+and `plt.show()` used to block the window while it did.  ChartPanel instead
+renders the chart on the DBWorker thread with the Agg backend (matplotlib's
+object-oriented API, which unlike pyplot is safe away from the main thread)
+and only hands a finished PNG to Tk, which shows it in its own window.
+
+Rendered charts are cached by the data version of the ledger and of the
+exchange rates (see `ExpenseRepository.data_version`), so reopening the chart
+while nothing has changed skips both the query and the drawing.
+"""
+
+import base64
+import io
+from collections import OrderedDict
+from tkinter import BOTH, Button, Label, PhotoImage, Toplevel
+
+from expense_core import ExpenseRepository
+from lazy_imports import lazy_import
+
+fx = lazy_import('expense_core.fx')
+np = lazy_import('numpy')
+backend_agg = lazy_import('matplotlib.backends.backend_agg')
+collections = lazy_import('matplotlib.collections')
+figure = lazy_import('matplotlib.figure')
+
+# What the scripts warm up once the window is open
+CHART_MODULES = (fx, backend_agg, collections, figure)
+
+# Rendered charts kept in memory; the least recently shown is dropped first
+CACHE_SIZE = 8
+
+# Bar series drawn before the smallest categories are added up as 'Other'
+MAX_CATEGORIES = 10
+
+# Month labels on the x axis at most
+MAX_TICKS = 24
+
+
+def _bars(axes, left, heights, width, **options):
+    # All bars of a series as one PolyCollection: Axes.bar makes an artist per
+    # bar, which takes seconds to draw for a few thousand months
+    bottom = np.zeros_like(heights)
+    right = left + width
+    corners = np.stack([np.stack(corner, axis=-1) for corner in
+                        ((left, bottom), (left, heights), (right, heights), (right, bottom))], axis=1)
+    axes.add_collection(collections.PolyCollection(corners, **options))
+
+
+def render_chart(pivot, size=(10, 6), dpi=100):
+    """PNG of the grouped bar chart of a MonthlyPivot, one group of bars per month."""
+    pivot = pivot.top_categories(MAX_CATEGORIES)
+    amounts = pivot.amounts()
+    x = np.arange(len(pivot.months))  # The label locations
+    width = 0.8 / max(len(pivot.categories), 1)  # Width of the bars
+
+    chart = figure.Figure(figsize=size, dpi=dpi)
+    backend_agg.FigureCanvasAgg(chart)
+    axes = chart.subplots()
+
+    # One bar series per category, each shifted by the width of a bar
+    for j, category in enumerate(pivot.categories):
+        _bars(axes, x + j * width - width / 2, amounts[:, j], width, facecolor=f'C{j % 10}',
+              label=category or 'Uncategorised')
+    axes.autoscale_view()
+
+    # Label at most MAX_TICKS months so that long histories stay readable
+    step = -(-len(x) // MAX_TICKS) or 1
+    axes.set_xticks(x[::step] + 0.4 - width / 2, [month or 'Undated' for month in pivot.months[::step]],
+                    rotation=45, ha='right')
+    axes.set_xlabel('Months')
+    axes.set_ylabel(f'Amount ({pivot.currency})')
+    axes.set_title('Monthly Expenses by Category')
+    axes.legend(title='Categories', loc='upper left', bbox_to_anchor=(1, 1))
+    chart.tight_layout()  # Adjust layout to prevent clipping of tick-labels
+
+    image = io.BytesIO()
+    chart.savefig(image, format='png')
+    return image.getvalue()
+
+
+class ChartPanel:
+    """A window with the chart of the monthly totals in `currency`; `show` opens it or brings it up to date."""
+
+    def __init__(self, root, db_worker, currency, on_error=None, size=(10, 6), dpi=100):
+        self.root = root
+        self.db_worker = db_worker
+        self.currency = currency
+        self.on_error = on_error
+        self.size = size
+        self.dpi = dpi
+
+        self.window = None
+        self._label = None
+        self._image = None
+        self._job = None
+        # PNGs by (data version, rates version, currency, size, dpi).  Only the
+        # DBWorker thread touches it, so it needs no lock.
+        self._cache = OrderedDict()
+
+    # DBWorker thread
+    def _chart(self, connection):
+        key = (ExpenseRepository(connection).data_version(), fx.rates_version(connection), self.currency, self.size,
+               self.dpi)
+        image = self._cache.get(key)
+        if image is not None:
+            self._cache.move_to_end(key)
+            return image
+
+        pivot = fx.converted_monthly_pivot(connection, self.currency)
+        image = self._cache[key] = render_chart(pivot, self.size, self.dpi)
+        while len(self._cache) > CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return image
+
+    # Tk thread
+    def show(self):
+        if self.window is None:
+            self.window = Toplevel(self.root)
+            self.window.title('Monthly Expenses by Category')
+            self._label = Label(self.window, text='Drawing the chart...', font=('Helvetica', 14))
+            self._label.pack(fill=BOTH, expand=True, padx=10, pady=10)
+            Button(self.window, text='Refresh', command=self.show).pack(pady=(0, 10))
+            self.window.protocol('WM_DELETE_WINDOW', self.close)
+        else:
+            self.window.lift()
+
+        # A newer request replaces one that has not finished yet
+        self.db_worker.cancel(self._job)
+        self._job = self.db_worker.submit(self._chart, on_done=self._display, on_error=self._failed)
+
+    def _display(self, image):
+        if self.window is None:
+            return
+        # Tk reads PNG data given as base64
+        self._image = PhotoImage(master=self.window, data=base64.b64encode(image))
+        self._label.configure(image=self._image, text='')
+
+    def _failed(self, error):
+        self.close()
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def close(self):
+        self.db_worker.cancel(self._job)
+        self._job = None
+        if self.window is not None:
+            self.window.destroy()
+        self.window = self._label = self._image = None
@@ -0,0 +1,231 @@
+"""Run slow SQLite work off the Tk thread.
+
+DBWorker owns one connection on a background thread and executes jobs from a
+queue.  Finished results are handed back to the GUI by polling a result queue
+with `root.after`, so callbacks always run on the Tk thread and can touch
+widgets.  A running query can be cancelled, which interrupts SQLite; long
+jobs that report progress also stop at their next progress report.
+
+`follow` hands the result of work done elsewhere, a WriteQueue write for
+instance, back to the Tk thread the same way, so the window never waits for
+it.
+
+An `observer` (see diagnostics_panel.py) is told when a job is submitted and
+when its callbacks run, so the time from a click to its results being shown
+can be measured.
+"""
+
+import queue
+import sqlite3
+import sys
+import threading
+
+from expense_core import connect
+
+# How often (ms) the Tk thread checks for finished jobs
+POLL_INTERVAL = 50
+
+
+class JobCancelled(Exception):
+    """Raised by the progress callback of a job that has been cancelled."""
+
+
+class Job:
+    def __init__(self, work, on_done, on_error, on_progress, interruptible):
+        self.work = work
+        self.on_done = on_done
+        self.on_error = on_error
+        self.on_progress = on_progress
+        self.interruptible = interruptible
+        self.cancelled = False
+        self.finished = False
+
+
+class DBWorker:
+    def __init__(self, root, database=None, poll_interval=POLL_INTERVAL):
+        self.database = database
+        self.root = root
+        self.poll_interval = poll_interval
+
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._progress = queue.Queue()
+        self._current = None
+        self._connection = None
+        self._ready = threading.Event()
+        # What connecting on the worker thread raised, if it failed
+        self._connect_error = None
+
+        # Gets job_submitted(job), job_finishing(job) and job_finished(job)
+        self.observer = None
+
+        self._thread = threading.Thread(target=self._run, name='DBWorker', daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._connect_error is not None:
+            raise self._connect_error
+
+        self._after_id = self.root.after(self.poll_interval, self._poll)
+
+    # Worker thread
+    def _run(self):
+        try:
+            self._connection = connect(self.database)
+        except Exception as error:
+            self._connect_error = error
+            return
+        finally:
+            self._ready.set()
+
+        while True:
+            job = self._requests.get()
+            if job is None:
+                break
+            if job.cancelled:
+                # Still passed back, so that it counts as finished
+                self._results.put((job, None, None))
+                continue
+
+            self._current = job
+            try:
+                if job.on_progress is None:
+                    result = job.work(self._connection)
+                else:
+                    result = job.work(self._connection, lambda value, job=job: self._report(job, value))
+            except Exception:
+                self._results.put((job, None, sys.exc_info()))
+            else:
+                self._results.put((job, result, None))
+            finally:
+                self._current = None
+
+        self._connection.close()
+
+    def _report(self, job, value):
+        if job.cancelled:
+            raise JobCancelled()
+        self._progress.put((job, value))
+
+    # Tk thread
+    def _poll(self):
+        # Reschedule first so a failing callback cannot stop the polling
+        self._after_id = self.root.after(self.poll_interval, self._poll)
+
+        while True:
+            try:
+                job, value = self._progress.get_nowait()
+            except queue.Empty:
+                break
+            if not job.cancelled and not job.finished:
+                job.on_progress(value)
+
+        while True:
+            try:
+                job, result, error = self._results.get_nowait()
+            except queue.Empty:
+                break
+
+            job.finished = True
+            if self.observer is None:
+                self._finish(job, result, error)
+                continue
+            self.observer.job_finishing(job)
+            try:
+                self._finish(job, result, error)
+            finally:
+                self.observer.job_finished(job)
+
+    def _finish(self, job, result, error):
+        if job.cancelled:
+            return
+
+        if error is None:
+            if job.on_done is not None:
+                job.on_done(result)
+        elif isinstance(error[1], JobCancelled) or (isinstance(error[1], sqlite3.OperationalError) and str(error[1]) == 'interrupted'):
+            # Cancelled while it was still running
+            return
+        elif job.on_error is not None:
+            job.on_error(error[1])
+        else:
+            self.root.report_callback_exception(*error)
+
+    def submit(self, work, on_done=None, on_error=None, on_progress=None, interruptible=True):
+        """Queue `work(connection)` on the worker; `on_done(result)` runs on the Tk thread.
+
+        With `on_progress` the job is called as `work(connection, progress)`
+        and every `progress(value)` is passed on to `on_progress(value)`.  Jobs
+        that must not be stopped halfway through a statement (e.g. because they
+        clean up after themselves) pass `interruptible=False`; cancelling those
+        only takes effect at their next progress report.
+        """
+        job = Job(work, on_done, on_error, on_progress, interruptible)
+        if self.observer is not None:
+            self.observer.job_submitted(job)
+        self._requests.put(job)
+        return job
+
+    def follow(self, future, on_done=None, on_error=None):
+        """Pass the result of a concurrent.futures.Future to `on_done(result)`, or its exception to
+        `on_error(exception)`, on the Tk thread once it is resolved.
+
+        The worker thread is not involved, and cancel_all leaves these jobs alone.
+        """
+        job = Job(None, on_done, on_error, None, False)
+        if self.observer is not None:
+            self.observer.job_submitted(job)
+
+        def resolved(future):
+            # Runs on whichever thread resolved the future
+            if future.cancelled():
+                job.cancelled = True
+                self._results.put((job, None, None))
+                return
+            error = future.exception()
+            if error is None:
+                self._results.put((job, future.result(), None))
+            else:
+                self._results.put((job, None, (type(error), error, error.__traceback__)))
+
+        future.add_done_callback(resolved)
+        return job
+
+    def query(self, sql, params=(), on_done=None, on_error=None):
+        """Shortcut for a single SELECT whose rows are passed to `on_done`."""
+        return self.submit(lambda connection: connection.execute(sql, params).fetchall(), on_done, on_error)
+
+    def cancel(self, job):
+        """Drop a queued job, or interrupt it if it is running right now."""
+        if job is None or job.finished:
+            return
+
+        job.cancelled = True
+        if self._current is job and job.interruptible:
+            self._connection.interrupt()
+
+    def cancel_all(self):
+        current = self._current
+        while True:
+            try:
+                job = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                # Keep a pending shutdown request
+                self._requests.put(None)
+                break
+            job.cancelled = True
+            self._results.put((job, None, None))
+
+        if current is not None:
+            self.cancel(current)
+
+    def close(self):
+        self.cancel_all()
+        self._requests.put(None)
+        self._thread.join()
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            # The Tk interpreter is already gone after mainloop returned
+            pass
@@ -0,0 +1,191 @@
+"""How long the window takes to answer, measured while it is used.
+
+With `diagnostics = on` in expense_tracker.ini, Diagnostics times the button
+handlers wrapped with `timed` from the click until the window has been
+painted again: until the handler has returned, every DBWorker job it
+submitted (and the jobs those submitted) has run its callback, and Tk has
+gone idle.  A heartbeat on `root.after` notices when the mainloop did not get
+to run for more than STALL seconds, and charges the stall to the action that
+was running.  Both go into `expense_core.diagnostics.recorder`, next to the
+timings of the SQL statements, and F12 opens a window with their percentiles.
+
+Actions that end in a message box include the time it was open.  With
+diagnostics off, `timed` hands back the handlers unchanged and nothing runs.
+"""
+
+import time
+from tkinter import BOTH, BOTTOM, E, LEFT, RIGHT, VERTICAL, W, Y, Button, Frame, Scrollbar, Toplevel
+import tkinter.filedialog as fd
+import tkinter.ttk as ttk
+
+from expense_core import load_settings
+from expense_core.diagnostics import PERCENTILES, diagnostics_enabled, recorder, to_json, to_prometheus
+
+# How often (ms) the heartbeat checks that the mainloop is running
+HEARTBEAT = 20
+
+# Seconds the heartbeat may be late before it counts as a stall
+STALL = 0.05
+
+COLUMNS = ('Kind', 'Name', 'Count') + tuple(f'p{percent}' for percent in PERCENTILES) + ('Max', 'Rows')
+
+
+class _Action:
+    __slots__ = ('name', 'started', 'running', 'jobs')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.running = True
+        # DBWorker jobs submitted for it that have not finished
+        self.jobs = 0
+
+
+class Diagnostics:
+    def __init__(self, root, settings=None):
+        self.root = root
+        settings = settings if settings is not None else load_settings()
+        self.enabled = diagnostics_enabled(settings)
+
+        self.window = None
+        self._table = None
+        # The action whose code is running now, and those not painted yet,
+        # oldest first
+        self._current = None
+        self._actions = []
+        # Action of every DBWorker job submitted while one was running
+        self._jobs = {}
+        self._outer = []
+
+        if self.enabled:
+            self._due = time.perf_counter() + HEARTBEAT / 1000
+            self.root.after(HEARTBEAT, self._heartbeat)
+            self.root.bind('<F12>', lambda event: self.show())
+
+    def timed(self, *handlers):
+        """The handlers, wrapped to record their time from click to paint under their names."""
+        if not self.enabled:
+            return handlers if len(handlers) > 1 else handlers[0]
+        wrapped = tuple(self._wrap(handler) for handler in handlers)
+        return wrapped if len(wrapped) > 1 else wrapped[0]
+
+    def watch(self, *workers):
+        """Follow the jobs of DBWorkers, so that actions end when their results are shown."""
+        if self.enabled:
+            for worker in workers:
+                worker.observer = self
+
+    def _wrap(self, handler):
+        def timed_handler(*args, **kwargs):
+            if self._current is not None:
+                # Called by another action, e.g. refreshing the list after an
+                # edit: part of that one
+                return handler(*args, **kwargs)
+            action = self._current = _Action(handler.__name__)
+            self._actions.append(action)
+            try:
+                return handler(*args, **kwargs)
+            finally:
+                self._current = None
+                action.running = False
+                self._check(action)
+
+        timed_handler.__name__ = handler.__name__
+        timed_handler.__doc__ = handler.__doc__
+        return timed_handler
+
+    def _check(self, action):
+        if not action.running and action.jobs == 0:
+            # Idle callbacks run after the redraws Tk has already queued
+            self.root.after_idle(self._painted, action)
+
+    def _painted(self, action):
+        recorder.record('ui', action.name, time.perf_counter() - action.started)
+        if action in self._actions:
+            self._actions.remove(action)
+
+    # DBWorker observer
+    def job_submitted(self, job):
+        if self._current is not None:
+            self._current.jobs += 1
+            self._jobs[job] = self._current
+
+    def job_finishing(self, job):
+        # Jobs submitted by its callbacks belong to the same action; a modal
+        # dialog can run callbacks while another action is current
+        self._outer.append(self._current)
+        self._current = self._jobs.get(job)
+
+    def job_finished(self, job):
+        self._current = self._outer.pop()
+        action = self._jobs.pop(job, None)
+        if action is not None:
+            action.jobs -= 1
+            self._check(action)
+
+    # Stalls
+    def _heartbeat(self):
+        now = time.perf_counter()
+        late = now - self._due
+        if late > STALL:
+            recorder.record('stall', self._actions[-1].name if self._actions else 'mainloop', late)
+        self._due = now + HEARTBEAT / 1000
+        self.root.after(HEARTBEAT, self._heartbeat)
+
+    # Window
+    def show(self):
+        if self.window is None:
+            self.window = Toplevel(self.root)
+            self.window.title('Diagnostics')
+            self.window.geometry('900x450')
+
+            buttons = Frame(self.window)
+            buttons.pack(side=BOTTOM, pady=5)
+            for text, command in (('Refresh', self.refresh), ('Reset', self.reset),
+                                  ('Export JSON...', lambda: self.export(to_json, '.json')),
+                                  ('Export Prometheus...', lambda: self.export(to_prometheus, '.prom'))):
+                Button(buttons, text=text, command=command).pack(side=LEFT, padx=5)
+
+            frame = Frame(self.window)
+            frame.pack(fill=BOTH, expand=True, padx=5, pady=5)
+            self._table = ttk.Treeview(frame, columns=COLUMNS, show='headings')
+            for column in COLUMNS:
+                timed = column.startswith('p') or column == 'Max'
+                self._table.heading(column, text=f'{column} (ms)' if timed else column)
+                self._table.column(column, width=70, anchor=E, stretch=False)
+            self._table.column('Kind', anchor=W)
+            self._table.column('Name', width=400, anchor=W, stretch=True)
+            scroller = Scrollbar(frame, orient=VERTICAL, command=self._table.yview)
+            self._table.config(yscrollcommand=scroller.set)
+            scroller.pack(side=RIGHT, fill=Y)
+            self._table.pack(fill=BOTH, expand=True)
+            self.window.protocol('WM_DELETE_WINDOW', self.close)
+        else:
+            self.window.lift()
+        self.refresh()
+
+    def refresh(self):
+        if self._table is None:
+            return
+        self._table.delete(*self._table.get_children())
+        # Slowest in total first
+        for row in recorder.summary():
+            milliseconds = [f'{row[f"p{percent}"] * 1000:.2f}' for percent in PERCENTILES]
+            self._table.insert('', 'end', values=(row['kind'], row['name'], row['count'], *milliseconds,
+                                                  f'{row["max"] * 1000:.2f}', row.get('rows', '')))
+
+    def reset(self):
+        recorder.reset()
+        self.refresh()
+
+    def export(self, exporter, extension):
+        path = fd.asksaveasfilename(parent=self.window, title='Export diagnostics', defaultextension=extension,
+                                    filetypes=[('Diagnostics', f'*{extension}'), ('All files', '*.*')])
+        if path:
+            with open(path, 'w', encoding='utf-8') as file:
+                file.write(exporter())
+
+    def close(self):
+        if self.window is not None:
+            self.window.destroy()
+        self.window = self._table = None
@@ -0,0 +1,57 @@
+"""The expense tracker without its GUI.
+
+Everything the Tk scripts do to the database lives here, so it can also be
+scripted, run from the `expense-cli` command or benchmarked headless:
+
+    from expense_core import Expense, ExpenseRepository, connect, migrate
+
+    connector = connect('expenses.db')
+    migrate(connector)
+    expenses = ExpenseRepository(connector)
+    expenses.add(Expense(datetime.date.today(), 'Cafe', 'Lunch', '12.50', 'Card', 'Food'))
+
+Amounts are stored as integer minor units (paise, cents) and handed out as
+Decimals; see `expense_core.money`.
+
+`expense_core.forecast`, `expense_core.fx` and `expense_core.pivot` are not
+imported here because they need NumPy.
+"""
+
+from .archive import ArchivedExpenseError, archive_year
+from .database import connect, load_settings
+from .exporter import export_file
+from .importer import StatementError, import_file
+from .models import COLUMNS, Expense, display_row
+from .money import DEFAULT_CURRENCY, currency_code, format_amount, from_minor, to_decimal, to_minor
+from .repository import ExpenseFilter, ExpenseRepository, RangeTotal, expense_filter, partitioned_query, select_expenses
+from .schema import MONTHLY_TOTALS, SCHEMA_VERSION, migrate
+from .write_queue import WriteQueue
+
+__all__ = [
+    'ArchivedExpenseError',
+    'COLUMNS',
+    'DEFAULT_CURRENCY',
+    'Expense',
+    'ExpenseFilter',
+    'ExpenseRepository',
+    'MONTHLY_TOTALS',
+    'RangeTotal',
+    'SCHEMA_VERSION',
+    'StatementError',
+    'WriteQueue',
+    'archive_year',
+    'connect',
+    'currency_code',
+    'display_row',
+    'expense_filter',
+    'export_file',
+    'format_amount',
+    'from_minor',
+    'import_file',
+    'load_settings',
+    'migrate',
+    'partitioned_query',
+    'select_expenses',
+    'to_decimal',
+    'to_minor',
+]
@@ -0,0 +1,314 @@
+"""Finished years in read-only archive databases.
+
+ExpenseTracker only ever grows, and backups, VACUUM and full scans grow with
+it.  `archive_year` moves the expenses of a finished year into an archive
+database next to the main file ("Expense Tracker.2023.db"), with the same
+table, indexes and search index, then compacts the archive and makes it
+read-only.  The Archives table of the main database lists the archives and
+ArchivedTotals and ArchivedDailyTotals keep their monthly and daily totals,
+so MonthlyCategoryTotals and the daily totals, and with them the summary, the
+chart, the forecast and date range totals, still cover every year without
+opening an archive.
+
+Listings read the archives through ATTACH: `partitions` attaches, read-only,
+the archives of the years a date range touches and returns the schemas to
+read, and `repository.partitioned_query` puts one SELECT per schema together
+with UNION ALL.  SQLite merges the parts in ORDER BY order, so a page still
+costs one index seek per partition.  SQLite attaches at most ten databases at
+a time; archives a query does not need are detached to make room.
+
+Command line usage:
+
+    expense-cli archive 2023
+    expense-cli archive --closed --vacuum
+    expense-cli archive --list
+"""
+
+import argparse
+import datetime
+import os
+import pathlib
+import sqlite3
+import stat
+
+from .models import COLUMNS
+from .schema import (DAILY_TOTALS, DATA_VERSION, EXPENSE_COLUMNS, SEARCH_INDEX, TOTALS_TRIGGERS, create_indexes,
+                     create_triggers)
+
+ARCHIVE_SCHEMA = 'archive_{year}'
+
+# Schema the archive being written is attached as
+NEW_ARCHIVE = 'new_archive'
+
+# SQLite's default SQLITE_LIMIT_ATTACHED, for Pythons without Connection.getlimit
+DEFAULT_ATTACH_LIMIT = 10
+
+ARCHIVE_TOTALS = """
+    INSERT INTO ArchivedTotals (Month, Category, Currency, Total, Entries)
+    SELECT IFNULL(strftime('%Y-%m', Date), ''), IFNULL(Category, ''), Currency, IFNULL(SUM(Amount), 0), COUNT(*)
+    FROM ExpenseTracker WHERE Date >= ? AND Date < ? GROUP BY strftime('%Y-%m', Date), Category, Currency
+    ON CONFLICT (Month, Category, Currency) DO UPDATE SET Total = Total + excluded.Total, Entries = Entries + excluded.Entries
+"""
+
+ARCHIVE_DAILY_TOTALS = (
+    f"INSERT INTO ArchivedDailyTotals (Day, Category, Currency, Total, Entries) {DAILY_TOTALS.format(schema='main')}"
+)
+
+
+class ArchivedExpenseError(ValueError):
+    pass
+
+
+def archive_path(database, year):
+    """'Expense Tracker.2023.db' for 'Expense Tracker.db'."""
+    stem, extension = os.path.splitext(database)
+    return f'{stem}.{year}{extension or ".db"}'
+
+
+def _main_database(connector):
+    path = connector.execute('PRAGMA database_list').fetchone()[2]
+    if not path:
+        raise ValueError('Only a database stored in a file can have archives')
+    return path
+
+
+def archives(connector):
+    """{year: path} of the archived years, oldest first."""
+    if not connector.execute("SELECT 1 FROM sqlite_master WHERE name = 'Archives'").fetchone():
+        return {}
+    rows = connector.execute('SELECT Year, Path FROM Archives ORDER BY Year').fetchall()
+    if not rows:
+        return {}
+    # Paths are stored relative to the main database, so the files can move together
+    directory = os.path.dirname(_main_database(connector))
+    return {year: os.path.join(directory, path) for year, path in rows}
+
+
+# Reading archives
+def attach_limit(connector):
+    getlimit = getattr(connector, 'getlimit', None)
+    return getlimit(sqlite3.SQLITE_LIMIT_ATTACHED) if getlimit is not None else DEFAULT_ATTACH_LIMIT
+
+
+def attach(connector, years):
+    """Attach the archives of `years` read-only, unless they already are, and return their schema names.
+
+    Must not be called inside a transaction, as SQLite cannot ATTACH there.
+    """
+    schemas = [ARCHIVE_SCHEMA.format(year=year) for year in years]
+    attached = [row[1] for row in connector.execute('PRAGMA database_list') if row[1] not in ('main', 'temp')]
+    missing = [(year, schema) for year, schema in zip(years, schemas) if schema not in attached]
+    if not missing:
+        return schemas
+
+    limit = attach_limit(connector)
+    if len(schemas) > limit:
+        raise ValueError(f'{len(schemas)} archived years cannot be read at once (SQLite attaches at most {limit} '
+                         f'databases); choose a shorter date range')
+    # Make room by detaching archives this query does not read
+    unused = [schema for schema in attached if schema.startswith('archive_') and schema not in schemas]
+    while unused and len(attached) + len(missing) > limit:
+        schema = unused.pop()
+        connector.execute(f'DETACH DATABASE {schema}')
+        attached.remove(schema)
+
+    paths = archives(connector)
+    for year, schema in missing:
+        uri = f'{pathlib.Path(paths[year]).resolve().as_uri()}?mode=ro'
+        connector.execute(f'ATTACH DATABASE ? AS {schema}', (uri,))
+    return schemas
+
+
+def _main_has_dates(connector, start, end):
+    # One probe of the Date index.  A range that lies entirely in archived
+    # years usually has nothing left in main, and reading main anyway would
+    # make a page in ID order scan all of it for rows that are not there.
+    conditions, params = [], []
+    if start is not None:
+        conditions.append('Date >= ?')
+        params.append(str(start))
+    if end is not None:
+        conditions.append('Date <= ?')
+        params.append(str(end))
+    sql = f'SELECT 1 FROM main.ExpenseTracker WHERE {" AND ".join(conditions)} LIMIT 1'
+    return connector.execute(sql, params).fetchone() is not None
+
+
+def partitions(connector, start=None, end=None):
+    """Schemas holding the expenses dated `start` to `end`: main and the archives of those years."""
+    first = int(str(start)[:4]) if start is not None else None
+    last = int(str(end)[:4]) if end is not None else None
+    years = [year for year in archives(connector)
+             if (first is None or year >= first) and (last is None or year <= last)]
+    if not years:
+        return ['main']
+    schemas = attach(connector, years)
+    if (start is None and end is None) or _main_has_dates(connector, start, end):
+        schemas.insert(0, 'main')
+    return schemas
+
+
+def archived_year(connector, expense_id):
+    """The year whose archive holds the expense `expense_id`, or None."""
+    for year in archives(connector):
+        schema = attach(connector, [year])[0]
+        if connector.execute(f'SELECT 1 FROM {schema}.ExpenseTracker WHERE ID = ?', (expense_id,)).fetchone():
+            return year
+    return None
+
+
+# Writing archives
+def _remove(path):
+    # Archives are read-only files, which Windows will not delete
+    try:
+        os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _copy_year(connector, path, start, end):
+    # Copies the expenses of the year into a new database at `path` and returns
+    # how many there were and the DATA_VERSION of the ledger they were read at
+    connector.execute(f'ATTACH DATABASE ? AS {NEW_ARCHIVE}', (path,))
+    try:
+        connector.execute('BEGIN')
+        version = connector.execute(DATA_VERSION).fetchone()
+        connector.execute(f'CREATE TABLE {NEW_ARCHIVE}.ExpenseTracker ({EXPENSE_COLUMNS})')
+        columns = ', '.join(COLUMNS)
+        copied = connector.execute(
+            f'INSERT INTO {NEW_ARCHIVE}.ExpenseTracker ({columns}) '
+            f'SELECT {columns} FROM main.ExpenseTracker WHERE Date >= ? AND Date < ? ORDER BY ID', (start, end)
+        ).rowcount
+        create_indexes(connector, NEW_ARCHIVE)
+        connector.execute(f'CREATE VIRTUAL TABLE {NEW_ARCHIVE}.ExpenseSearch USING {SEARCH_INDEX}')
+        connector.execute(f"INSERT INTO {NEW_ARCHIVE}.ExpenseSearch (ExpenseSearch) VALUES ('rebuild')")
+        connector.commit()
+    except BaseException:
+        connector.rollback()
+        raise
+    finally:
+        connector.execute(f'DETACH DATABASE {NEW_ARCHIVE}')
+    return copied, version
+
+
+def _compact(path):
+    archive = sqlite3.connect(path)
+    try:
+        archive.execute("INSERT INTO ExpenseSearch (ExpenseSearch) VALUES ('optimize')")
+        archive.execute('ANALYZE')
+        archive.commit()
+        archive.execute('VACUUM')
+    finally:
+        archive.close()
+    os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+
+
+def archive_year(connector, year, vacuum=False):
+    """Move the expenses dated in `year` into its archive database and return how many there were.
+
+    The archive is written and compacted before anything is deleted from the
+    ledger, and the deletion is rolled back if the ledger changed in between.
+    With `vacuum` the main database is compacted afterwards too.
+    """
+    year = int(year)
+    if year >= datetime.date.today().year:
+        raise ValueError(f'{year} is not over yet; only earlier years can be archived')
+    if year in archives(connector):
+        raise ValueError(f'{year} is already archived')
+
+    path = archive_path(_main_database(connector), year)
+    start, end = f'{year}-01-01', f'{year + 1}-01-01'
+
+    # A file of an archive run that did not finish is not in Archives, so
+    # nothing reads it; it is written again from scratch
+    _remove(path)
+    connector.commit()
+    try:
+        copied, version = _copy_year(connector, path, start, end)
+        if not copied:
+            raise ValueError(f'There are no expenses dated {year}')
+        _compact(path)
+
+        connector.execute('BEGIN IMMEDIATE')
+        try:
+            if connector.execute(DATA_VERSION).fetchone() != version:
+                raise RuntimeError(f'The expenses changed while {year} was being archived; try again')
+            # The totals of the year move to ArchivedTotals and ArchivedDailyTotals, so
+            # MonthlyCategoryTotals and the daily totals stay as they are
+            connector.execute(ARCHIVE_TOTALS, (start, end))
+            connector.execute(ARCHIVE_DAILY_TOTALS, (start, end))
+            for name in TOTALS_TRIGGERS:
+                connector.execute(f'DROP TRIGGER {name}')
+            connector.execute('DELETE FROM ExpenseTracker WHERE Date >= ? AND Date < ?', (start, end))
+            create_triggers(connector, TOTALS_TRIGGERS)
+            connector.execute('INSERT INTO Archives (Year, Path, Expenses) VALUES (?, ?, ?)',
+                              (year, os.path.basename(path), copied))
+            connector.commit()
+        except BaseException:
+            connector.rollback()
+            raise
+    except BaseException:
+        _remove(path)
+        raise
+
+    if vacuum:
+        connector.execute('VACUUM')
+    return copied
+
+
+def closed_years(connector):
+    """Years before the current one that have expenses and are not archived yet."""
+    this_year = str(datetime.date.today().year)
+    rows = connector.execute(
+        "SELECT DISTINCT substr(Month, 1, 4) FROM MonthlyCategoryTotals WHERE Month != '' AND Month < ? ORDER BY 1",
+        (this_year,)
+    )
+    archived = archives(connector)
+    return [int(year) for year, in rows if int(year) not in archived]
+
+
+DESCRIPTION = 'Move finished years into read-only archive databases.'
+
+
+def add_arguments(parser):
+    parser.add_argument('years', nargs='*', type=int, help='years to archive')
+    parser.add_argument('--closed', action='store_true', help='archive every year before the current one')
+    parser.add_argument('--vacuum', action='store_true', help='compact the main database afterwards')
+    parser.add_argument('--list', action='store_true', help='list the archived years')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+
+
+def run(args, parser):
+    from .database import connect
+    from .schema import migrate
+
+    connector = connect(args.database)
+    migrate(connector)
+    try:
+        if args.list:
+            for year, path in archives(connector).items():
+                print(f'{year}: {path}')
+            return
+
+        years = sorted(set(args.years) | set(closed_years(connector) if args.closed else ()))
+        if not years:
+            parser.exit(1, 'Nothing to archive; name the years or pass --closed\n')
+        for index, year in enumerate(years):
+            try:
+                moved = archive_year(connector, year, vacuum=args.vacuum and index == len(years) - 1)
+            except (OSError, ValueError, RuntimeError, sqlite3.Error) as error:
+                parser.exit(1, f'{year}: {error}\n')
+            print(f'{year}: {moved:,} expenses archived')
+    finally:
+        connector.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+"""Online backups, snapshot rotation and routine maintenance.
+
+Copying "Expense Tracker.db" while a script has it open can catch it halfway
+through a write (or miss what is still in the -wal file) and produce a copy
+that does not open.  `backup` copies the database with SQLite's online backup
+API instead: the copy is always a consistent state of the ledger, taken a few
+pages at a time so that the scripts can keep writing in between.  A write
+from another connection makes SQLite start the copy over, so a backup only
+finishes in a pause between writes, which in a personal ledger is almost
+always.
+
+`snapshot` writes such a copy into the backup directory under a timestamped
+name ("backups/Expense Tracker-20240301-093000.db") and deletes all but the
+newest `keep` snapshots.  Archives (see archive.py) never change once they are
+written, so they are not part of the snapshots; copy them once.
+
+`maintain` settles the running sums of the daily totals (see schema.py),
+runs `PRAGMA optimize` and gives the pages that deleted expenses
+left free back to the file system in small steps with `PRAGMA
+incremental_vacuum`.  That needs auto_vacuum=INCREMENTAL, which `connect`
+asks for: new databases get it straight away, existing ones the next time
+they are VACUUMed (`expense-cli backup --vacuum`).
+
+Command line usage:
+
+    expense-cli backup
+    expense-cli backup "D:/Expense Tracker copy.db"
+    expense-cli backup --maintain
+"""
+
+import argparse
+import datetime
+import os
+import re
+import sqlite3
+
+# Pages copied per backup step, and seconds between steps for other
+# connections to get the lock
+BACKUP_PAGES = 1024
+STEP_PAUSE = 0.005
+
+# Free pages given back per incremental_vacuum transaction
+VACUUM_PAGES = 1024
+
+SNAPSHOT_TIME = '%Y%m%d-%H%M%S'
+
+# PRAGMA auto_vacuum
+INCREMENTAL = 2
+
+
+def _main_database(connector):
+    path = connector.execute('PRAGMA database_list').fetchone()[2]
+    if not path:
+        raise ValueError('Only a database stored in a file can be backed up')
+    return path
+
+
+def backup(connector, path, pages=BACKUP_PAGES, progress=None):
+    """Copy the database `connector` has open into `path`, a few `pages` at a time.
+
+    `progress(copied, total)` is called after every step; an exception it
+    raises stops the backup.  The copy is checked and only then moved to
+    `path`, so an unfinished backup never replaces a good one.
+    """
+    partial = f'{path}.partial'
+    target = sqlite3.connect(partial)
+    try:
+        connector.backup(target, pages=pages, sleep=STEP_PAUSE,
+                         progress=None if progress is None else
+                         lambda status, remaining, total: progress(total - remaining, total))
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f'The backup of {path} is damaged: {check}')
+        # The copy inherits WAL mode; a single file is easier to carry around
+        target.execute('PRAGMA journal_mode = DELETE')
+    except BaseException:
+        target.close()
+        os.remove(partial)
+        raise
+    target.close()
+    os.replace(partial, path)
+    return path
+
+
+def backup_directory(connector, directory):
+    """`directory`, relative to the folder of the database `connector` has open."""
+    return os.path.join(os.path.dirname(_main_database(connector)), directory)
+
+
+def snapshots(database, directory):
+    """Paths of the snapshots of `database` in `directory`, oldest first."""
+    stem, extension = os.path.splitext(os.path.basename(database))
+    pattern = re.compile(re.escape(stem) + r'-\d{8}-\d{6}' + re.escape(extension))
+    try:
+        names = os.listdir(directory)
+    except FileNotFoundError:
+        return []
+    # The timestamp sorts like the name
+    return [os.path.join(directory, name) for name in sorted(names) if pattern.fullmatch(name)]
+
+
+def last_snapshot_time(database, directory):
+    """When the newest snapshot of `database` was taken, or None."""
+    existing = snapshots(database, directory)
+    if not existing:
+        return None
+    stem = os.path.splitext(os.path.basename(database))[0]
+    taken = os.path.splitext(os.path.basename(existing[-1]))[0][len(stem) + 1:]
+    return datetime.datetime.strptime(taken, SNAPSHOT_TIME)
+
+
+def rotate(database, directory, keep):
+    """Delete all but the newest `keep` snapshots of `database` and return the deleted paths."""
+    existing = snapshots(database, directory)
+    expired = existing[:-keep] if keep > 0 else existing
+    for path in expired:
+        os.remove(path)
+    return expired
+
+
+def snapshot(connector, directory, keep, progress=None):
+    """Back the database up into a new snapshot in `directory`, keep the newest `keep`, and return its path."""
+    database = _main_database(connector)
+    directory = backup_directory(connector, directory)
+    os.makedirs(directory, exist_ok=True)
+
+    stem, extension = os.path.splitext(os.path.basename(database))
+    when = datetime.datetime.now()
+    path = os.path.join(directory, f'{stem}-{when:{SNAPSHOT_TIME}}{extension or ".db"}')
+    while os.path.exists(path):
+        # Two snapshots within a second, e.g. a scheduled one and one before deleting everything
+        when += datetime.timedelta(seconds=1)
+        path = os.path.join(directory, f'{stem}-{when:{SNAPSHOT_TIME}}{extension or ".db"}')
+
+    backup(connector, path, progress=progress)
+    rotate(database, directory, keep)
+    return path
+
+
+def maintain(connector, pages=VACUUM_PAGES):
+    """Settle the daily totals, refresh the query planner statistics and free unused pages; returns how many pages
+    were freed."""
+    from .schema import settle_daily_totals
+
+    # `expense-cli backup` does not migrate, so there may be no daily totals yet
+    if connector.execute("SELECT 1 FROM sqlite_master WHERE name = 'UnsettledDays'").fetchone():
+        settle_daily_totals(connector)
+    connector.commit()
+    connector.execute('PRAGMA optimize')
+    if connector.execute('PRAGMA auto_vacuum').fetchone()[0] != INCREMENTAL:
+        return 0
+
+    freed = 0
+    # Each call is its own short write transaction.  It needs executescript:
+    # execute() steps a PRAGMA once, and incremental_vacuum frees one page per step.
+    while True:
+        free = connector.execute('PRAGMA freelist_count').fetchone()[0]
+        if not free:
+            return freed
+        connector.executescript(f'PRAGMA incremental_vacuum({min(free, pages)})')
+        freed += free - connector.execute('PRAGMA freelist_count').fetchone()[0]
+
+
+DESCRIPTION = 'Back the database up while it is in use, and tidy it up.'
+
+
+def add_arguments(parser):
+    parser.add_argument('target', nargs='?',
+                        help='file to write the backup to (default: a new snapshot in the backup directory)')
+    parser.add_argument('--maintain', action='store_true', help='also optimize the database and free unused pages')
+    parser.add_argument('--vacuum', action='store_true',
+                        help='rebuild the database file, which also turns on incremental vacuuming for old files')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+
+
+def run(args, parser):
+    from .database import connect, load_settings
+
+    settings = load_settings()
+    connector = connect(args.database, settings)
+    try:
+        if args.target:
+            path = backup(connector, args.target)
+        else:
+            path = snapshot(connector, settings['backup_directory'], int(settings['backup_keep']))
+        print(f'Backed up to {path}')
+
+        if args.vacuum:
+            connector.execute('VACUUM')
+        if args.maintain:
+            freed = maintain(connector)
+            print(f'Optimized; {freed:,} unused pages freed')
+    except (OSError, sqlite3.Error) as error:
+        parser.exit(1, f'{error}\n')
+    finally:
+        connector.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,191 @@
+"""The `expense-cli` command.
+
+    expense-cli add --payee Cafe --description Lunch --amount 12.50 --category Food
+    expense-cli list --from 2024-01-01 --category Food
+    expense-cli list --search "super groc" --min-amount 500
+    expense-cli summary --convert
+    expense-cli total --from 2024-04-01 --to 2025-03-31 --by-category
+    expense-cli forecast --months 3
+    expense-cli rates eurofxref-hist.csv
+    expense-cli import statement.csv
+    expense-cli export expenses.parquet
+    expense-cli backup --maintain
+    expense-cli serve --port 8765
+
+Every command takes --database; by default the database named in
+expense_tracker.ini is used.
+"""
+
+import argparse
+import datetime
+import importlib
+import itertools
+
+from .database import connect
+from .models import Expense
+from .money import DEFAULT_CURRENCY, to_decimal
+from .repository import ExpenseRepository
+from .schema import migrate, settle_daily_totals
+
+# Commands whose arguments and implementation live in another module
+MODULE_COMMANDS = {
+    'forecast': 'forecast',
+    'import': 'importer',
+    'export': 'exporter',
+    'migrate': 'schema',
+    'archive': 'archive',
+    'rates': 'fx',
+    'backup': 'backup',
+    'serve': 'server',
+}
+
+
+def open_repository(args):
+    connector = connect(args.database)
+    migrate(connector)
+    return ExpenseRepository(connector)
+
+
+def add_expense(args, parser):
+    expenses = open_repository(args)
+    try:
+        expense = expenses.add(Expense(args.date, args.payee, args.description, args.amount, args.mode, args.category,
+                                       args.currency))
+        # A backdated expense leaves the running sums of the later days to be settled
+        settle_daily_totals(expenses.connector)
+        expenses.connector.commit()
+    except ValueError as error:
+        parser.exit(1, f'{error}\n')
+    finally:
+        expenses.connector.close()
+    print(f'Added expense {expense.id}')
+
+
+def list_expenses(args, parser):
+    expenses = open_repository(args)
+    try:
+        listed = expenses.list(args.start, args.end, args.categories, args.limit, text=args.search,
+                               min_amount=args.min_amount, max_amount=args.max_amount, currency=args.currency)
+    finally:
+        expenses.connector.close()
+
+    for expense in listed:
+        print(f'{expense.id:>8}  {expense.date}  {expense.payee or "":<20.20}  {expense.description or "":<30.30}  '
+              f'{expense.amount or 0:>12,} {expense.currency}  {expense.mode_of_payment or "":<12.12}  '
+              f'{expense.category or ""}')
+
+
+def summarize(args, parser):
+    expenses = open_repository(args)
+    try:
+        if args.convert:
+            from .fx import MissingRateError, converted_monthly_totals
+
+            try:
+                monthly = converted_monthly_totals(expenses.connector, args.currency)
+            except MissingRateError as error:
+                parser.exit(1, f'{error}\n')
+            total = sum(amount for _, _, amount in monthly)
+        else:
+            monthly = expenses.monthly_totals(args.currency)
+            total = expenses.total(args.currency)
+    finally:
+        expenses.connector.close()
+
+    for month, rows in itertools.groupby(monthly, key=lambda row: row[0]):
+        rows = list(rows)
+        print(month or '(undated)')
+        for _, category, amount in rows:
+            print(f'  {category or "(uncategorised)":<20} {amount:>14,}')
+        print(f'  {"Total":<20} {sum(amount for _, _, amount in rows):>14,}')
+    print(f'Total expenses: {total:,} {args.currency}')
+
+
+def range_total(args, parser):
+    expenses = open_repository(args)
+    try:
+        total = expenses.range_total(args.start, args.end, args.currency)
+        categories = expenses.range_category_totals(args.start, args.end, args.currency) if args.by_category else []
+    finally:
+        expenses.connector.close()
+
+    for category, row in categories:
+        print(f'{category or "(uncategorised)":<20} {row.total:>14,}  {row.expenses:>6} expenses')
+    print(f'Total {args.start or "(start)"} to {args.end or "(end)"}: {total.total:,} {args.currency} '
+          f'in {total.expenses} expenses')
+
+
+def iso_date(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'{value!r} is not a YYYY-MM-DD date') from None
+
+
+def amount(value):
+    try:
+        return to_decimal(value)
+    except ValueError as error:
+        raise argparse.ArgumentTypeError(str(error)) from None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='expense-cli', description='Manage the expense tracker database.')
+    commands = parser.add_subparsers(dest='command', required=True, metavar='command')
+
+    add = commands.add_parser('add', help='Add an expense.')
+    add.add_argument('--date', type=iso_date, default=datetime.date.today(), help='YYYY-MM-DD (default: today)')
+    add.add_argument('--payee', required=True)
+    add.add_argument('--description', required=True)
+    add.add_argument('--amount', type=amount, required=True)
+    add.add_argument('--mode', default='Cash', help='mode of payment (default: Cash)')
+    add.add_argument('--category')
+    add.set_defaults(run=add_expense)
+
+    listing = commands.add_parser('list', help='List expenses in date order.')
+    listing.add_argument('--from', dest='start', type=iso_date, metavar='YYYY-MM-DD', help='first date to list')
+    listing.add_argument('--to', dest='end', type=iso_date, metavar='YYYY-MM-DD', help='last date to list')
+    listing.add_argument('--category', action='append', dest='categories', help='only this category (repeatable)')
+    listing.add_argument('--search', metavar='WORDS', help='payee or description words, matched as prefixes')
+    listing.add_argument('--min-amount', type=amount, help=f'smallest amount to list, in --currency or {DEFAULT_CURRENCY}')
+    listing.add_argument('--max-amount', type=amount, help=f'largest amount to list, in --currency or {DEFAULT_CURRENCY}')
+    listing.add_argument('--limit', type=int, help='list at most this many expenses')
+    listing.set_defaults(run=list_expenses)
+
+    summary = commands.add_parser('summary', help='Show monthly totals per category.')
+    summary.set_defaults(run=summarize)
+
+    total = commands.add_parser('total', help='Show the total of a date range.')
+    total.add_argument('--from', dest='start', type=iso_date, metavar='YYYY-MM-DD', help='first date to include')
+    total.add_argument('--to', dest='end', type=iso_date, metavar='YYYY-MM-DD', help='last date to include')
+    total.add_argument('--by-category', action='store_true', help='also show the total of every category')
+    total.set_defaults(run=range_total)
+
+    for command in (add, listing, summary, total):
+        command.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    add.add_argument('--currency', default=DEFAULT_CURRENCY, type=str.upper, help=f'currency of the amount (default: {DEFAULT_CURRENCY})')
+    listing.add_argument('--currency', type=str.upper, help='only expenses in this currency')
+    summary.add_argument('--currency', default=DEFAULT_CURRENCY, type=str.upper,
+                         help=f'currency to total (default: {DEFAULT_CURRENCY})')
+    summary.add_argument('--convert', action='store_true',
+                         help='convert the expenses in other currencies into --currency and include them')
+    total.add_argument('--currency', default=DEFAULT_CURRENCY, type=str.upper,
+                       help=f'currency to total (default: {DEFAULT_CURRENCY})')
+
+    for command, module_name in MODULE_COMMANDS.items():
+        module = importlib.import_module(f'.{module_name}', __package__)
+        subparser = commands.add_parser(command, help=module.DESCRIPTION, description=module.DESCRIPTION)
+        module.add_arguments(subparser)
+        subparser.set_defaults(run=module.run)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    args.run(args, parser)
+
+
+if __name__ == '__main__':
+    main()
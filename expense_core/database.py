@@ -0,0 +1,97 @@
+"""One place to open "Expense Tracker.db".
+
+Every script and background thread gets its connection from `connect`, which
+switches the file to WAL and applies the tuning PRAGMAs below.  The values can
+be overridden in the [database] section of expense_tracker.ini.
+
+Durability vs. throughput (the `durability` setting):
+
+  safe      synchronous=FULL.   Every commit is fsynced; nothing committed is
+            lost, even on power failure.  Slowest writes.
+  balanced  synchronous=NORMAL (default).  Commits survive the app crashing;
+            a power cut or OS crash can lose the last few commits but never
+            corrupts the file.  Commits need no fsync, only checkpoints do.
+  fast      synchronous=OFF.    No fsync at all.  A power cut or OS crash can
+            corrupt the database; only use it for bulk loads you can redo.
+"""
+
+import configparser
+import sqlite3
+
+from .diagnostics import TracedConnection, diagnostics_enabled
+
+SETTINGS_FILE = 'expense_tracker.ini'
+
+DEFAULT_SETTINGS = {
+    'database': 'Expense Tracker.db',
+    'journal_mode': 'WAL',
+    'durability': 'balanced',
+    # Page cache per connection, and how much of the file to memory map
+    'cache_size_mb': '64',
+    'mmap_size_mb': '256',
+    'temp_store': 'MEMORY',
+    # Seconds to wait for another connection's write lock
+    'busy_timeout': '10',
+    # How many rows WriteQueue commits together at most, and how long (ms) it
+    # waits for more before committing
+    'write_batch_rows': '500',
+    'write_batch_ms': '0',
+    # Currency the summary and the chart convert every expense into
+    'reporting_currency': 'INR',
+    # Takes effect on new databases, and on old ones at their next VACUUM
+    'auto_vacuum': 'INCREMENTAL',
+    # Snapshots the scripts take while they run (see backup.py); the
+    # directory is relative to the database
+    'backup_directory': 'backups',
+    'backup_keep': '10',
+    'backup_interval_hours': '24',
+    # How often the scripts run PRAGMA optimize and incremental_vacuum
+    'maintenance_interval_hours': '6',
+    # Time every SQL statement and GUI action (see diagnostics.py); costs a
+    # little on every query, so it is off unless something needs looking into
+    'diagnostics': 'off',
+}
+
+DURABILITY = {
+    'safe': 'FULL',
+    'balanced': 'NORMAL',
+    'fast': 'OFF',
+}
+
+
+def load_settings(path=SETTINGS_FILE):
+    """Defaults merged with the [database] section of the settings file, if there is one."""
+    parser = configparser.ConfigParser()
+    parser.read_dict({'database': DEFAULT_SETTINGS})
+    parser.read(path, encoding='utf-8')
+
+    settings = dict(parser['database'])
+    if settings['durability'] not in DURABILITY:
+        raise ValueError(f"Unknown durability {settings['durability']!r}, expected one of {', '.join(DURABILITY)}")
+    return settings
+
+
+def connect(database=None, settings=None, **kwargs):
+    """Open a tuned connection; `database` defaults to the one named in the settings."""
+    if settings is None:
+        settings = load_settings()
+    if database is None:
+        database = settings['database']
+
+    # URI filenames let archives be attached read-only; plain paths are unaffected
+    kwargs.setdefault('uri', True)
+    if diagnostics_enabled(settings):
+        kwargs.setdefault('factory', TracedConnection)
+    connector = sqlite3.connect(database, timeout=float(settings['busy_timeout']), **kwargs)
+
+    # auto_vacuum and journal_mode are stored in the file, the rest only lasts
+    # for this connection.  auto_vacuum goes first, before WAL mode creates
+    # the file of a new database.
+    connector.execute(f"PRAGMA auto_vacuum = {settings['auto_vacuum']}")
+    connector.execute(f"PRAGMA journal_mode = {settings['journal_mode']}")
+    connector.execute(f"PRAGMA synchronous = {DURABILITY[settings['durability']]}")
+    connector.execute(f"PRAGMA cache_size = {-int(float(settings['cache_size_mb']) * 1024)}")
+    connector.execute(f"PRAGMA mmap_size = {int(float(settings['mmap_size_mb']) * 1024 * 1024)}")
+    connector.execute(f"PRAGMA temp_store = {settings['temp_store']}")
+
+    return connector
@@ -0,0 +1,328 @@
+"""Opt-in latency measurements, for finding out what is slow on a real ledger.
+
+With `diagnostics = on` in expense_tracker.ini, `connect` hands out
+TracedConnections, which time every SQL statement from execute to its last
+fetched row and count the rows.  SQLite's trace callback shows the
+statements that never pass through a cursor -- the BEGIN and COMMIT that the
+sqlite3 module issues by itself, the parts of an executescript -- and each
+gets the time up to the next one.  The GUI scripts add the time from a click
+to the window being painted again, and Tk mainloop stalls (see
+diagnostics_panel.py); the API server the time of every request.
+
+Everything goes into `recorder`, which keeps count, total and maximum per
+statement or action, and the most recent SAMPLES durations for percentiles.
+`to_json` and `to_prometheus` write them out for offline analysis; the
+scripts show them in a window (F12), and `expense-cli serve` at /metrics.
+
+Statements are grouped by their text with whitespace collapsed, so a query
+is one entry whatever its parameters.
+"""
+
+import datetime
+import heapq
+import json
+import sqlite3
+import threading
+import time
+from collections import deque
+
+# Durations kept per statement or action for the percentiles
+SAMPLES = 1000
+
+# Slowest single measurements kept, with their details
+SLOWEST = 20
+
+# Statement text kept, in characters
+STATEMENT_LENGTH = 160
+
+PERCENTILES = (50, 95, 99)
+
+# Prometheus metric, label and help text per kind of measurement
+KINDS = {
+    'sql': ('expense_sql_seconds', 'statement', 'SQL statements, from execute to the last row fetched'),
+    'ui': ('expense_ui_seconds', 'action', 'GUI actions, from the click to the window being painted'),
+    'stall': ('expense_mainloop_stall_seconds', 'during', 'Tk mainloop stalls, by the action that was running'),
+    'api': ('expense_api_seconds', 'endpoint', 'API server requests, from the parsed request to the response'),
+}
+
+
+def diagnostics_enabled(settings):
+    return settings.get('diagnostics', 'off').strip().lower() in ('on', 'yes', 'true', '1')
+
+
+def statement_name(sql):
+    """The text `sql` is grouped under: whitespace collapsed, shortened to STATEMENT_LENGTH."""
+    text = ' '.join(sql.split()).rstrip(';')
+    return text if len(text) <= STATEMENT_LENGTH else text[:STATEMENT_LENGTH - 3] + '...'
+
+
+class Timings:
+    """Count, total and maximum of one kind of measurement, and its most recent durations."""
+
+    __slots__ = ('count', 'total', 'max', 'rows', 'samples')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.samples = deque(maxlen=SAMPLES)
+
+    def add(self, duration, rows=None):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        if rows is not None:
+            self.rows += rows
+        self.samples.append(duration)
+
+    def percentiles(self, percents=PERCENTILES):
+        """Nearest-rank percentiles of the recent durations."""
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {percent: 0.0 for percent in percents}
+        return {percent: ordered[min(len(ordered) - 1, max(0, -(-percent * len(ordered) // 100) - 1))]
+                for percent in percents}
+
+
+class Recorder:
+    """Timings by kind ('sql', 'ui', 'stall', 'api') and name; safe to use from any thread."""
+
+    def __init__(self):
+        self._timings = {}
+        self._slowest = []
+        self._order = 0
+        self._lock = threading.Lock()
+
+    def record(self, kind, name, duration, rows=None):
+        with self._lock:
+            timings = self._timings.get((kind, name))
+            if timings is None:
+                timings = self._timings[(kind, name)] = Timings()
+            timings.add(duration, rows)
+
+            # A min-heap of the slowest; the order breaks ties between equal durations
+            self._order += 1
+            sample = (duration, self._order, kind, name, rows, time.time())
+            if len(self._slowest) < SLOWEST:
+                heapq.heappush(self._slowest, sample)
+            elif duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, sample)
+
+    def reset(self):
+        with self._lock:
+            self._timings.clear()
+            self._slowest.clear()
+
+    def summary(self):
+        """A dict per kind and name: count, total, max, rows and p50/p95/p99, in seconds; slowest first."""
+        with self._lock:
+            items = [(kind, name, timings.count, timings.total, timings.max, timings.rows, timings.percentiles())
+                     for (kind, name), timings in self._timings.items()]
+        rows = []
+        for kind, name, count, total, longest, fetched, percentiles in items:
+            row = {'kind': kind, 'name': name, 'count': count, 'total': total, 'max': longest}
+            row.update({f'p{percent}': value for percent, value in percentiles.items()})
+            if kind == 'sql':
+                row['rows'] = fetched
+            rows.append(row)
+        rows.sort(key=lambda row: row['total'], reverse=True)
+        return rows
+
+    def slowest(self):
+        """The SLOWEST longest single measurements, longest first."""
+        with self._lock:
+            samples = sorted(self._slowest, reverse=True)
+        return [{'kind': kind, 'name': name, 'duration': duration, 'rows': rows,
+                 'at': datetime.datetime.fromtimestamp(at).isoformat(timespec='seconds')}
+                for duration, _, kind, name, rows, at in samples]
+
+
+recorder = Recorder()
+
+
+# Exports
+def to_json(recorder=recorder):
+    return json.dumps({
+        'generated': datetime.datetime.now().isoformat(timespec='seconds'),
+        'timings': recorder.summary(),
+        'slowest': recorder.slowest(),
+    }, indent=2)
+
+
+def _label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def to_prometheus(recorder=recorder):
+    """The timings in the Prometheus text exposition format, as summaries."""
+    by_kind = {}
+    for row in recorder.summary():
+        by_kind.setdefault(row['kind'], []).append(row)
+
+    lines = []
+    for kind, rows in sorted(by_kind.items()):
+        metric, label, description = KINDS.get(kind, (f'expense_{kind}_seconds', 'name', kind))
+        lines += [f'# HELP {metric} {description}.', f'# TYPE {metric} summary']
+        for row in sorted(rows, key=lambda row: row['name']):
+            name = _label(row['name'])
+            for percent in PERCENTILES:
+                lines.append(f'{metric}{{{label}="{name}",quantile="{percent / 100}"}} {row[f"p{percent}"]:.6f}')
+            lines.append(f'{metric}_sum{{{label}="{name}"}} {row["total"]:.6f}')
+            lines.append(f'{metric}_count{{{label}="{name}"}} {row["count"]}')
+        if kind == 'sql':
+            lines += ['# HELP expense_sql_rows_total Rows returned or changed by SQL statements.',
+                      '# TYPE expense_sql_rows_total counter']
+            lines += [f'expense_sql_rows_total{{{label}="{_label(row["name"])}"}} {row["rows"]}'
+                      for row in sorted(rows, key=lambda row: row['name'])]
+    return '\n'.join(lines) + '\n'
+
+
+# Timed connections
+class TracedCursor(sqlite3.Cursor):
+    """A cursor that records each statement once its last row is fetched (or it is executed again or closed)."""
+
+    def __init__(self, connection):
+        super().__init__(connection)
+        self._statement = None
+        self._elapsed = 0.0
+        self._rows = 0
+
+    def _finish(self):
+        if self._statement is not None:
+            # Rows fetched for a query, rows changed for anything else
+            rows = self._rows if self.description is not None else max(self.rowcount, 0)
+            recorder.record('sql', self._statement, self._elapsed, rows)
+            self._statement = None
+
+    def _run(self, method, sql, *args):
+        self._finish()
+        self._rows = 0
+        connection = self.connection
+        started = connection.start_trace()
+        try:
+            method(self, sql, *args)
+        finally:
+            self._elapsed = connection.stop_trace(started)
+            self._statement = statement_name(sql)
+            if self.description is None:
+                self._finish()
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._run(sqlite3.Cursor.execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._run(sqlite3.Cursor.executemany, sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        self._finish()
+        connection = self.connection
+        started = connection.start_trace(split=True)
+        try:
+            return super().executescript(sql_script)
+        finally:
+            connection.stop_trace(started)
+
+    def _fetched(self, started, rows, done):
+        self._elapsed += time.perf_counter() - started
+        self._rows += rows
+        if done:
+            self._finish()
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None, row is None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows), not rows)
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows), True)
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            self._fetched(started, 0, True)
+            raise
+        self._fetched(started, 1, False)
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        self._finish()
+
+
+class TracedConnection(sqlite3.Connection):
+    """A connection whose statements are timed into `recorder`; `connect` uses it when diagnostics are on."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # (time, sql) of every statement SQLite starts during a timed call
+        self._trace = None
+        self._split = False
+        self.set_trace_callback(self._traced)
+
+    def _traced(self, sql):
+        if self._trace is not None:
+            self._trace.append((time.perf_counter(), sql))
+
+    def start_trace(self, split=False):
+        self._trace = []
+        self._split = split
+        return time.perf_counter()
+
+    def stop_trace(self, started):
+        """Record the statements SQLite ran since `start_trace` that were not the caller's own; returns the time
+        left for the caller's statement."""
+        ended = time.perf_counter()
+        trace, self._trace = self._trace or [], None
+        if self._split:
+            # Every statement of a script on its own
+            for (at, sql), (until, _) in zip(trace, trace[1:] + [(ended, None)]):
+                recorder.record('sql', statement_name(sql), until - at)
+            return ended - started
+        if trace and trace[0][1].startswith('BEGIN') and len(trace) > 1:
+            # The transaction the sqlite3 module opened before a write
+            recorder.record('sql', 'BEGIN', trace[1][0] - trace[0][0])
+            return ended - trace[1][0]
+        return ended - started
+
+    def cursor(self, factory=TracedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def executescript(self, sql_script):
+        return self.cursor().executescript(sql_script)
+
+    def commit(self):
+        started = time.perf_counter()
+        in_transaction = self.in_transaction
+        super().commit()
+        if in_transaction:
+            recorder.record('sql', 'COMMIT', time.perf_counter() - started)
+
+    def rollback(self):
+        started = time.perf_counter()
+        in_transaction = self.in_transaction
+        super().rollback()
+        if in_transaction:
+            recorder.record('sql', 'ROLLBACK', time.perf_counter() - started)
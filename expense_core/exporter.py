@@ -0,0 +1,174 @@
+"""Streaming export of ExpenseTracker to CSV, JSON Lines or Parquet.
+
+Rows are read with `fetchmany` and written batch by batch, so memory use does
+not depend on the size of the ledger.  Date-range and category filters become
+part of the SELECT and use the Date/Category indexes.  Amounts are written as
+exact decimals next to their currency.  Parquet needs pyarrow.
+
+Command line usage:
+
+    expense-cli export expenses.csv
+    expense-cli export food-2024.parquet --from 2024-01-01 --to 2024-12-31 --category Food
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+
+from .database import connect
+from .models import COLUMNS, display_row
+from .repository import select_expenses
+from .schema import migrate
+
+# Rows per fetchmany call, and per Parquet row group
+FETCH_SIZE = 50000
+
+FORMATS = {
+    '.csv': 'csv',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl',
+    '.parquet': 'parquet',
+}
+
+
+def batches(cursor, size=FETCH_SIZE):
+    """Lists of rows in COLUMNS order, amounts turned from minor units into Decimals."""
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        yield [display_row(row) for row in rows]
+
+
+# Writers.  Each takes an iterable of row batches and returns the row count.
+def write_csv(row_batches, path, progress=None):
+    exported = 0
+    with open(path, 'w', newline='', encoding='utf-8') as stream:
+        writer = csv.writer(stream)
+        writer.writerow(COLUMNS)
+        for rows in row_batches:
+            writer.writerows(rows)
+            exported += len(rows)
+            if progress is not None:
+                progress(exported)
+    return exported
+
+
+def write_jsonl(row_batches, path, progress=None):
+    exported = 0
+    with open(path, 'w', encoding='utf-8') as stream:
+        for rows in row_batches:
+            # Decimal amounts become strings, as in the API server's JSON, so
+            # they read back exactly
+            stream.writelines(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False, default=str) + '\n'
+                              for row in rows)
+            exported += len(rows)
+            if progress is not None:
+                progress(exported)
+    return exported
+
+
+def write_parquet(row_batches, path, progress=None):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError('Exporting to Parquet needs pyarrow (pip install pyarrow)') from None
+
+    schema = pa.schema([
+        ('ID', pa.int64()),
+        ('Date', pa.string()),
+        ('Payee', pa.string()),
+        ('Description', pa.string()),
+        # Three decimal places hold the minor units of every currency
+        ('Amount', pa.decimal128(18, 3)),
+        ('ModeOfPayment', pa.string()),
+        ('Category', pa.string()),
+        ('Currency', pa.string()),
+    ])
+
+    exported = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in row_batches:
+            # Transpose the batch into columns, one row group per batch
+            columns = [pa.array(values, type=field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(columns, schema=schema))
+            exported += len(rows)
+            if progress is not None:
+                progress(exported)
+    return exported
+
+
+WRITERS = {
+    'csv': write_csv,
+    'jsonl': write_jsonl,
+    'parquet': write_parquet,
+}
+
+
+def export_file(connector, path, file_format=None, start=None, end=None, categories=None, progress=None):
+    """Write the matching expenses to `path`; the format defaults to the one of its extension.
+
+    The rows go to a file next to `path` that only replaces it once they are
+    all written, so a failed export leaves neither a partial file nor a
+    truncated earlier export behind.
+    """
+    if file_format is None:
+        file_format = FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+
+    partial = f'{path}.partial'
+    cursor = select_expenses(connector, start, end, categories)
+    try:
+        exported = WRITERS[file_format](batches(cursor), partial, progress)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    finally:
+        cursor.close()
+    os.replace(partial, path)
+    return exported
+
+
+DESCRIPTION = 'Export expenses to CSV, JSON Lines or Parquet.'
+
+
+def add_arguments(parser):
+    parser.add_argument('file', help='output file; the format follows the extension (.csv, .jsonl, .parquet)')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    parser.add_argument('--format', choices=sorted(WRITERS), help='output format (default: by extension)')
+    parser.add_argument('--from', dest='start', metavar='YYYY-MM-DD', help='first date to export')
+    parser.add_argument('--to', dest='end', metavar='YYYY-MM-DD', help='last date to export')
+    parser.add_argument('--category', action='append', dest='categories', help='only this category (repeatable)')
+
+
+def run(args, parser):
+    connector = connect(args.database)
+    migrate(connector)
+
+    def progress(exported):
+        print(f'\r  {exported:,} rows', end='', file=sys.stderr, flush=True)
+
+    try:
+        exported = export_file(connector, args.file, file_format=args.format, start=args.start, end=args.end,
+                               categories=args.categories, progress=progress)
+    except (OSError, RuntimeError) as error:
+        print(file=sys.stderr)
+        parser.exit(1, f'Could not export to {args.file}: {error}\n')
+    finally:
+        connector.close()
+
+    print(file=sys.stderr)
+    print(f'Exported {exported:,} rows to {args.file}')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
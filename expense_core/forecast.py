@@ -0,0 +1,254 @@
+"""Spending forecasts from the monthly totals.
+
+Monthly spending per category comes straight out of MonthlyCategoryTotals
+(a few hundred rows however long the ledger is), so no expense rows are read
+into Python.  Each series is fitted by ordinary least squares on
+
+    spending(t) = a + b*t + c*sin(2*pi*t/12) + d*cos(2*pi*t/12)
+
+where t counts calendar months.  The yearly terms are only used once there are
+two years of history; before that the model is a straight trend.  All series,
+the overall total and every category, are solved together with one
+`numpy.linalg.lstsq` call, and the prediction intervals follow from the
+residual variance of each fit.  Forecasts cover one currency at a time and,
+being estimates, are plain floats in its major unit.  With `convert` the
+spending in other currencies is converted into it first, by the same monthly
+rates as the converted summary (see fx.py).
+
+Command line usage:
+
+    expense-cli forecast
+    expense-cli forecast --months 3 --level 0.8
+    expense-cli forecast --convert --currency EUR
+"""
+
+import argparse
+from typing import NamedTuple, Optional
+
+import numpy as np
+
+from .money import DEFAULT_CURRENCY, exponent
+from .result_cache import cached
+
+# Fewer expenses than this are not worth a forecast
+MIN_EXPENSES = 10
+
+# Months of history before the yearly seasonal terms are fitted
+SEASONAL_MONTHS = 24
+
+MONTHLY_SPENDING = "SELECT Month, Category, Total FROM MonthlyCategoryTotals WHERE Month != '' AND Currency = ?"
+
+# Two-sided Student t critical values by degrees of freedom for the supported
+# levels; beyond the table the normal quantile is close enough
+_T_TABLE = {
+    0.8: (3.078, 1.886, 1.638, 1.533, 1.476, 1.440, 1.415, 1.397, 1.383, 1.372,
+          1.363, 1.356, 1.350, 1.345, 1.341, 1.337, 1.333, 1.330, 1.328, 1.325,
+          1.323, 1.321, 1.319, 1.318, 1.316, 1.315, 1.314, 1.313, 1.311, 1.310),
+    0.9: (6.314, 2.920, 2.353, 2.132, 2.015, 1.943, 1.895, 1.860, 1.833, 1.812,
+          1.796, 1.782, 1.771, 1.761, 1.753, 1.746, 1.740, 1.734, 1.729, 1.725,
+          1.721, 1.717, 1.714, 1.711, 1.708, 1.706, 1.703, 1.701, 1.699, 1.697),
+    0.95: (12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+           2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+           2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042),
+    0.99: (63.657, 9.925, 5.841, 4.604, 4.032, 3.707, 3.499, 3.355, 3.250, 3.169,
+           3.106, 3.055, 3.012, 2.977, 2.947, 2.921, 2.898, 2.878, 2.861, 2.845,
+           2.831, 2.819, 2.807, 2.797, 2.787, 2.779, 2.771, 2.763, 2.756, 2.750),
+}
+_Z = {0.8: 1.282, 0.9: 1.645, 0.95: 1.960, 0.99: 2.576}
+
+# Prediction interval levels that can be asked for
+LEVELS = tuple(sorted(_Z))
+
+
+class Forecast(NamedTuple):
+    month: str
+    expected: float
+    low: float
+    high: float
+
+
+class SpendingForecast(NamedTuple):
+    # Forecasts of the total, one per month ahead
+    total: list
+    # {category: [Forecast, ...]}
+    categories: dict
+    # Highest spending category so far and its total; None and 0.0 when no
+    # expense has a category
+    top_category: Optional[str]
+    top_amount: float
+
+
+def month_number(month):
+    """'YYYY-MM' to a running month count."""
+    return int(month[:4]) * 12 + int(month[5:7]) - 1
+
+
+def month_name(number):
+    return f'{number // 12:04d}-{number % 12 + 1:02d}'
+
+
+def t_critical(level, dof):
+    if level not in _Z:
+        raise ValueError(f'Unsupported level {level}, expected one of {", ".join(map(str, _Z))}')
+    if dof < 1:
+        return float('inf')
+    table = _T_TABLE[level]
+    return table[dof - 1] if dof <= len(table) else _Z[level]
+
+
+def design_matrix(t, seasonal):
+    columns = [np.ones_like(t), t]
+    if seasonal:
+        angle = 2 * np.pi * t / 12
+        columns += [np.sin(angle), np.cos(angle)]
+    return np.column_stack(columns)
+
+
+def load_monthly_spending(connector, currency=DEFAULT_CURRENCY, convert=False):
+    """(first month number, categories, matrix of spending with a row per calendar month and a column per category).
+
+    Months without any expense are zero.  Uncategorised spending is the
+    category None.  With `convert` the spending in every currency is
+    converted into `currency` (MissingRateError when a rate is missing).
+    Returns None when the ledger has no dated expenses in `currency`.
+    """
+    if convert:
+        from .fx import converted_monthly_totals
+
+        rows = [(month, category or '', total) for month, category, total in converted_monthly_totals(connector, currency)
+                if month is not None]
+    else:
+        rows = connector.execute(MONTHLY_SPENDING, (currency,)).fetchall()
+    if not rows:
+        return None
+
+    numbers = [month_number(month) for month, _, _ in rows]
+    first = min(numbers)
+    categories = sorted({category for _, category, _ in rows})
+    column = {category: index for index, category in enumerate(categories)}
+
+    spending = np.zeros((max(numbers) - first + 1, len(categories)))
+    np.add.at(spending,
+              (np.array(numbers) - first, [column[category] for _, category, _ in rows]),
+              [float(total) for _, _, total in rows])
+    if not convert:
+        # Minor units to rupees, dollars, ...
+        spending /= 10 ** exponent(currency)
+
+    return first, [category or None for category in categories], spending
+
+
+def fit(series, months_ahead=1, level=0.95):
+    """Least squares forecasts of each column of `series` (months x series).
+
+    Returns (expected, low, high), each of shape (months_ahead, series).
+    """
+    months = len(series)
+    t = np.arange(months, dtype=float)
+    X = design_matrix(t, seasonal=months >= SEASONAL_MONTHS)
+    if months < X.shape[1] + 1:
+        # Too short for a trend: carry the average forward
+        X = X[:, :1]
+
+    coefficients, _, _, _ = np.linalg.lstsq(X, series, rcond=None)
+
+    dof = months - X.shape[1]
+    residuals = series - X @ coefficients
+    variance = (residuals ** 2).sum(axis=0) / max(dof, 1)
+
+    future = design_matrix(np.arange(months, months + months_ahead, dtype=float), X.shape[1] > 2)[:, :X.shape[1]]
+    expected = future @ coefficients
+
+    # Variance of a new observation: noise plus the uncertainty of the fit
+    leverage = np.einsum('ij,jk,ik->i', future, np.linalg.pinv(X.T @ X), future)
+    margin = t_critical(level, dof) * np.sqrt(np.outer(1 + leverage, variance))
+
+    # Spending cannot go negative
+    return np.maximum(expected, 0), np.maximum(expected - margin, 0), expected + margin
+
+
+@cached
+def forecast_spending(connector, months_ahead=1, level=0.95, currency=DEFAULT_CURRENCY, convert=False):
+    """Forecast the total and per-category spending in `currency`; None when there is too little data.
+
+    With `convert` the expenses in other currencies are converted and
+    included; MissingRateError when a currency has no rates.
+    """
+    expenses = connector.execute(
+        "SELECT IFNULL(SUM(Entries), 0) FROM MonthlyCategoryTotals WHERE Month != ''"
+        + ("" if convert else " AND Currency = ?"), () if convert else (currency,)
+    ).fetchone()[0]
+    if expenses < MIN_EXPENSES:
+        return None
+
+    first, categories, spending = load_monthly_spending(connector, currency, convert)
+    last = first + len(spending) - 1
+
+    # The total is fitted as one more series alongside the categories
+    series = np.column_stack([spending.sum(axis=1), spending])
+    expected, low, high = fit(series, months_ahead, level)
+
+    def forecasts(column):
+        return [Forecast(month_name(last + 1 + ahead), *(float(values[ahead, column]) for values in (expected, low, high)))
+                for ahead in range(months_ahead)]
+
+    totals = spending.sum(axis=0)
+    named = [index for index, category in enumerate(categories) if category is not None]
+    top = max(named, key=totals.__getitem__) if named else None
+
+    return SpendingForecast(
+        total=forecasts(0),
+        categories={category: forecasts(index + 1) for index, category in enumerate(categories)},
+        top_category=categories[top] if top is not None else None,
+        top_amount=float(totals[top]) if top is not None else 0.0,
+    )
+
+
+DESCRIPTION = 'Forecast monthly spending from the expense history.'
+
+
+def add_arguments(parser):
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    parser.add_argument('--months', type=int, default=1, help='months to forecast (default: 1)')
+    parser.add_argument('--level', type=float, default=0.95, choices=LEVELS, help='prediction interval level')
+    parser.add_argument('--currency', default=DEFAULT_CURRENCY, type=str.upper,
+                        help=f'currency to forecast (default: {DEFAULT_CURRENCY})')
+    parser.add_argument('--convert', action='store_true',
+                        help='convert the expenses in other currencies into --currency and include them')
+
+
+def run(args, parser):
+    from .database import connect
+    from .schema import migrate
+
+    from .fx import MissingRateError
+
+    connector = connect(args.database)
+    migrate(connector)
+    try:
+        prediction = forecast_spending(connector, args.months, args.level, args.currency, args.convert)
+    except MissingRateError as error:
+        parser.exit(1, f'{error}\n')
+    finally:
+        connector.close()
+
+    if prediction is None:
+        parser.exit(1, 'Not enough expenses to forecast\n')
+
+    def show(label, forecasts):
+        for forecast in forecasts:
+            print(f'{label:<20} {forecast.month}  {forecast.expected:>12,.2f}  ({forecast.low:,.2f} - {forecast.high:,.2f})')
+
+    show('Total', prediction.total)
+    for category, forecasts in sorted(prediction.categories.items(), key=lambda item: str(item[0])):
+        show(category or '(uncategorised)', forecasts)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
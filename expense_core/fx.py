@@ -0,0 +1,309 @@
+"""Exchange rates, and monthly totals converted into one reporting currency.
+
+Rates live in the FxRates table as "units of Currency per one unit of Base"
+on a date, the way central banks publish them.  They are loaded from CSV
+files in either layout:
+
+    Date,Currency,Rate              Date,USD,JPY,INR
+    2024-01-02,USD,1.0956           2024-01-02,1.0956,155.73,91.255
+    2024-01-02,JPY,155.73
+
+The first is read as quotes against --base (or a Base column), the second is
+the European Central Bank's history file with EUR as the base.
+
+`RateTable` keeps every quote in memory as sorted NumPy arrays per currency,
+so looking up the rates of a few hundred months is a handful of binary
+searches.  `converted_monthly_totals` converts MonthlyCategoryTotals with
+those arrays: totals in a foreign currency are converted at the average
+quoted rate of their month (the usual practice for spending and income), so
+no expense rows are read and nothing is converted row by row.  The
+converted totals are cached until an expense or a rate changes (see
+result_cache.py).  `converted_range_totals` does the same for a date range,
+taking the foreign totals a month at a time from the running daily totals.
+
+Command line usage:
+
+    expense-cli rates eurofxref-hist.csv
+    expense-cli rates rates.csv --base USD
+"""
+
+import argparse
+import csv
+import datetime
+
+import numpy as np
+
+from .money import DEFAULT_CURRENCY, currency_code, exponent, from_minor
+from .pivot import MonthlyPivot
+from .repository import ExpenseRepository, RangeTotal
+from .result_cache import cached
+
+INSERT_RATE = 'INSERT OR REPLACE INTO FxRates (Base, Currency, Date, Rate) VALUES (?, ?, ?, ?)'
+
+# Base of files in the wide layout that do not say otherwise (the ECB's)
+WIDE_BASE = 'EUR'
+
+CONVERTIBLE_TOTALS = (
+    "SELECT NULLIF(Month, ''), NULLIF(Category, ''), Currency, Total FROM MonthlyCategoryTotals ORDER BY Month, Category"
+)
+
+# The currencies with dated expenses, and their first and last day
+CURRENCY_DAYS = 'SELECT Currency, MIN(Day), MAX(Day) FROM DailyTotals GROUP BY Currency'
+
+
+class MissingRateError(LookupError):
+    pass
+
+
+# Loading rate files
+def read_rates(stream, base=None):
+    """(base, currency, ISO date, rate) tuples of a rate file in either layout."""
+    reader = csv.reader(stream)
+    header = [name.strip().lower() for name in next(reader)]
+
+    if 'currency' in header and 'rate' in header:
+        date_col, currency_col, rate_col = header.index('date'), header.index('currency'), header.index('rate')
+        base_col = header.index('base') if 'base' in header else None
+        if base_col is None and base is None:
+            raise ValueError('The rate file has no Base column; pass the base currency')
+        for row in reader:
+            if row and row[rate_col].strip():
+                row_base = row[base_col] if base_col is not None else base
+                yield currency_code(row_base), currency_code(row[currency_col]), row[date_col].strip()[:10], float(row[rate_col])
+        return
+
+    # Wide layout: a date column, then one column per currency
+    base = currency_code(base or WIDE_BASE)
+    currencies = [currency_code(name) if name else None for name in header[1:]]
+    for row in reader:
+        if not row:
+            continue
+        date = row[0].strip()[:10]
+        for currency, value in zip(currencies, row[1:]):
+            value = value.strip()
+            # The ECB leaves gaps (and 'N/A') for currencies it stopped quoting
+            if currency is not None and value and value.upper() != 'N/A':
+                yield base, currency, date, float(value)
+
+
+def import_rates(connector, path, base=None):
+    """Load the rates of a file into FxRates, replacing quotes for the same day; returns the count."""
+    with open(path, newline='', encoding='utf-8-sig') as stream:
+        rows = list(read_rates(stream, base))
+    connector.executemany(INSERT_RATE, rows)
+    connector.commit()
+    return len(rows)
+
+
+# The in-memory rate table
+class RateTable:
+    """Every quote of FxRates, indexed by base, currency and date."""
+
+    def __init__(self, rows):
+        """`rows` are (base, currency, ISO date, rate) tuples sorted by base, currency and date."""
+        self._series = {}
+        rows = list(rows)
+        if not rows:
+            return
+
+        bases, currencies, dates, rates = zip(*rows)
+        keys = list(zip(bases, currencies))
+        dates = np.array(dates, dtype='datetime64[D]')
+        rates = np.array(rates, dtype=float)
+
+        # Rows arrive grouped by (base, currency): split the arrays at each new pair
+        starts = [0] + [index for index in range(1, len(keys)) if keys[index] != keys[index - 1]] + [len(keys)]
+        for start, end in zip(starts, starts[1:]):
+            series_rates = rates[start:end]
+            self._series[keys[start]] = (dates[start:end], series_rates, np.concatenate(([0.0], np.cumsum(series_rates))))
+
+    @classmethod
+    def load(cls, connector):
+        return cls(connector.execute('SELECT Base, Currency, Date, Rate FROM FxRates ORDER BY Base, Currency, Date'))
+
+    def __len__(self):
+        return sum(len(dates) for dates, _, _ in self._series.values())
+
+    def _base_for(self, source, target):
+        # Direct quotes first, then cross rates through any other base
+        bases = {base for base, _ in self._series}
+        for base in [*(currency for currency in (source, target) if currency in bases), *sorted(bases)]:
+            if all(currency == base or (base, currency) in self._series for currency in (source, target)):
+                return base
+        raise MissingRateError(f'No exchange rates between {source} and {target}; import a rate file first')
+
+    def _monthly_per_base(self, base, currency, months):
+        # Units of `currency` per `base` for each month: the average quote of the
+        # month, else the last quote before it, else the first one there is.
+        # Undated totals (NaT) use the latest quote.
+        if currency == base:
+            return np.ones(len(months))
+
+        dates, rates, cumulative = self._series[base, currency]
+        undated = np.isnat(months)
+        months = np.where(undated, np.datetime64('1970-01', 'M'), months)
+        first = np.searchsorted(dates, months.astype('datetime64[D]'))
+        last = np.searchsorted(dates, (months + 1).astype('datetime64[D]'))
+
+        quotes = last - first
+        average = (cumulative[last] - cumulative[first]) / np.maximum(quotes, 1)
+        previous = rates[np.clip(last - 1, 0, len(rates) - 1)]
+        return np.where(undated, rates[-1], np.where(quotes > 0, average, previous))
+
+    def monthly_rates(self, source, target, months):
+        """Units of `target` per unit of `source` for each of `months` (datetime64[M], NaT for undated)."""
+        months = np.asarray(months, dtype='datetime64[M]')
+        if source == target:
+            return np.ones(len(months))
+        base = self._base_for(source, target)
+        return self._monthly_per_base(base, target, months) / self._monthly_per_base(base, source, months)
+
+    def rate(self, source, target, date):
+        """Units of `target` per unit of `source` in the month of `date`."""
+        return float(self.monthly_rates(source, target, [np.datetime64(str(date)[:7], 'M')])[0])
+
+
+# One RateTable per database file, reloaded when FxRates changes
+_rate_tables = {}
+
+
+def rates_version(connector):
+    """A value that changes whenever FxRates does, for keying caches."""
+    return connector.execute("SELECT Changes FROM ChangeCounter WHERE Name = 'FxRates'").fetchone()[0]
+
+
+def rate_table(connector):
+    """The RateTable of the database `connector` is open on, from memory unless FxRates has changed."""
+    database = connector.execute('PRAGMA database_list').fetchone()[2]
+    version = rates_version(connector)
+
+    cached = _rate_tables.get(database)
+    if cached is None or cached[0] != version or not database:
+        cached = _rate_tables[database] = (version, RateTable.load(connector))
+    return cached[1]
+
+
+def _converted_totals(connector, currency, rates):
+    # Months, categories and totals in minor units of `currency`, as arrays
+    rows = connector.execute(CONVERTIBLE_TOTALS).fetchall()
+    if not rows:
+        return np.array([], dtype=object), np.array([], dtype=object), np.array([], dtype=np.int64)
+
+    months, categories, currencies, totals = (np.array(column, dtype=object) for column in zip(*rows))
+    totals = totals.astype(np.int64)
+    month_numbers = np.array(months.tolist(), dtype='datetime64[M]')
+    amounts = np.zeros(len(rows))
+
+    for source in set(currencies.tolist()):
+        rows_in_source = currencies == source
+        amounts[rows_in_source] = totals[rows_in_source] / 10 ** exponent(source)
+        if source != currency:
+            if rates is None:
+                rates = rate_table(connector)
+            amounts[rows_in_source] *= rates.monthly_rates(source, currency, month_numbers[rows_in_source])
+
+    # Rows come ordered by month and category, one per currency: add up each run
+    same_as_previous = (months[1:] == months[:-1]) & (categories[1:] == categories[:-1])
+    starts = np.concatenate(([0], np.flatnonzero(~same_as_previous) + 1))
+    grouped = np.rint(np.add.reduceat(amounts, starts) * 10 ** exponent(currency)).astype(np.int64)
+    return months[starts], categories[starts], grouped
+
+
+@cached
+def converted_monthly_totals(connector, currency=DEFAULT_CURRENCY, rates=None):
+    """Like `ExpenseRepository.monthly_totals`, but with the spending in every currency converted into `currency`.
+
+    Raises MissingRateError when a currency has no rates against `currency`.
+    """
+    months, categories, totals = _converted_totals(connector, currency, rates)
+    return [(month, category, from_minor(total, currency))
+            for month, category, total in zip(months.tolist(), categories.tolist(), totals.tolist())]
+
+
+@cached
+def converted_monthly_pivot(connector, currency=DEFAULT_CURRENCY, rates=None):
+    """The converted monthly totals as a MonthlyPivot, for the summary and the chart."""
+    return MonthlyPivot.from_arrays(*_converted_totals(connector, currency, rates), currency)
+
+
+def _months(first, last):
+    # (first day, last day) of each calendar month from `first` to `last`, cut to them
+    while first <= last:
+        next_month = (first.replace(day=1) + datetime.timedelta(days=31)).replace(day=1)
+        yield first, min(last, next_month - datetime.timedelta(days=1))
+        first = next_month
+
+
+def converted_range_totals(connector, start=None, end=None, currency=DEFAULT_CURRENCY, rates=None):
+    """Like `ExpenseRepository.range_category_totals` and `range_total`, with the spending in every currency
+    converted into `currency` at the average rate of each month; (category rows, RangeTotal).
+
+    Raises MissingRateError when a currency has no rates against `currency`.
+    """
+    expenses = ExpenseRepository(connector)
+    start = datetime.date.fromisoformat(str(start)) if start is not None else None
+    end = datetime.date.fromisoformat(str(end)) if end is not None else None
+    amounts, entries = {}, {}
+
+    def add(rows, rate=1.0):
+        for category, row in rows:
+            amounts[category] = amounts.get(category, 0.0) + float(row.total) * rate
+            entries[category] = entries.get(category, 0) + row.expenses
+
+    for source, first, last in connector.execute(CURRENCY_DAYS).fetchall():
+        if source == currency:
+            add(expenses.range_category_totals(start, end, currency))
+            continue
+        first, last = datetime.date.fromisoformat(first), datetime.date.fromisoformat(last)
+        months = list(_months(max(first, start or first), min(last, end or last)))
+        if not months:
+            continue
+        if rates is None:
+            rates = rate_table(connector)
+        month_numbers = np.array([day.isoformat()[:7] for day, _ in months], dtype='datetime64[M]')
+        month_rates = rates.monthly_rates(source, currency, month_numbers)
+        for (month_start, month_end), rate in zip(months, month_rates.tolist()):
+            add(expenses.range_category_totals(month_start, month_end, source), rate)
+
+    scale = 10 ** exponent(currency)
+    totals = {category: round(amount * scale) for category, amount in amounts.items()}
+    rows = [(category, RangeTotal(from_minor(totals[category], currency), entries[category])) for category in totals]
+    rows.sort(key=lambda row: row[1].total, reverse=True)
+    return rows, RangeTotal(from_minor(sum(totals.values()), currency), sum(entries.values()))
+
+
+DESCRIPTION = 'Load exchange rates from CSV files.'
+
+
+def add_arguments(parser):
+    parser.add_argument('files', nargs='+', help='rate files, either Date,Currency,Rate rows or a Date column '
+                                                 'followed by one column per currency')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    parser.add_argument('--base', type=str.upper,
+                        help=f'currency the rates are quoted against (default: Base column, or {WIDE_BASE})')
+
+
+def run(args, parser):
+    from .database import connect
+    from .schema import migrate
+
+    connector = connect(args.database)
+    migrate(connector)
+    try:
+        for path in args.files:
+            try:
+                print(f'{path}: {import_rates(connector, path, args.base):,} rates')
+            except (OSError, ValueError) as error:
+                parser.exit(1, f'{path}: {error}\n')
+    finally:
+        connector.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""Bulk import of bank statements into ExpenseTracker.
+
+CSV exports and OFX/QFX statements are read as a stream, mapped onto the
+Date/Payee/Description/Amount/ModeOfPayment/Category/Currency columns and
+written with `executemany` in large transactions, so memory use is bounded by
+the batch size no matter how long the file is.  Amounts are parsed straight
+into integer minor units of their currency.
+
+Command line usage:
+
+    expense-cli import statement.csv --map Date="Posted Date" --map Payee=Merchant
+    expense-cli import statement.ofx --category Misc
+"""
+
+import argparse
+import csv
+import datetime
+import os
+import re
+import sys
+from itertools import islice
+
+from .database import connect
+from .money import DEFAULT_CURRENCY, currency_code, parse_minor
+from .repository import INSERT_EXPENSE
+from .schema import begin_bulk_load, end_bulk_load, migrate, settle_daily_totals
+
+FIELDS = ('Date', 'Payee', 'Description', 'Amount', 'ModeOfPayment', 'Category', 'Currency')
+
+# Rows written per executemany call and transaction
+BATCH_SIZE = 50000
+
+# Smallest import for which the indexes are dropped and rebuilt
+REBUILD_THRESHOLD = 50000
+
+# Header names bank exports commonly use for each of our columns
+COLUMN_ALIASES = {
+    'Date': ('date', 'transaction date', 'txn date', 'posted date', 'posting date', 'value date', 'booking date'),
+    'Payee': ('payee', 'merchant', 'name', 'beneficiary', 'counterparty', 'to'),
+    'Description': ('description', 'narration', 'details', 'memo', 'particulars', 'remarks', 'reference'),
+    'Amount': ('amount', 'debit', 'withdrawal', 'withdrawal amount', 'debit amount', 'amt'),
+    'ModeOfPayment': ('mode of payment', 'modeofpayment', 'mode', 'payment method', 'type', 'transaction type'),
+    'Category': ('category',),
+    'Currency': ('currency', 'ccy', 'currency code'),
+}
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%m/%d/%Y', '%d-%m-%Y', '%d.%m.%Y', '%Y/%m/%d', '%d %b %Y', '%d-%b-%Y', '%Y%m%d')
+
+ISO_DATE = re.compile(r'\d{4}-\d{2}-\d{2}$')
+
+# Everything but digits, sign and decimal point, e.g. currency symbols and thousands separators
+NOT_NUMERIC = re.compile(r'[^\d.\-]')
+
+
+class StatementError(ValueError):
+    pass
+
+
+# Field parsing
+class DateParser:
+    """Turns statement dates into the ISO dates the app stores, remembering the format that worked."""
+
+    # Statements repeat the same few thousand dates, so parsed dates are cached
+    CACHE_SIZE = 100000
+
+    def __init__(self, date_format=None):
+        self.date_format = date_format
+        self._cache = {}
+
+    def __call__(self, value):
+        try:
+            return self._cache[value]
+        except KeyError:
+            pass
+
+        if len(self._cache) >= self.CACHE_SIZE:
+            self._cache.clear()
+        parsed = self._cache[value] = self._parse(value.strip())
+        return parsed
+
+    def _parse(self, value):
+        if self.date_format is None and ISO_DATE.match(value):
+            return value
+        if self.date_format is not None:
+            return datetime.datetime.strptime(value, self.date_format).date().isoformat()
+
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.datetime.strptime(value, date_format)
+            except ValueError:
+                continue
+            self.date_format = date_format
+            return parsed.date().isoformat()
+
+        raise StatementError(f'Unrecognised date {value!r}; pass the format explicitly')
+
+
+def parse_amount(value, currency=DEFAULT_CURRENCY):
+    """Integer minor units of a statement amount such as '1234.50', '₹1,234.50' or '(12.00)'."""
+    try:
+        return parse_minor(value, currency)
+    except ValueError:
+        pass
+
+    value = value.strip()
+    negative = value.startswith('(') and value.endswith(')')
+    digits = NOT_NUMERIC.sub('', value)
+    if not any(character.isdigit() for character in digits):
+        raise ValueError(f'Not an amount: {value!r}')
+    amount = parse_minor(digits, currency)
+    return -amount if negative else amount
+
+
+# Readers.  Both yield tuples in FIELDS order.
+def detect_columns(header, mapping=None):
+    """Map each of FIELDS to a column index of `header`, using `mapping` ({field: header name}) first."""
+    normalised = [name.strip().lower() for name in header]
+    columns = {}
+
+    for field in FIELDS:
+        if mapping and field in mapping:
+            wanted = mapping[field].strip().lower()
+            if wanted not in normalised:
+                raise StatementError(f'Column {mapping[field]!r} for {field} is not in the file header')
+            columns[field] = normalised.index(wanted)
+            continue
+
+        for alias in COLUMN_ALIASES[field]:
+            if alias in normalised:
+                columns[field] = normalised.index(alias)
+                break
+
+    for field in ('Date', 'Amount'):
+        if field not in columns:
+            raise StatementError(f'Could not find a {field} column; map it explicitly')
+    return columns
+
+
+def read_csv(stream, mapping=None, date_format=None, mode='Bank Import', category='Misc', delimiter=',',
+             currency=DEFAULT_CURRENCY):
+    reader = csv.reader(stream, delimiter=delimiter)
+    header = next(reader)
+    columns = detect_columns(header, mapping)
+    parse_date = DateParser(date_format)
+
+    date_col = columns['Date']
+    amount_col = columns['Amount']
+    # A missing optional column reads as the empty string at the end of the row,
+    # as do the cells missing from rows shorter than the header
+    payee_col, desc_col, mode_col, category_col, currency_col = (
+        columns.get(field, -1) for field in ('Payee', 'Description', 'ModeOfPayment', 'Category', 'Currency')
+    )
+
+    for line_no, row in enumerate(reader, start=2):
+        if not any(row):
+            continue
+        if len(row) <= max(date_col, amount_col):
+            raise StatementError(f'Line {line_no}: {len(row)} columns where the header has {len(header)}')
+        # Rows without a date, or without an amount like the credits of an
+        # export with separate debit and credit columns, are no expenses
+        if not row[date_col].strip() or not row[amount_col].strip():
+            continue
+        row += [''] * (len(header) - len(row)) + ['']
+        try:
+            row_currency = currency_code(row[currency_col]) if row[currency_col] else currency
+            yield (
+                parse_date(row[date_col]),
+                row[payee_col],
+                row[desc_col],
+                parse_amount(row[amount_col], row_currency),
+                row[mode_col] or mode,
+                row[category_col] or category,
+                row_currency,
+            )
+        except (ValueError, IndexError) as error:
+            raise StatementError(f'Line {line_no}: {error}') from None
+
+
+def read_ofx(stream, mode='Bank Import', category='Misc', block_size=1 << 20, currency=DEFAULT_CURRENCY):
+    """Statement transactions (<STMTTRN>) of an OFX/QFX file, SGML or XML flavoured.
+
+    Amounts are in the statement's <CURDEF> currency, or `currency` if it has none.
+    """
+    transaction = None
+    pending = ''
+
+    while True:
+        block = stream.read(block_size)
+        tokens = (pending + block).split('<')
+        # The last token may continue in the next block
+        pending = tokens.pop() if block else ''
+
+        for token in tokens:
+            tag, _, value = token.partition('>')
+            tag = tag.strip().upper()
+            value = value.strip()
+
+            if tag == 'CURDEF' and value:
+                currency = currency_code(value)
+            elif tag == 'STMTTRN':
+                transaction = {}
+            elif tag == '/STMTTRN' and transaction is not None:
+                if 'DTPOSTED' in transaction and 'TRNAMT' in transaction:
+                    posted = transaction['DTPOSTED'][:8]
+                    yield (
+                        f'{posted[:4]}-{posted[4:6]}-{posted[6:8]}',
+                        transaction.get('NAME', ''),
+                        transaction.get('MEMO', ''),
+                        # Debits are negative in OFX, expenses are positive here
+                        -parse_amount(transaction['TRNAMT'], currency),
+                        transaction.get('TRNTYPE', '').title() or mode,
+                        category,
+                        currency,
+                    )
+                transaction = None
+            elif transaction is not None and tag and not tag.startswith('/'):
+                transaction[tag] = value
+
+        if not block:
+            break
+
+
+# Writing
+def import_rows(connector, rows, batch_size=BATCH_SIZE, progress=None, rebuild_indexes=False):
+    """Insert `rows` in batches of `batch_size`, one transaction each; returns the row count.
+
+    With `rebuild_indexes` the secondary indexes and the rollup triggers are
+    dropped for the load and everything is rebuilt afterwards, which is much
+    faster when adding many rows.
+    """
+    imported = 0
+    rows = iter(rows)
+
+    if rebuild_indexes:
+        begin_bulk_load(connector)
+        connector.commit()
+
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            try:
+                connector.executemany(INSERT_EXPENSE, batch)
+                connector.commit()
+            except Exception:
+                connector.rollback()
+                raise
+
+            imported += len(batch)
+            if progress is not None:
+                progress(imported)
+
+        if not rebuild_indexes:
+            # Once for the whole import rather than per batch; a bulk load rebuilds them instead
+            settle_daily_totals(connector)
+            connector.commit()
+    finally:
+        if rebuild_indexes:
+            end_bulk_load(connector)
+            connector.commit()
+
+    return imported
+
+
+def estimate_rows(path, sample_size=1 << 16):
+    with open(path, 'rb') as stream:
+        sample = stream.read(sample_size)
+    return os.path.getsize(path) * sample.count(b'\n') // max(len(sample), 1)
+
+
+def import_file(connector, path, file_format=None, mapping=None, date_format=None, mode='Bank Import',
+                category='Misc', batch_size=BATCH_SIZE, progress=None, rebuild_indexes=None,
+                currency=DEFAULT_CURRENCY):
+    """Import a CSV or OFX/QFX statement; `progress(rows_imported, fraction_of_file_read)` is called per batch.
+
+    `currency` applies to rows the statement does not give a currency for.
+
+    By default the indexes are rebuilt when the file looks like at least half
+    as many rows as the table already has; below that, updating them in place
+    is cheaper than rebuilding them over the whole table.
+    """
+    if file_format is None:
+        file_format = 'ofx' if os.path.splitext(path)[1].lower() in ('.ofx', '.qfx') else 'csv'
+
+    if rebuild_indexes is None:
+        existing = connector.execute('SELECT MAX(ID) FROM ExpenseTracker').fetchone()[0] or 0
+        estimated = estimate_rows(path)
+        rebuild_indexes = estimated >= REBUILD_THRESHOLD and estimated * 2 > existing
+
+    total_size = os.path.getsize(path) or 1
+
+    with open(path, newline='', encoding='utf-8-sig', errors='replace') as stream:
+        if file_format == 'ofx':
+            rows = read_ofx(stream, mode=mode, category=category, currency=currency)
+        else:
+            rows = read_csv(stream, mapping=mapping, date_format=date_format, mode=mode, category=category,
+                            currency=currency)
+
+        def report(imported):
+            if progress is not None:
+                # The text file position is not available while iterating, the buffer position is close enough
+                progress(imported, min(stream.buffer.tell() / total_size, 1.0))
+
+        return import_rows(connector, rows, batch_size=batch_size, progress=report, rebuild_indexes=rebuild_indexes)
+
+
+# Command line
+def parse_mapping(pairs):
+    mapping = {}
+    for pair in pairs or ():
+        field, separator, column = pair.partition('=')
+        if not separator or field not in FIELDS:
+            raise argparse.ArgumentTypeError(f'--map expects FIELD=Column with FIELD one of {", ".join(FIELDS)}')
+        mapping[field] = column
+    return mapping
+
+
+DESCRIPTION = 'Import bank statements into the expense tracker.'
+
+
+def add_arguments(parser):
+    parser.add_argument('files', nargs='+', help='CSV or OFX/QFX statements')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    parser.add_argument('--format', choices=('csv', 'ofx'), help='file format (default: by extension)')
+    parser.add_argument('--map', action='append', metavar='FIELD=COLUMN', help='CSV column to use for a field')
+    parser.add_argument('--date-format', help='strptime format of the CSV dates (default: detected)')
+    parser.add_argument('--mode', default='Bank Import', help='mode of payment for rows without one')
+    parser.add_argument('--category', default='Misc', help='category for rows without one')
+    parser.add_argument('--currency', default=DEFAULT_CURRENCY, type=str.upper,
+                        help=f'currency of rows without one (default: {DEFAULT_CURRENCY})')
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='rows per transaction')
+    parser.add_argument('--rebuild-indexes', action=argparse.BooleanOptionalAction, default=None,
+                        help='drop the indexes during the load (default: when the file is big)')
+
+
+def run(args, parser):
+    try:
+        mapping = parse_mapping(args.map)
+    except argparse.ArgumentTypeError as error:
+        parser.error(str(error))
+
+    connector = connect(args.database)
+    migrate(connector)
+
+    def progress(imported, fraction):
+        print(f'\r  {imported:,} rows ({fraction:.0%})', end='', file=sys.stderr, flush=True)
+
+    start = datetime.datetime.now()
+    total = 0
+    try:
+        for path in args.files:
+            print(path, file=sys.stderr)
+            total += import_file(connector, path, file_format=args.format, mapping=mapping, date_format=args.date_format,
+                                 mode=args.mode, category=args.category, batch_size=args.batch_size, progress=progress,
+                                 rebuild_indexes=args.rebuild_indexes, currency=args.currency)
+            print(file=sys.stderr)
+    except StatementError as error:
+        print(file=sys.stderr)
+        parser.exit(1, f'{path}: {error}\n')
+    finally:
+        connector.close()
+
+    seconds = (datetime.datetime.now() - start).total_seconds()
+    print(f'Imported {total:,} rows in {seconds:.1f}s ({total / max(seconds, 1e-9):,.0f} rows/s)')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
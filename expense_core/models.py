@@ -0,0 +1,73 @@
+"""Typed records for the rows of ExpenseTracker."""
+
+import datetime
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Optional
+
+from .money import DEFAULT_CURRENCY, currency_code, from_minor, to_decimal, to_minor
+
+# Column order of ExpenseTracker, and of the rows `Expense.from_row` accepts
+COLUMNS = ('ID', 'Date', 'Payee', 'Description', 'Amount', 'ModeOfPayment', 'Category', 'Currency')
+
+# Expense attribute for each column
+FIELD_COLUMNS = {
+    'date': 'Date',
+    'payee': 'Payee',
+    'description': 'Description',
+    'amount': 'Amount',
+    'mode_of_payment': 'ModeOfPayment',
+    'category': 'Category',
+    'currency': 'Currency',
+}
+
+
+@dataclass
+class Expense:
+    date: datetime.date
+    payee: str
+    description: str
+    # Anything `to_decimal` accepts; always a Decimal once the Expense exists
+    amount: Decimal
+    mode_of_payment: str = 'Cash'
+    category: Optional[str] = None
+    currency: str = DEFAULT_CURRENCY
+    # None until the expense has been stored
+    id: Optional[int] = None
+
+    def __post_init__(self):
+        if self.amount is not None:
+            self.amount = to_decimal(self.amount)
+        self.currency = currency_code(self.currency)
+
+    @classmethod
+    def from_row(cls, row):
+        """Build an Expense from a row in COLUMNS order."""
+        expense_id, date, payee, description, amount, mode_of_payment, category, currency = row
+        if isinstance(date, str):
+            date = datetime.date.fromisoformat(date[:10])
+        return cls(date, payee, description, from_minor(amount, currency), mode_of_payment, category, currency,
+                   expense_id)
+
+    def values(self):
+        """Column values without the ID, in COLUMNS order."""
+        return (to_column('date', self.date), self.payee, self.description,
+                to_column('amount', self.amount, self.currency), self.mode_of_payment, self.category, self.currency)
+
+
+def to_column(field, value, currency=DEFAULT_CURRENCY):
+    # Dates are stored as ISO strings and amounts as minor units of `currency`
+    if field == 'date' and isinstance(value, datetime.date):
+        return value.isoformat()
+    if field == 'currency':
+        return currency_code(value)
+    if field == 'amount' and value is not None:
+        return to_minor(value, currency)
+    return value
+
+
+def display_row(row):
+    """A row in COLUMNS order as the Treeview shows it, with the amount as a decimal."""
+    amount_index = COLUMNS.index('Amount')
+    currency = row[COLUMNS.index('Currency')]
+    return (*row[:amount_index], from_minor(row[amount_index], currency), *row[amount_index + 1:])
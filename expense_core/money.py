@@ -0,0 +1,92 @@
+"""Exact money amounts.
+
+ExpenseTracker stores amounts as INTEGER minor units of the row's currency
+(paise, cents, ...), so sums are exact integer arithmetic in SQLite.  Python
+code deals in `decimal.Decimal` and converts at the boundary with `to_minor`
+and `from_minor`; floats never take part in storing or adding up amounts.
+"""
+
+from decimal import ROUND_HALF_EVEN, Decimal, InvalidOperation
+
+DEFAULT_CURRENCY = 'INR'
+
+# Digits after the decimal point for currencies that do not use two
+# (ISO 4217 minor units)
+CURRENCY_EXPONENTS = {
+    'BHD': 3, 'CLP': 0, 'IQD': 3, 'ISK': 0, 'JOD': 3, 'JPY': 0, 'KRW': 0, 'KWD': 3, 'LYD': 3, 'OMR': 3,
+    'PYG': 0, 'TND': 3, 'UGX': 0, 'VND': 0, 'XAF': 0, 'XOF': 0,
+}
+
+
+# Symbols the GUI puts in front of amounts; other currencies show their code
+CURRENCY_SYMBOLS = {'EUR': '€', 'GBP': '£', 'INR': '₹', 'JPY': '¥', 'USD': '$'}
+
+
+def exponent(currency):
+    return CURRENCY_EXPONENTS.get(currency, 2)
+
+
+def currency_code(value):
+    """Upper-case ISO 4217 code of `value`, e.g. ' usd' -> 'USD'."""
+    code = str(value).strip().upper()
+    if len(code) != 3 or not code.isalpha():
+        raise ValueError(f'{value!r} is not a three letter currency code')
+    return code
+
+
+def format_amount(amount, currency=DEFAULT_CURRENCY):
+    """`amount` with the currency's symbol (or code) and decimal places, e.g. '₹1250.50'."""
+    text = f'{amount:.{exponent(currency)}f}'
+    symbol = CURRENCY_SYMBOLS.get(currency)
+    return f'{symbol}{text}' if symbol else f'{text} {currency}'
+
+
+def to_decimal(value):
+    """Decimal of an amount given as a Decimal, int, float or text like '1,234.50'."""
+    if isinstance(value, Decimal):
+        amount = value
+    elif isinstance(value, int):
+        amount = Decimal(value)
+    elif isinstance(value, float):
+        # The shortest repr is what was typed, e.g. 0.1 rather than 0.1000000000000000055...
+        amount = Decimal(repr(value))
+    else:
+        try:
+            amount = Decimal(str(value).strip().replace(',', ''))
+        except InvalidOperation:
+            raise ValueError(f'{value!r} is not an amount') from None
+
+    if not amount.is_finite():
+        raise ValueError(f'{value!r} is not an amount')
+    return amount
+
+
+def to_minor(value, currency=DEFAULT_CURRENCY, exact=True):
+    """Integer minor units of an amount.
+
+    With `exact` an amount with more decimal places than the currency has is
+    an error; otherwise it is rounded half to even.
+    """
+    scaled = to_decimal(value).scaleb(exponent(currency))
+    integral = scaled.to_integral_value(rounding=ROUND_HALF_EVEN)
+    if exact and integral != scaled:
+        raise ValueError(f'{currency} amounts have at most {exponent(currency)} decimal places, got {value}')
+    return int(integral)
+
+
+def from_minor(minor, currency=DEFAULT_CURRENCY):
+    """Decimal amount of `minor` units, e.g. 1250 INR -> Decimal('12.50')."""
+    if minor is None:
+        return None
+    return Decimal(minor).scaleb(-exponent(currency))
+
+
+def parse_minor(text, currency=DEFAULT_CURRENCY):
+    """Minor units of a plain decimal string such as '-1234.5', without going through Decimal when possible."""
+    places = exponent(currency)
+    whole, _, fraction = text.partition('.')
+    digits = whole[1:] if whole[:1] in '+-' else whole
+    if digits.isdigit() and len(fraction) <= places and (not fraction or fraction.isdigit()):
+        minor = int(digits) * 10 ** places + int(fraction.ljust(places, '0') or 0)
+        return -minor if whole[:1] == '-' else minor
+    return to_minor(text, currency)
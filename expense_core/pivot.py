@@ -0,0 +1,109 @@
+"""Monthly totals as a dense month x category matrix.
+
+The rollup queries return one (month, category, total) row per pair with any
+spending.  `MonthlyPivot` lays those rows out as an int64 NumPy matrix of
+minor units, with whatever months and categories occur in the data, so the
+summary and the chart work on whole rows and columns instead of building
+nested dicts with a fixed list of categories.  Building one is a sort of the
+labels and a single scatter-add, which stays fast with thousands of months
+and categories.
+"""
+
+from itertools import groupby
+
+import numpy as np
+
+from .money import DEFAULT_CURRENCY, exponent, from_minor, to_minor
+
+# Label of the column `top_categories` folds the smaller categories into
+OTHER = 'Other'
+
+
+def _discover(labels):
+    # Sorted distinct labels, with None (and '') last, and each label's position
+    labels = np.asarray(labels, dtype=object)
+    keys = np.where(np.equal(labels, None), '', labels).astype(str)
+    names, index = np.unique(keys, return_inverse=True)
+    if len(names) and names[0] == '':
+        names = np.append(names[1:], names[:1])
+        index = (index - 1) % len(names)
+    return [name or None for name in names.tolist()], index.reshape(-1)
+
+
+class MonthlyPivot:
+    """Totals in minor units of `currency`: `totals[i, j]` is spent in `months[i]` on `categories[j]`.
+
+    Months ('YYYY-MM') and categories are sorted; undated and uncategorised
+    spending comes last under None.
+    """
+
+    def __init__(self, months, categories, totals, currency=DEFAULT_CURRENCY):
+        self.months = months
+        self.categories = categories
+        self.totals = totals
+        self.currency = currency
+
+    @classmethod
+    def from_arrays(cls, months, categories, totals, currency=DEFAULT_CURRENCY):
+        """Pivot of parallel sequences of months, categories and totals in minor units; repeated pairs are added up."""
+        month_names, month_index = _discover(months)
+        category_names, category_index = _discover(categories)
+        matrix = np.zeros((len(month_names), len(category_names)), dtype=np.int64)
+        np.add.at(matrix, (month_index, category_index), np.asarray(totals, dtype=np.int64))
+        return cls(month_names, category_names, matrix, currency)
+
+    @classmethod
+    def from_rows(cls, rows, currency=DEFAULT_CURRENCY):
+        """Pivot of (month, category, amount) rows such as `ExpenseRepository.monthly_totals` returns."""
+        rows = list(rows)
+        if not rows:
+            return cls([], [], np.zeros((0, 0), dtype=np.int64), currency)
+        months, categories, amounts = zip(*rows)
+        return cls.from_arrays(months, categories, [to_minor(amount, currency) for amount in amounts], currency)
+
+    def __len__(self):
+        return len(self.months)
+
+    def amount(self, minor):
+        """Decimal amount of a total taken from the matrix."""
+        return from_minor(int(minor), self.currency)
+
+    def amounts(self):
+        """The matrix as floats in the currency's major unit, for plotting."""
+        return self.totals / 10 ** exponent(self.currency)
+
+    def month_totals(self):
+        return self.totals.sum(axis=1)
+
+    def category_totals(self):
+        return self.totals.sum(axis=0)
+
+    def total(self):
+        return self.amount(self.totals.sum())
+
+    def years(self):
+        """(year, first month index, end month index) of each year, with None for the undated totals."""
+        ranges = []
+        start = 0
+        for year, months in groupby(self.months, key=lambda month: month[:4] if month else None):
+            end = start + len(list(months))
+            ranges.append((year, start, end))
+            start = end
+        return ranges
+
+    def cells(self, month_index):
+        """(category, Decimal amount) of the categories with spending in one month."""
+        row = self.totals[month_index]
+        return [(self.categories[j], self.amount(row[j])) for j in np.flatnonzero(row)]
+
+    def top_categories(self, count):
+        """Pivot of the `count` - 1 biggest categories, with the rest added up into one 'Other' column."""
+        if len(self.categories) <= count:
+            return self
+        ranking = np.argsort(-self.category_totals(), kind='stable')
+        # A category that is itself called Other goes into the Other column
+        keep = sorted([j for j in ranking.tolist() if self.categories[j] != OTHER][:count - 1])
+        rest = np.ones(len(self.categories), dtype=bool)
+        rest[keep] = False
+        totals = np.column_stack([self.totals[:, keep], self.totals[:, rest].sum(axis=1)])
+        return MonthlyPivot(self.months, [self.categories[j] for j in keep] + [OTHER], totals, self.currency)
@@ -0,0 +1,347 @@
+"""Reading, writing and aggregating expenses.
+
+`ExpenseRepository` wraps a connection from `connect` and is what the GUI
+scripts, the command line and the exporter use instead of writing SQL of
+their own.  Every write is committed straight away, like the scripts did;
+the `stage_*` methods leave that to the caller, which lets write_queue.py
+commit many writes together.
+Amounts go in and come out as Decimals; totals are per currency.
+
+Listings also read the archived years (see archive.py) that their date range
+touches; archived expenses cannot be changed.
+
+Totals between two dates come from the running sums of DailyTotals and
+DailyCategoryTotals (see schema.py), so a week costs about the same as ten
+years.
+"""
+
+import datetime
+import re
+from decimal import Decimal
+from typing import NamedTuple
+
+from .archive import ArchivedExpenseError, archived_year, partitions
+from .models import COLUMNS, FIELD_COLUMNS, Expense, to_column
+from .result_cache import cached
+from .money import DEFAULT_CURRENCY, currency_code, from_minor, to_minor
+from .schema import DATA_VERSION, MONTHLY_TOTALS
+
+INSERT_EXPENSE = 'INSERT INTO ExpenseTracker (Date, Payee, Description, Amount, ModeOfPayment, Category, Currency) VALUES (?, ?, ?, ?, ?, ?, ?)'
+
+CATEGORY_TOTALS = "SELECT NULLIF(Category, ''), SUM(Total) FROM MonthlyCategoryTotals WHERE Currency = ? GROUP BY Category ORDER BY SUM(Total) DESC"
+
+# Running sums up to and including a day, overall and for every category
+RUNNING_TOTAL = 'SELECT RunningTotal, RunningEntries FROM DailyTotals WHERE Currency = ? AND Day <= ? ORDER BY Day DESC LIMIT 1'
+
+# The same added up day by day, after the last settled day
+DAYS_TOTAL = 'SELECT IFNULL(SUM(Total), 0), IFNULL(SUM(Entries), 0) FROM DailyTotals WHERE Currency = ? AND Day > ? AND Day <= ?'
+
+DAYS_CATEGORY_TOTALS = (
+    "SELECT NULLIF(Category, ''), SUM(Total), SUM(Entries) FROM DailyCategoryTotals "
+    "WHERE Currency = ? AND Day > ? AND Day <= ? GROUP BY Category"
+)
+
+RUNNING_CATEGORY_TOTALS = """
+    SELECT NULLIF(Categories.Category, ''), IFNULL(Running.RunningTotal, 0), IFNULL(Running.RunningEntries, 0)
+    FROM (SELECT DISTINCT Category FROM MonthlyCategoryTotals WHERE Currency = :currency) AS Categories
+    LEFT JOIN DailyCategoryTotals AS Running
+    ON Running.Category = Categories.Category AND Running.Currency = :currency AND Running.Day = (
+        SELECT MAX(Day) FROM DailyCategoryTotals WHERE Category = Categories.Category AND Currency = :currency AND Day <= :day
+    )
+"""
+
+# Later than any date in the ledger
+LAST_DAY = '9999-12-31'
+
+
+class RangeTotal(NamedTuple):
+    """What was spent in a date range, and on how many expenses."""
+    total: Decimal
+    expenses: int
+
+
+def _range_days(start, end):
+    # The day whose running sums are subtracted (None for an open start) and
+    # the day whose running sums are taken
+    before = None
+    if start is not None:
+        before = (datetime.date.fromisoformat(str(start)) - datetime.timedelta(days=1)).isoformat()
+    return before, str(end) if end is not None else LAST_DAY
+
+
+def _settled_until(connector):
+    # The last day whose running sums are current: the one before the
+    # earliest day changed since they were last settled
+    row = connector.execute("SELECT date(Since, '-1 day') FROM UnsettledDays").fetchone()
+    return row[0] if row is not None else LAST_DAY
+
+
+class ExpenseFilter(NamedTuple):
+    """A filtered view of ExpenseTracker: FROM clause, WHERE conditions and their parameters.
+
+    `source` is the FROM clause of one partition, with `{schema}` standing for
+    its schema name; `date_range` decides which archives are read.
+    `id_column` stands in for ExpenseTracker.ID when ordering or paging by ID.
+    With a text search it is the rowid of ExpenseSearch, which lets SQLite
+    walk the full-text matches in ID order and stop after one page.
+    """
+    source: str = '{schema}.ExpenseTracker AS ExpenseTracker'
+    conditions: tuple = ()
+    params: tuple = ()
+    id_column: str = 'ExpenseTracker.ID'
+    date_range: tuple = (None, None)
+
+
+def match_expression(text):
+    """FTS5 query matching expenses whose Payee or Description has words starting with every word of `text`."""
+    words = re.findall(r'\w+', text or '')
+    return ' '.join(f'"{word}"*' for word in words) or None
+
+
+def expense_filter(text=None, start=None, end=None, categories=None, min_amount=None, max_amount=None, currency=None):
+    """Expenses matching `text`, dated between `start` and `end` (inclusive ISO dates), in `categories`,
+    costing between `min_amount` and `max_amount` and paid in `currency`.  Filters that are None are left out.
+
+    Amount bounds are in `currency`.  Amounts in different currencies do not
+    compare, so with a bound and no currency only DEFAULT_CURRENCY expenses match.
+    """
+    source = '{schema}.ExpenseTracker AS ExpenseTracker'
+    id_column = 'ExpenseTracker.ID'
+    conditions = []
+    params = []
+
+    match = match_expression(text)
+    if match is not None:
+        source = ('{schema}.ExpenseSearch AS ExpenseSearch '
+                  'JOIN {schema}.ExpenseTracker AS ExpenseTracker ON ExpenseTracker.ID = ExpenseSearch.rowid')
+        id_column = 'ExpenseSearch.rowid'
+        conditions.append('ExpenseSearch MATCH ?')
+        params.append(match)
+    if start is not None:
+        conditions.append('ExpenseTracker.Date >= ?')
+        params.append(str(start))
+    if end is not None:
+        conditions.append('ExpenseTracker.Date <= ?')
+        params.append(str(end))
+    if categories:
+        conditions.append(f'ExpenseTracker.Category IN ({", ".join("?" * len(categories))})')
+        params.extend(categories)
+    if currency is None and (min_amount is not None or max_amount is not None):
+        currency = DEFAULT_CURRENCY
+    if currency is not None:
+        conditions.append('ExpenseTracker.Currency = ?')
+        params.append(currency)
+    if min_amount is not None:
+        conditions.append('ExpenseTracker.Amount >= ?')
+        params.append(to_minor(min_amount, currency, exact=False))
+    if max_amount is not None:
+        conditions.append('ExpenseTracker.Amount <= ?')
+        params.append(to_minor(max_amount, currency, exact=False))
+
+    return ExpenseFilter(source, tuple(conditions), tuple(params), id_column, (start, end))
+
+
+def partitioned_query(connector, expense_filter, columns=COLUMNS, condition=None, params=(), expressions=None):
+    """SELECT of `columns` from the expenses matching `expense_filter`, and its parameters.
+
+    There is one SELECT per partition (the main database and the archives the
+    filter's dates reach) joined with UNION ALL, each with the filter and
+    `condition` (whose `params` are repeated per partition).  Columns keep
+    their names, which is what an ORDER BY added to the query refers to;
+    `expressions` ({column: SQL}) selects an expression under a column's name
+    instead, so that the query can be ordered by it.
+    """
+    expressions = expressions or {}
+    names = ', '.join(f'{expense_filter.id_column} AS ID' if column == 'ID' else
+                      f'{expressions.get(column, f"ExpenseTracker.{column}")} AS {column}' for column in columns)
+    conditions = [*expense_filter.conditions, condition] if condition else expense_filter.conditions
+    where = f' WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    schemas = partitions(connector, *expense_filter.date_range)
+    sql = ' UNION ALL '.join(f'SELECT {names} FROM {expense_filter.source.format(schema=schema)}{where}'
+                             for schema in schemas)
+    return sql, [*expense_filter.params, *params] * len(schemas)
+
+
+def select_expenses(connector, start=None, end=None, categories=None, order_by=None, limit=None, text=None,
+                    min_amount=None, max_amount=None, currency=None):
+    """Cursor over the expenses matching the `expense_filter` arguments.
+
+    Rows are plain tuples in COLUMNS order, with amounts in minor units.
+    `order_by` names COLUMNS, e.g. 'Date, ID'; without it rows come in
+    whatever order is cheapest.
+    """
+    sql, params = partitioned_query(
+        connector, expense_filter(text, start, end, categories, min_amount, max_amount, currency)
+    )
+
+    if order_by is not None:
+        sql += f' ORDER BY {order_by}'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return connector.execute(sql, params)
+
+
+class ExpenseRepository:
+    def __init__(self, connector):
+        self.connector = connector
+
+    # Writes in the current transaction, without committing
+    def stage_add(self, expense):
+        """Insert `expense` and return its new ID."""
+        return self.connector.execute(INSERT_EXPENSE, expense.values()).lastrowid
+
+    def stage_update(self, expense_id, **changes):
+        """Change the given fields and return False if the expense is not in ExpenseTracker."""
+        unknown = set(changes) - set(FIELD_COLUMNS)
+        if unknown:
+            raise TypeError(f'Unknown expense fields: {", ".join(sorted(unknown))}')
+        if not changes:
+            return True
+
+        # A new amount is in the new currency if there is one, else in the stored one
+        currency = currency_code(changes['currency']) if 'currency' in changes else None
+        if 'amount' in changes and currency is None:
+            row = self.connector.execute('SELECT Currency FROM ExpenseTracker WHERE ID = ?', (expense_id,)).fetchone()
+            currency = row[0] if row is not None else DEFAULT_CURRENCY
+
+        assignments = ', '.join(f'{FIELD_COLUMNS[field]} = ?' for field in changes)
+        values = [to_column(field, value, currency) for field, value in changes.items()]
+        return self.connector.execute(f'UPDATE ExpenseTracker SET {assignments} WHERE ID = ?', (*values, expense_id)).rowcount > 0
+
+    def stage_delete(self, expense_id):
+        """Delete the expense and return False if it is not in ExpenseTracker."""
+        return self.connector.execute('DELETE FROM ExpenseTracker WHERE ID = ?', (expense_id,)).rowcount > 0
+
+    def check_archived(self, expense_id):
+        """Raise ArchivedExpenseError if the expense is in a read-only archive; commits first."""
+        # Archives cannot be attached inside a transaction
+        self.connector.commit()
+        year = archived_year(self.connector, expense_id)
+        if year is not None:
+            raise ArchivedExpenseError(f'The expenses of {year} are archived and can no longer be changed')
+
+    # Single expenses
+    def add(self, expense):
+        """Store `expense` and return it with its new ID."""
+        expense_id = self.stage_add(expense)
+        self.connector.commit()
+        expense.id = expense_id
+        return expense
+
+    def add_many(self, expenses):
+        """Store `expenses` in one transaction and return them with their new IDs; nothing is stored on error."""
+        try:
+            ids = [self.stage_add(expense) for expense in expenses]
+        except BaseException:
+            self.connector.rollback()
+            raise
+        self.connector.commit()
+        for expense, expense_id in zip(expenses, ids):
+            expense.id = expense_id
+        return expenses
+
+    def get(self, expense_id):
+        sql, params = partitioned_query(self.connector, ExpenseFilter(), condition='ExpenseTracker.ID = ?',
+                                        params=(expense_id,))
+        row = self.connector.execute(sql, params).fetchone()
+        return Expense.from_row(row) if row is not None else None
+
+    def update(self, expense_id, **changes):
+        """Change the given fields, e.g. `update(7, amount='12.50', category='Food')`."""
+        if not self.stage_update(expense_id, **changes):
+            # An expense that is not in ExpenseTracker may be in a read-only archive
+            self.check_archived(expense_id)
+        self.connector.commit()
+
+    def delete(self, expense_id):
+        if not self.stage_delete(expense_id):
+            self.check_archived(expense_id)
+        self.connector.commit()
+
+    def delete_all(self):
+        """Delete every expense of the ledger; archived years are kept."""
+        self.connector.execute('DELETE FROM ExpenseTracker')
+        self.connector.commit()
+
+    # Listings
+    def list(self, start=None, end=None, categories=None, limit=None, text=None, min_amount=None, max_amount=None,
+             currency=None):
+        """Expenses in date order, optionally filtered like `expense_filter`."""
+        cursor = select_expenses(self.connector, start, end, categories, order_by='Date, ID', limit=limit, text=text,
+                                 min_amount=min_amount, max_amount=max_amount, currency=currency)
+        return [Expense.from_row(row) for row in cursor]
+
+    def data_version(self):
+        """A value that changes whenever an expense is added, edited or deleted, for keying caches."""
+        return self.connector.execute(DATA_VERSION).fetchone()
+
+    def count(self):
+        return self.connector.execute("SELECT IFNULL(SUM(Entries), 0) FROM MonthlyCategoryTotals").fetchone()[0]
+
+    # Aggregations, all read from the MonthlyCategoryTotals rollup and cached
+    # until the ledger changes (see result_cache.py).  Totals are Decimals and
+    # only cover the expenses paid in `currency`.
+    @cached
+    def monthly_totals(self, currency=DEFAULT_CURRENCY):
+        """(month 'YYYY-MM', category, total) rows in month order; undated or uncategorised spending is None."""
+        rows = self.connector.execute(MONTHLY_TOTALS, (currency,))
+        return [(month, category, from_minor(total, currency)) for month, category, total in rows]
+
+    @cached
+    def category_totals(self, currency=DEFAULT_CURRENCY):
+        """(category, total) rows, highest spending first."""
+        rows = self.connector.execute(CATEGORY_TOTALS, (currency,))
+        return [(category, from_minor(total, currency)) for category, total in rows]
+
+    @cached
+    def total(self, currency=DEFAULT_CURRENCY):
+        total = self.connector.execute('SELECT IFNULL(SUM(Total), 0) FROM MonthlyCategoryTotals WHERE Currency = ?',
+                                       (currency,)).fetchone()[0]
+        return from_minor(total, currency)
+
+    # Date ranges: the running sums at `end` minus those on the day before
+    # `start`, two lookups whatever the range, so they are not cached.  Days
+    # changed since the running sums were last settled (see schema.py) are
+    # added up one by one.  Both ends are included and either can be None;
+    # undated expenses are left out.
+    def _running_total(self, currency, day, settled):
+        total, entries = self.connector.execute(RUNNING_TOTAL, (currency, min(day, settled))).fetchone() or (0, 0)
+        if day > settled:
+            days_total, days_entries = self.connector.execute(DAYS_TOTAL, (currency, settled, day)).fetchone()
+            total, entries = total + days_total, entries + days_entries
+        return total, entries
+
+    def _running_category_totals(self, currency, day, settled):
+        totals = {category: (total, entries) for category, total, entries
+                  in self.connector.execute(RUNNING_CATEGORY_TOTALS, {'currency': currency, 'day': min(day, settled)})}
+        if day > settled:
+            for category, total, entries in self.connector.execute(DAYS_CATEGORY_TOTALS, (currency, settled, day)):
+                earlier_total, earlier_entries = totals.get(category, (0, 0))
+                totals[category] = (earlier_total + total, earlier_entries + entries)
+        return totals
+
+    def range_total(self, start=None, end=None, currency=DEFAULT_CURRENCY):
+        """RangeTotal of the expenses dated `start` to `end`."""
+        before, last = _range_days(start, end)
+        settled = _settled_until(self.connector)
+        total, entries = self._running_total(currency, last, settled)
+        if before is not None:
+            earlier_total, earlier_entries = self._running_total(currency, before, settled)
+            total, entries = total - earlier_total, entries - earlier_entries
+        return RangeTotal(from_minor(total, currency), entries)
+
+    def range_category_totals(self, start=None, end=None, currency=DEFAULT_CURRENCY):
+        """(category, RangeTotal) rows of the expenses dated `start` to `end`, highest spending first."""
+        before, last = _range_days(start, end)
+        settled = _settled_until(self.connector)
+        totals = self._running_category_totals(currency, last, settled)
+        if before is not None:
+            for category, (total, entries) in self._running_category_totals(currency, before, settled).items():
+                later_total, later_entries = totals.get(category, (0, 0))
+                totals[category] = (later_total - total, later_entries - entries)
+        rows = [(category, RangeTotal(from_minor(total, currency), entries))
+                for category, (total, entries) in totals.items() if entries > 0]
+        rows.sort(key=lambda row: row[1].total, reverse=True)
+        return rows
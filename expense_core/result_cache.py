@@ -0,0 +1,153 @@
+"""Results of the aggregation queries, kept until the ledger changes.
+
+Clicking "Summarize Expenses", "Visualize Expenses" or "AI Suggestions" again
+used to read and convert all the monthly totals again, and fit the forecast
+again, even when no expense had changed in between.  Functions decorated with
+`cached` keep their results in `results`, one ResultCache shared by every
+connection of the process (the scripts' DBWorker, the API server's readers),
+so an unchanged ledger is answered from memory.
+
+A result is keyed by the database file, the arguments and the ledger version:
+the highest expense ID handed out, the ChangeCounter counts of edits and
+deletions of ExpenseTracker and of FxRates (see schema.py), all stored in the
+database.  Every write moves one of them, whichever process or connection
+made it, so a cached result is never served for data it was not computed
+from.  (PRAGMA data_version would do for other processes, but it does not
+move for the connection's own commits, and the cache outlives any one
+connection.)  Reading the version costs a few microseconds.
+
+The cache holds at most `max_bytes` of results, by a rough estimate of their
+size, and drops the least recently used first.  Cached results are shared:
+callers must not change them.
+"""
+
+import functools
+import sys
+import threading
+from collections import OrderedDict
+
+# Bytes of results kept, estimated
+MAX_BYTES = 32 * 1024 * 1024
+
+LEDGER_VERSION = (
+    "SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'ExpenseTracker'), "
+    "(SELECT Changes FROM ChangeCounter WHERE Name = 'ExpenseTracker'), "
+    "(SELECT Changes FROM ChangeCounter WHERE Name = 'FxRates')"
+)
+
+
+def ledger_version(connector):
+    """A value that changes whenever an expense or an exchange rate is added, edited or deleted."""
+    return connector.execute(LEDGER_VERSION).fetchone()
+
+
+def estimate_size(value, _seen=None):
+    """Roughly how many bytes `value` and everything it refers to take up."""
+    seen = _seen if _seen is not None else set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    size = sys.getsizeof(value)
+    if isinstance(value, (str, bytes, int, float)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(key, seen) + estimate_size(item, seen) for key, item in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, seen) for item in value)
+    dtype = getattr(value, 'dtype', None)
+    if dtype is not None and hasattr(value, 'nbytes'):
+        # A NumPy array; getsizeof leaves out the data of a view, and the
+        # objects an object array points to
+        size = max(size, value.nbytes)
+        if dtype.hasobject:
+            size += sum(estimate_size(item, seen) for item in value.ravel().tolist())
+        return size
+    if hasattr(value, '__dict__'):
+        return size + estimate_size(vars(value), seen)
+    return size
+
+
+class ResultCache:
+    """A thread-safe LRU mapping bounded by the estimated size of its values."""
+
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        # key: (value, size)
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def nbytes(self):
+        return self._bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key, value):
+        size = estimate_size(value)
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            if size > self.max_bytes:
+                # Would push everything else out and then itself
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, (_, dropped) = self._entries.popitem(last=False)
+                self._bytes -= dropped
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+results = ResultCache()
+
+_MISSING = object()
+
+
+def cached(function):
+    """Keep the results of `function(connector, ...)` in `results` until the ledger changes.
+
+    Methods work too when their object has a `connector`.  The undecorated
+    function is available as `function.uncached`.
+    """
+    @functools.wraps(function)
+    def wrapper(owner, *args, **kwargs):
+        connector = getattr(owner, 'connector', owner)
+        database = connector.execute('PRAGMA database_list').fetchone()[2]
+        if not database:
+            # In-memory databases have no name to tell them apart
+            return function(owner, *args, **kwargs)
+
+        key = (function.__module__, function.__qualname__, database, ledger_version(connector), args,
+               tuple(sorted(kwargs.items())))
+        try:
+            value = results.get(key, _MISSING)
+        except TypeError:
+            # Unhashable arguments
+            return function(owner, *args, **kwargs)
+        if value is _MISSING:
+            value = function(owner, *args, **kwargs)
+            results.put(key, value)
+        return value
+
+    wrapper.uncached = function
+    return wrapper
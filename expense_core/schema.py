@@ -0,0 +1,508 @@
+"""Versioned schema for "Expense Tracker.db".
+
+The version of a database file is kept in `PRAGMA user_version`.  MIGRATIONS[n]
+upgrades a database from version n to n + 1; `migrate` runs every step the
+file has not seen yet, each one in its own transaction, so the scripts can
+call it at startup on new and old databases alike.
+"""
+
+import pathlib
+import sqlite3
+
+
+def _create_expense_table(connector):
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS ExpenseTracker (ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, Date DATETIME, Payee TEXT, Description TEXT, Amount FLOAT, ModeOfPayment TEXT, Category TEXT)'
+    )
+
+    # Databases created by main.py have no Category column
+    columns = [row[1] for row in connector.execute('PRAGMA table_info(ExpenseTracker)')]
+    if 'Category' not in columns:
+        connector.execute('ALTER TABLE ExpenseTracker ADD COLUMN Category TEXT')
+
+
+# Secondary indexes on ExpenseTracker.  Bulk loads drop and re-create them,
+# since building an index in one sorted pass is much cheaper than updating it
+# row by row.
+INDEXES = {
+    # Month expression index covering the monthly GROUP BY month, Category
+    # rollups: they become an in-order scan of the index without touching the
+    # table (Date is included so SQLite treats the index as covering).
+    # Queries must spell the expression exactly as strftime('%Y-%m', Date).
+    'ExpenseMonthCategory': "ExpenseTracker (strftime('%Y-%m', Date), Category, Amount, Date)",
+    # Date range rollups
+    'ExpenseDateCategory': 'ExpenseTracker (Date, Category, Amount)',
+    # Listings ordered by date, which sort undated expenses first under the
+    # empty string (see paged_table.py); queries spell it IFNULL(Date, '')
+    'ExpenseDateOrder': "ExpenseTracker (IFNULL(Date, ''))",
+    'ExpenseCategory': 'ExpenseTracker (Category, Amount)',
+    'ExpensePayee': 'ExpenseTracker (Payee)',
+}
+
+
+def create_indexes(connector, schema='main'):
+    for name, definition in INDEXES.items():
+        connector.execute(f'CREATE INDEX IF NOT EXISTS {schema}.{name} ON {definition}')
+
+
+def drop_indexes(connector):
+    for name in INDEXES:
+        connector.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+# MonthlyCategoryTotals holds SUM(Amount) and COUNT(*) per month, category
+# and currency and is kept current by the triggers below, so the summary and
+# the chart read a few hundred rows instead of aggregating the whole ledger.
+# Totals are integer minor units like the amounts, so they never drift.  NULL
+# months and categories are stored as '' because they are part of the primary
+# key; MONTHLY_TOTALS turns them back into NULL.
+MONTHLY_TOTALS = "SELECT NULLIF(Month, '') AS month, NULLIF(Category, ''), Total FROM MonthlyCategoryTotals WHERE Currency = ? ORDER BY Month, Category"
+
+_ADD_TO_TOTALS = """
+    INSERT INTO MonthlyCategoryTotals (Month, Category, Currency, Total, Entries)
+    VALUES (IFNULL(strftime('%Y-%m', NEW.Date), ''), IFNULL(NEW.Category, ''), NEW.Currency, IFNULL(NEW.Amount, 0), 1)
+    ON CONFLICT (Month, Category, Currency) DO UPDATE SET Total = Total + excluded.Total, Entries = Entries + 1;
+"""
+
+_REMOVE_FROM_TOTALS = """
+    UPDATE MonthlyCategoryTotals SET Total = Total - IFNULL(OLD.Amount, 0), Entries = Entries - 1
+    WHERE Month = IFNULL(strftime('%Y-%m', OLD.Date), '') AND Category = IFNULL(OLD.Category, '') AND Currency = OLD.Currency;
+    DELETE FROM MonthlyCategoryTotals
+    WHERE Month = IFNULL(strftime('%Y-%m', OLD.Date), '') AND Category = IFNULL(OLD.Category, '') AND Currency = OLD.Currency
+      AND Entries <= 0;
+"""
+
+# ExpenseSearch is an FTS5 index over Payee and Description.  It is an
+# external content table, so the text is not stored twice; the triggers below
+# keep it in step with ExpenseTracker.  Prefix indexes for the first one to
+# three characters make as-you-type prefix queries cheap.
+_ADD_TO_SEARCH = """
+    INSERT INTO ExpenseSearch (rowid, Payee, Description) VALUES (NEW.ID, NEW.Payee, NEW.Description);
+"""
+
+_REMOVE_FROM_SEARCH = """
+    INSERT INTO ExpenseSearch (ExpenseSearch, rowid, Payee, Description) VALUES ('delete', OLD.ID, OLD.Payee, OLD.Description);
+"""
+
+# DailyCategoryTotals and DailyTotals hold the total and the number of the
+# expenses of every day per category and currency, and per currency, next to
+# their running sums: everything up to and including that day.  The total of
+# any date range is then the running sum at its last day minus the one before
+# its first day, two index lookups however long the range.  Undated expenses
+# are left out.
+#
+# A backdated expense moves the running sums of every later day, which would
+# make adding one as slow as the ledger is long.  The triggers below only keep
+# the days themselves current, like the monthly ones, and note the earliest
+# day they changed in UnsettledDays; the running sums are good up to the day
+# before it, and readers add up the days from there on.  `settle_daily_totals`
+# recomputes the running sums from that day on: the write queue does so when
+# the writes pause, `expense-cli add` and imports when they are done, and the
+# scripts' maintenance in the background.
+_ADD_TO_DAILY = """
+    INSERT INTO DailyCategoryTotals (Category, Currency, Day, Total, Entries, RunningTotal, RunningEntries)
+    SELECT IFNULL(NEW.Category, ''), NEW.Currency, date(NEW.Date), IFNULL(NEW.Amount, 0), 1, 0, 0 WHERE date(NEW.Date) IS NOT NULL
+    ON CONFLICT (Category, Currency, Day) DO UPDATE SET Total = Total + excluded.Total, Entries = Entries + 1;
+    INSERT INTO DailyTotals (Currency, Day, Total, Entries, RunningTotal, RunningEntries)
+    SELECT NEW.Currency, date(NEW.Date), IFNULL(NEW.Amount, 0), 1, 0, 0 WHERE date(NEW.Date) IS NOT NULL
+    ON CONFLICT (Currency, Day) DO UPDATE SET Total = Total + excluded.Total, Entries = Entries + 1;
+    INSERT INTO UnsettledDays (Id, Since) SELECT 0, date(NEW.Date) WHERE date(NEW.Date) IS NOT NULL
+    ON CONFLICT (Id) DO UPDATE SET Since = MIN(Since, excluded.Since);
+"""
+
+_REMOVE_FROM_DAILY = """
+    UPDATE DailyCategoryTotals SET Total = Total - IFNULL(OLD.Amount, 0), Entries = Entries - 1
+    WHERE Category = IFNULL(OLD.Category, '') AND Currency = OLD.Currency AND Day = date(OLD.Date);
+    DELETE FROM DailyCategoryTotals
+    WHERE Category = IFNULL(OLD.Category, '') AND Currency = OLD.Currency AND Day = date(OLD.Date) AND Entries <= 0;
+    UPDATE DailyTotals SET Total = Total - IFNULL(OLD.Amount, 0), Entries = Entries - 1
+    WHERE Currency = OLD.Currency AND Day = date(OLD.Date);
+    DELETE FROM DailyTotals WHERE Currency = OLD.Currency AND Day = date(OLD.Date) AND Entries <= 0;
+    INSERT INTO UnsettledDays (Id, Since) SELECT 0, date(OLD.Date) WHERE date(OLD.Date) IS NOT NULL
+    ON CONFLICT (Id) DO UPDATE SET Since = MIN(Since, excluded.Since);
+"""
+
+MONTHLY_TOTALS_TRIGGERS = {
+    'ExpenseTotalsInsert': f'AFTER INSERT ON ExpenseTracker BEGIN {_ADD_TO_TOTALS} END',
+    'ExpenseTotalsUpdate': f'AFTER UPDATE OF Date, Category, Amount, Currency ON ExpenseTracker BEGIN {_REMOVE_FROM_TOTALS} {_ADD_TO_TOTALS} END',
+    'ExpenseTotalsDelete': f'AFTER DELETE ON ExpenseTracker BEGIN {_REMOVE_FROM_TOTALS} END',
+}
+
+DAILY_TOTALS_TRIGGERS = {
+    'ExpenseDailyTotalsInsert': f'AFTER INSERT ON ExpenseTracker BEGIN {_ADD_TO_DAILY} END',
+    'ExpenseDailyTotalsUpdate': f'AFTER UPDATE OF Date, Category, Amount, Currency ON ExpenseTracker BEGIN {_REMOVE_FROM_DAILY} {_ADD_TO_DAILY} END',
+    'ExpenseDailyTotalsDelete': f'AFTER DELETE ON ExpenseTracker BEGIN {_REMOVE_FROM_DAILY} END',
+}
+
+# Archiving a year drops these while it deletes the year, so the totals keep it
+TOTALS_TRIGGERS = {**MONTHLY_TOTALS_TRIGGERS, **DAILY_TOTALS_TRIGGERS}
+
+SEARCH_TRIGGERS = {
+    'ExpenseSearchInsert': f'AFTER INSERT ON ExpenseTracker BEGIN {_ADD_TO_SEARCH} END',
+    'ExpenseSearchUpdate': f'AFTER UPDATE OF Payee, Description ON ExpenseTracker BEGIN {_REMOVE_FROM_SEARCH} {_ADD_TO_SEARCH} END',
+    'ExpenseSearchDelete': f'AFTER DELETE ON ExpenseTracker BEGIN {_REMOVE_FROM_SEARCH} END',
+}
+
+TRIGGERS = {**TOTALS_TRIGGERS, **SEARCH_TRIGGERS}
+
+
+# ChangeCounter counts the edits and deletions of a table.  Together with the
+# highest ID handed out, which moves on every insert, it tells caches of
+# anything computed from the table whether they are still current.  These
+# triggers are left alone by bulk loads, which only insert.
+def _count_change(table):
+    return f"BEGIN UPDATE ChangeCounter SET Changes = Changes + 1 WHERE Name = '{table}'; END"
+
+
+CHANGE_TRIGGERS = {
+    'ExpenseChangesUpdate': f'AFTER UPDATE ON ExpenseTracker {_count_change("ExpenseTracker")}',
+    'ExpenseChangesDelete': f'AFTER DELETE ON ExpenseTracker {_count_change("ExpenseTracker")}',
+    # FxRates has no rowid, so its inserts are counted too
+    'FxRateChangesInsert': f'AFTER INSERT ON FxRates {_count_change("FxRates")}',
+    'FxRateChangesUpdate': f'AFTER UPDATE ON FxRates {_count_change("FxRates")}',
+    'FxRateChangesDelete': f'AFTER DELETE ON FxRates {_count_change("FxRates")}',
+}
+
+DATA_VERSION = (
+    "SELECT (SELECT seq FROM sqlite_sequence WHERE name = 'ExpenseTracker'), Changes FROM ChangeCounter WHERE Name = 'ExpenseTracker'"
+)
+
+
+def create_triggers(connector, triggers=TRIGGERS):
+    for name, definition in triggers.items():
+        connector.execute(f'CREATE TRIGGER IF NOT EXISTS {name} {definition}')
+
+
+def drop_triggers(connector):
+    for name in TRIGGERS:
+        connector.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def rebuild_rollups(connector):
+    """Recompute MonthlyCategoryTotals and the daily totals from ExpenseTracker and the totals of archived years."""
+    connector.execute('DELETE FROM MonthlyCategoryTotals')
+    connector.execute(
+        "INSERT INTO MonthlyCategoryTotals (Month, Category, Currency, Total, Entries) "
+        "SELECT IFNULL(strftime('%Y-%m', Date), ''), IFNULL(Category, ''), Currency, IFNULL(SUM(Amount), 0), COUNT(*) "
+        "FROM ExpenseTracker GROUP BY strftime('%Y-%m', Date), Category, Currency"
+    )
+    # Databases older than _create_archives have nothing archived
+    if connector.execute("SELECT 1 FROM sqlite_master WHERE name = 'ArchivedTotals'").fetchone():
+        connector.execute(
+            "INSERT INTO MonthlyCategoryTotals (Month, Category, Currency, Total, Entries) "
+            "SELECT Month, Category, Currency, Total, Entries FROM ArchivedTotals WHERE true "
+            "ON CONFLICT (Month, Category, Currency) DO UPDATE SET Total = Total + excluded.Total, Entries = Entries + excluded.Entries"
+        )
+    # Nor daily totals before _create_daily_totals
+    if connector.execute("SELECT 1 FROM sqlite_master WHERE name = 'DailyTotals'").fetchone():
+        rebuild_daily_totals(connector)
+
+
+def rebuild_daily_totals(connector):
+    """Recompute DailyCategoryTotals and DailyTotals, with their running sums, from ExpenseTracker and ArchivedDailyTotals."""
+    connector.execute('DELETE FROM DailyCategoryTotals')
+    connector.execute(
+        "INSERT INTO DailyCategoryTotals (Category, Currency, Day, Total, Entries, RunningTotal, RunningEntries) "
+        "SELECT Category, Currency, Day, SUM(Total), SUM(Entries), 0, 0 FROM ("
+        "  SELECT IFNULL(Category, '') AS Category, Currency, date(Date) AS Day, IFNULL(Amount, 0) AS Total, 1 AS Entries "
+        "  FROM ExpenseTracker WHERE date(Date) IS NOT NULL "
+        "  UNION ALL SELECT Category, Currency, Day, Total, Entries FROM ArchivedDailyTotals"
+        ") GROUP BY Category, Currency, Day"
+    )
+    connector.execute('DELETE FROM DailyTotals')
+    connector.execute(
+        "INSERT INTO DailyTotals (Currency, Day, Total, Entries, RunningTotal, RunningEntries) "
+        "SELECT Currency, Day, SUM(Total), SUM(Entries), 0, 0 FROM DailyCategoryTotals GROUP BY Currency, Day"
+    )
+    _update_running_sums(connector, '')
+    connector.execute('DELETE FROM UnsettledDays')
+
+
+def _update_running_sums(connector, since):
+    # The running sums of the days from `since` on, continuing those of the
+    # last day before it
+    for table, key in (('DailyCategoryTotals', 'Category, Currency'), ('DailyTotals', 'Currency')):
+        same_key = ' AND '.join(f'Earlier.{column} = Days.{column}' for column in key.split(', '))
+        earlier = f'FROM {table} AS Earlier WHERE {same_key} AND Earlier.Day < :since ORDER BY Earlier.Day DESC LIMIT 1'
+        connector.execute(
+            f"INSERT INTO {table} ({key}, Day, Total, Entries, RunningTotal, RunningEntries) "
+            f"SELECT {key}, Day, Total, Entries, "
+            f"  SUM(Total) OVER running + IFNULL((SELECT Earlier.RunningTotal {earlier}), 0), "
+            f"  SUM(Entries) OVER running + IFNULL((SELECT Earlier.RunningEntries {earlier}), 0) "
+            f"FROM {table} AS Days WHERE Day >= :since WINDOW running AS (PARTITION BY {key} ORDER BY Day) "
+            f"ON CONFLICT ({key}, Day) DO UPDATE SET RunningTotal = excluded.RunningTotal, RunningEntries = excluded.RunningEntries",
+            {'since': since}
+        )
+
+
+def settle_daily_totals(connector):
+    """Bring the running sums of the daily totals up to date; does nothing when no day changed since the last time."""
+    row = connector.execute('SELECT Since FROM UnsettledDays').fetchone()
+    if row is not None:
+        _update_running_sums(connector, row[0])
+        connector.execute('DELETE FROM UnsettledDays')
+
+
+def rebuild_search_index(connector):
+    """Re-index the Payee and Description of every expense in ExpenseSearch."""
+    connector.execute("INSERT INTO ExpenseSearch (ExpenseSearch) VALUES ('rebuild')")
+
+
+# Steps that came before _store_amounts_in_minor_units only create their
+# tables: the triggers and rollups are (re)built in step 5, for the columns it adds
+def _create_monthly_totals(connector):
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS MonthlyCategoryTotals (Month TEXT NOT NULL, Category TEXT NOT NULL, Total FLOAT NOT NULL, Entries INTEGER NOT NULL, PRIMARY KEY (Month, Category)) WITHOUT ROWID'
+    )
+
+
+# ExpenseSearch, also used for the search index of archives
+SEARCH_INDEX = "fts5(Payee, Description, content='ExpenseTracker', content_rowid='ID', tokenize='unicode61 remove_diacritics 2', prefix='1 2 3')"
+
+
+def _create_expense_search(connector):
+    try:
+        connector.execute(f'CREATE VIRTUAL TABLE IF NOT EXISTS ExpenseSearch USING {SEARCH_INDEX}')
+    except sqlite3.OperationalError as error:
+        raise RuntimeError(f'Searching expenses needs SQLite with FTS5 ({error})') from None
+    create_triggers(connector, SEARCH_TRIGGERS)
+    rebuild_search_index(connector)
+
+
+# Columns of ExpenseTracker since _store_amounts_in_minor_units, and of the
+# ExpenseTracker of archives
+EXPENSE_COLUMNS = (
+    "ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, Date DATETIME, Payee TEXT, Description TEXT, Amount INTEGER, ModeOfPayment TEXT, Category TEXT, Currency TEXT NOT NULL DEFAULT 'INR'"
+)
+
+
+def _store_amounts_in_minor_units(connector):
+    # SQLite cannot change a column's type, so ExpenseTracker is copied into a
+    # new table with an INTEGER Amount and a Currency column.  IDs are kept, so
+    # ExpenseSearch (keyed by ID) stays valid.  Existing amounts are rupees.
+    drop_triggers(connector)
+    connector.execute(f'CREATE TABLE ExpenseTrackerMinorUnits ({EXPENSE_COLUMNS})')
+    connector.execute(
+        "INSERT INTO ExpenseTrackerMinorUnits (ID, Date, Payee, Description, Amount, ModeOfPayment, Category, Currency) "
+        "SELECT ID, Date, Payee, Description, CAST(ROUND(Amount * 100) AS INTEGER), ModeOfPayment, Category, 'INR' "
+        "FROM ExpenseTracker"
+    )
+    # Keep AUTOINCREMENT from handing out the IDs of deleted expenses again
+    sequence = connector.execute("SELECT seq FROM sqlite_sequence WHERE name = 'ExpenseTracker'").fetchone()
+    connector.execute('DROP TABLE ExpenseTracker')
+    connector.execute('ALTER TABLE ExpenseTrackerMinorUnits RENAME TO ExpenseTracker')
+    if sequence is not None:
+        connector.execute("UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = 'ExpenseTracker'", sequence)
+    create_indexes(connector)
+
+    connector.execute('DROP TABLE MonthlyCategoryTotals')
+    connector.execute(
+        'CREATE TABLE MonthlyCategoryTotals (Month TEXT NOT NULL, Category TEXT NOT NULL, Currency TEXT NOT NULL, Total INTEGER NOT NULL, Entries INTEGER NOT NULL, PRIMARY KEY (Month, Category, Currency)) WITHOUT ROWID'
+    )
+    rebuild_rollups(connector)
+    # Only the triggers whose tables exist at this version; later steps add theirs
+    create_triggers(connector, {**MONTHLY_TOTALS_TRIGGERS, **SEARCH_TRIGGERS})
+
+
+def _create_fx_rates(connector):
+    # Exchange rates by day as units of Currency per one unit of Base, see fx.py
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS FxRates (Base TEXT NOT NULL, Currency TEXT NOT NULL, Date TEXT NOT NULL, Rate FLOAT NOT NULL, PRIMARY KEY (Base, Currency, Date)) WITHOUT ROWID'
+    )
+
+
+def _create_change_counters(connector):
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS ChangeCounter (Name TEXT PRIMARY KEY NOT NULL, Changes INTEGER NOT NULL) WITHOUT ROWID'
+    )
+    connector.execute("INSERT OR IGNORE INTO ChangeCounter (Name, Changes) VALUES ('ExpenseTracker', 0), ('FxRates', 0)")
+    create_triggers(connector, CHANGE_TRIGGERS)
+
+
+def _create_archives(connector):
+    # Years moved into archive databases (file names next to this one) and
+    # their monthly totals, which rebuild_rollups adds back in; see archive.py
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS Archives (Year INTEGER PRIMARY KEY NOT NULL, Path TEXT NOT NULL, Expenses INTEGER NOT NULL)'
+    )
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS ArchivedTotals (Month TEXT NOT NULL, Category TEXT NOT NULL, Currency TEXT NOT NULL, Total INTEGER NOT NULL, Entries INTEGER NOT NULL, PRIMARY KEY (Month, Category, Currency)) WITHOUT ROWID'
+    )
+
+
+# DAILY_TOTALS, also used by archive.py for the year it archives
+DAILY_TOTALS = (
+    "SELECT date(Date), IFNULL(Category, ''), Currency, IFNULL(SUM(Amount), 0), COUNT(*) FROM {schema}.ExpenseTracker "
+    "WHERE Date >= ? AND Date < ? AND date(Date) IS NOT NULL GROUP BY date(Date), IFNULL(Category, ''), Currency"
+)
+
+
+def _create_daily_totals(connector):
+    from .archive import archives
+
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS DailyCategoryTotals (Category TEXT NOT NULL, Currency TEXT NOT NULL, Day TEXT NOT NULL, Total INTEGER NOT NULL, Entries INTEGER NOT NULL, RunningTotal INTEGER NOT NULL, RunningEntries INTEGER NOT NULL, PRIMARY KEY (Category, Currency, Day)) WITHOUT ROWID'
+    )
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS DailyTotals (Currency TEXT NOT NULL, Day TEXT NOT NULL, Total INTEGER NOT NULL, Entries INTEGER NOT NULL, RunningTotal INTEGER NOT NULL, RunningEntries INTEGER NOT NULL, PRIMARY KEY (Currency, Day)) WITHOUT ROWID'
+    )
+    # The earliest day whose running sums are out of date, if any
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS UnsettledDays (Id INTEGER PRIMARY KEY CHECK (Id = 0), Since TEXT NOT NULL)'
+    )
+    # The daily totals of archived years, which rebuild_daily_totals adds back in
+    connector.execute(
+        'CREATE TABLE IF NOT EXISTS ArchivedDailyTotals (Day TEXT NOT NULL, Category TEXT NOT NULL, Currency TEXT NOT NULL, Total INTEGER NOT NULL, Entries INTEGER NOT NULL, PRIMARY KEY (Day, Category, Currency)) WITHOUT ROWID'
+    )
+    # Years archived before this are read from their files; ATTACH is not
+    # possible inside the migration's transaction
+    for year, path in archives(connector).items():
+        archive = sqlite3.connect(f'{pathlib.Path(path).resolve().as_uri()}?mode=ro', uri=True)
+        try:
+            rows = archive.execute(DAILY_TOTALS.format(schema='main'), (f'{year}-01-01', f'{year + 1}-01-01')).fetchall()
+        finally:
+            archive.close()
+        connector.executemany('INSERT INTO ArchivedDailyTotals (Day, Category, Currency, Total, Entries) VALUES (?, ?, ?, ?, ?)', rows)
+    rebuild_daily_totals(connector)
+    create_triggers(connector, DAILY_TOTALS_TRIGGERS)
+
+
+def _create_date_order_index(connector):
+    # ExpenseDateOrder; archives made before it page through their year without
+    create_indexes(connector)
+
+
+# Bulk loads go faster without per-row index and trigger work; everything
+# derived from ExpenseTracker is dropped for the load and rebuilt afterwards.
+# The load commits batch by batch, so a load that is killed halfway leaves
+# the triggers dropped; `repair` notices that and finishes it.
+def begin_bulk_load(connector):
+    drop_triggers(connector)
+    drop_indexes(connector)
+
+
+def end_bulk_load(connector):
+    create_indexes(connector)
+    rebuild_rollups(connector)
+    rebuild_search_index(connector)
+    create_triggers(connector)
+
+
+def _missing_triggers(connector):
+    present = {name for name, in connector.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    return set(TRIGGERS) - present, set(CHANGE_TRIGGERS) - present
+
+
+def repair(connector):
+    """Finish a bulk load that never got to end_bulk_load, and put back missing change counters; returns
+    whether anything was missing."""
+    if not any(_missing_triggers(connector)):
+        return False
+
+    connector.execute('BEGIN IMMEDIATE')
+    try:
+        # Another program may have repaired it while this one waited for the lock
+        derived, counters = _missing_triggers(connector)
+        if derived:
+            # The totals and the search index are missing the rows loaded since
+            end_bulk_load(connector)
+        if counters:
+            create_triggers(connector, CHANGE_TRIGGERS)
+    except Exception:
+        connector.rollback()
+        raise
+    connector.commit()
+    return bool(derived or counters)
+
+
+MIGRATIONS = [
+    _create_expense_table,
+    create_indexes,
+    _create_monthly_totals,
+    _create_expense_search,
+    _store_amounts_in_minor_units,
+    _create_fx_rates,
+    _create_change_counters,
+    _create_archives,
+    _create_daily_totals,
+    _create_date_order_index,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(connector):
+    return connector.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(connector):
+    """Bring the database up to SCHEMA_VERSION, `repair` it, and return the version it started at."""
+    version = schema_version(connector)
+
+    if version > SCHEMA_VERSION:
+        raise RuntimeError(
+            f'The database is at schema version {version}, which is newer than this program understands ({SCHEMA_VERSION})'
+        )
+
+    for target in range(version + 1, SCHEMA_VERSION + 1):
+        # sqlite3 does not open a transaction for DDL by itself
+        connector.execute('BEGIN')
+        try:
+            MIGRATIONS[target - 1](connector)
+            connector.execute(f'PRAGMA user_version = {target}')
+        except Exception:
+            connector.rollback()
+            raise
+        connector.commit()
+
+    if version < SCHEMA_VERSION:
+        # Give the query planner statistics for the new indexes, sampling
+        # instead of reading every row of a big ledger
+        connector.execute('PRAGMA analysis_limit = 1000')
+        connector.execute('ANALYZE')
+        connector.commit()
+
+    repair(connector)
+    return version
+
+
+DESCRIPTION = 'Upgrade the expense database and rebuild derived tables.'
+
+
+def add_arguments(parser):
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+    parser.add_argument('--rebuild-rollups', action='store_true',
+                        help='recompute MonthlyCategoryTotals and the daily totals from scratch')
+    parser.add_argument('--rebuild-search', action='store_true', help='re-index ExpenseSearch from scratch')
+
+
+def run(args, parser):
+    from .database import connect
+
+    connector = connect(args.database)
+    start = migrate(connector)
+    print(f'Schema version {start} -> {SCHEMA_VERSION}')
+
+    if args.rebuild_rollups:
+        rebuild_rollups(connector)
+        connector.commit()
+        print('Rebuilt MonthlyCategoryTotals and the daily totals')
+
+    if args.rebuild_search:
+        rebuild_search_index(connector)
+        connector.commit()
+        print('Rebuilt ExpenseSearch')
+
+    connector.close()
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,508 @@
+"""A local HTTP/JSON API over the expense database.
+
+Several people can share one ledger by pointing their tools at the server
+instead of opening the file themselves:
+
+    expense-cli serve --port 8765
+    curl -d '{"payee": "Cafe", "description": "Lunch", "amount": "12.50"}' localhost:8765/expenses
+    curl 'localhost:8765/expenses?from=2024-01-01&category=Food&limit=50'
+
+Endpoints:
+
+    POST /expenses   add an expense (a JSON object) or many (a list) in one transaction
+    GET  /expenses   list expenses in date order; from, to, category (repeatable),
+                     min_amount, max_amount (in currency, default INR), currency,
+                     limit and after
+    GET  /search     the same with q=words, matched like the search box
+    GET  /summary    monthly totals per category; currency, convert=1
+    GET  /forecast   months, level, currency, convert=1
+    GET  /metrics    query and request timings in the Prometheus text format,
+                     with diagnostics = on (see diagnostics.py)
+
+Amounts go both ways as decimal strings, so no cents are lost to floats.
+Listings are paged by key: every page ends with a `next` token which the next
+request passes as `after`, so a page deep into the ledger costs the same as
+the first.
+
+One event loop parses HTTP/1.1 (keep-alive and pipelined requests) and never
+touches SQLite itself.  Reads run on a pool of threads with a connection
+each, which WAL lets read side by side; all writes go to one WriteQueue
+(see write_queue.py), which commits the expenses of requests that arrive
+together in one transaction instead of queueing them for the write lock.
+sqlite3 releases the GIL while a query runs, so the readers really do work
+in parallel.
+
+There are no user accounts.  The server only listens on localhost unless told
+otherwise; with --token every request needs `Authorization: Bearer <token>`.
+"""
+
+import argparse
+import asyncio
+import datetime
+import hmac
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http import HTTPStatus
+from urllib.parse import parse_qs, urlsplit
+
+from .database import connect, load_settings
+from .diagnostics import diagnostics_enabled, recorder, to_prometheus
+from .models import COLUMNS, Expense
+from .money import DEFAULT_CURRENCY, from_minor, to_decimal, to_minor
+from .repository import ExpenseRepository, expense_filter, partitioned_query
+from .schema import migrate
+from .write_queue import WriteQueue
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Read connections, i.e. reads that can run at the same time
+READERS = 4
+
+PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Largest request body, and most expenses added by one request
+MAX_BODY = 16 * 1024 * 1024
+MAX_BATCH = 10000
+
+MAX_FORECAST_MONTHS = 24
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class ConnectionPool:
+    """Threads that each keep one connection to the database.
+
+    `await pool.run(work, *args)` runs `work(connection, *args)` on one of them.
+    """
+
+    def __init__(self, database, settings, size, name):
+        self.database = database
+        self.settings = settings
+        self._executor = ThreadPoolExecutor(size, thread_name_prefix=name)
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            # Closed by `close`, from another thread
+            connection = self._local.connection = connect(self.database, self.settings, check_same_thread=False)
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _call(self, work, args):
+        return work(self._connection(), *args)
+
+    async def run(self, work, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._call, work, args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+
+
+# Requests and responses
+def _json_default(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def expense_json(expense):
+    return {
+        'id': expense.id,
+        'date': expense.date,
+        'payee': expense.payee,
+        'description': expense.description,
+        'amount': expense.amount,
+        'mode_of_payment': expense.mode_of_payment,
+        'category': expense.category,
+        'currency': expense.currency,
+    }
+
+
+def expense_from_json(item):
+    if not isinstance(item, dict):
+        raise HTTPError(HTTPStatus.BAD_REQUEST, 'An expense must be a JSON object')
+    unknown = set(item) - {'date', 'payee', 'description', 'amount', 'mode_of_payment', 'category', 'currency'}
+    if unknown:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, f'Unknown expense fields: {", ".join(sorted(unknown))}')
+    for field in ('payee', 'description', 'amount'):
+        if item.get(field) in (None, ''):
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'An expense needs a {field}')
+    try:
+        date = datetime.date.fromisoformat(item['date']) if item.get('date') else datetime.date.today()
+        expense = Expense(date, item['payee'], item['description'], item['amount'],
+                          item.get('mode_of_payment') or 'Cash', item.get('category'), item.get('currency') or DEFAULT_CURRENCY)
+        # Too many decimal places would otherwise only fail on the write queue's thread
+        to_minor(expense.amount, expense.currency)
+        return expense
+    except (TypeError, ValueError) as error:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, str(error)) from None
+
+
+class Query:
+    """The query string of a request, with typed getters that answer 400 for bad values."""
+
+    def __init__(self, query):
+        self.values = parse_qs(query, keep_blank_values=False)
+
+    def get(self, name, convert=str, default=None):
+        values = self.values.get(name)
+        if not values:
+            return default
+        try:
+            return convert(values[-1])
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'Invalid {name}: {values[-1]!r}') from None
+
+    def all(self, name):
+        return self.values.get(name, [])
+
+
+def _date(value):
+    return datetime.date.fromisoformat(value).isoformat()
+
+
+def _flag(value):
+    return value.lower() in ('1', 'true', 'yes')
+
+
+def _page_key(token):
+    # 'date,id' of the last expense of the previous page; the date is empty
+    # for an undated expense
+    date, _, expense_id = token.rpartition(',')
+    return date or None, int(expense_id)
+
+
+# Handlers.  They run on a pool thread and return what is sent back as JSON.
+def _list_expenses(connection, filter_args, after, limit):
+    selection = expense_filter(**filter_args)
+    condition, params = None, ()
+    if after is not None:
+        date, expense_id = after
+        id_column = selection.id_column
+        if date is None:
+            # Undated expenses come first in date order
+            condition = f'(ExpenseTracker.Date IS NULL AND {id_column} > ? OR ExpenseTracker.Date IS NOT NULL)'
+            params = (expense_id,)
+        else:
+            condition = f'(ExpenseTracker.Date, {id_column}) > (?, ?)'
+            params = (date, expense_id)
+
+    sql, params = partitioned_query(connection, selection, COLUMNS, condition, params)
+    # One row more than asked tells whether there is another page
+    rows = connection.execute(f'{sql} ORDER BY Date, ID LIMIT ?', (*params, limit + 1)).fetchall()
+    expenses = [Expense.from_row(row) for row in rows[:limit]]
+    last = rows[limit - 1] if len(rows) > limit else None
+    return {
+        'expenses': [expense_json(expense) for expense in expenses],
+        'next': f'{last[1] or ""},{last[0]}' if last is not None else None,
+    }
+
+
+def _summary(connection, currency, convert):
+    if convert:
+        from .fx import MissingRateError, converted_monthly_totals
+
+        try:
+            monthly = converted_monthly_totals(connection, currency)
+        except MissingRateError as error:
+            raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(error)) from None
+        total = sum((amount for _, _, amount in monthly), from_minor(0, currency))
+    else:
+        repository = ExpenseRepository(connection)
+        monthly = repository.monthly_totals(currency)
+        total = repository.total(currency)
+    return {
+        'currency': currency,
+        'months': [{'month': month, 'category': category, 'total': amount} for month, category, amount in monthly],
+        'total': total,
+    }
+
+
+def _forecast(connection, months, level, currency, convert):
+    from .forecast import forecast_spending
+    from .fx import MissingRateError
+
+    try:
+        prediction = forecast_spending(connection, months, level, currency, convert)
+    except MissingRateError as error:
+        raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, str(error)) from None
+    if prediction is None:
+        raise HTTPError(HTTPStatus.UNPROCESSABLE_ENTITY, 'Not enough expenses to forecast')
+    return {
+        'currency': currency,
+        'total': [forecast._asdict() for forecast in prediction.total],
+        'categories': [{'category': category, 'forecast': [forecast._asdict() for forecast in forecasts]}
+                       for category, forecasts in prediction.categories.items()],
+        'top_category': prediction.top_category,
+        'top_amount': prediction.top_amount,
+    }
+
+
+class ExpenseServer:
+    """The API server; `await start()` binds it, `await close()` stops it and closes the connections."""
+
+    def __init__(self, database=None, settings=None, readers=READERS, token=None):
+        self.settings = settings if settings is not None else load_settings()
+        self.database = database if database is not None else self.settings['database']
+        self.token = token
+        self.diagnostics = diagnostics_enabled(self.settings)
+        self.readers = ConnectionPool(self.database, self.settings, readers, 'ExpenseReader')
+        self.writes = WriteQueue(self.database, self.settings)
+        self._server = None
+        # Handler task of every open client connection, by its writer
+        self._clients = {}
+        self.routes = {
+            ('GET', '/expenses'): self.list_expenses,
+            ('POST', '/expenses'): self.add_expenses,
+            ('GET', '/search'): self.search,
+            ('GET', '/summary'): self.summary,
+            ('GET', '/forecast'): self.forecast,
+        }
+        if self.diagnostics:
+            self.routes[('GET', '/metrics')] = self.metrics
+
+    async def start(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        # Reader connections can write too; this one brings the schema up to date
+        await self.readers.run(migrate)
+        self._server = await asyncio.start_server(self._serve_connection, host, port)
+        return self._server
+
+    @property
+    def port(self):
+        """The port listened on, useful after starting on port 0."""
+        return self._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            # Idle keep-alive connections end their handlers by seeing EOF
+            handlers = list(self._clients.values())
+            for client in list(self._clients):
+                client.close()
+            await asyncio.gather(*handlers, return_exceptions=True)
+            await self._server.wait_closed()
+        await asyncio.to_thread(self.writes.close)
+        self.readers.close()
+
+    # Endpoints
+    def _filter_args(self, query, text=None):
+        return {
+            'text': text,
+            'start': query.get('from', _date),
+            'end': query.get('to', _date),
+            'categories': query.all('category') or None,
+            'min_amount': query.get('min_amount', to_decimal),
+            'max_amount': query.get('max_amount', to_decimal),
+            'currency': query.get('currency', str.upper),
+        }
+
+    async def _page(self, query, text=None):
+        limit = query.get('limit', int, PAGE_SIZE)
+        if not 1 <= limit <= MAX_PAGE_SIZE:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'limit must be between 1 and {MAX_PAGE_SIZE}')
+        return await self.readers.run(_list_expenses, self._filter_args(query, text), query.get('after', _page_key),
+                                      limit)
+
+    async def list_expenses(self, query, body):
+        return HTTPStatus.OK, await self._page(query)
+
+    async def search(self, query, body):
+        text = query.get('q')
+        if not text:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'Search needs q=words')
+        return HTTPStatus.OK, await self._page(query, text)
+
+    async def add_expenses(self, query, body):
+        try:
+            items = json.loads(body)
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, 'The body is not JSON') from None
+        items = items if isinstance(items, list) else [items]
+        if not 1 <= len(items) <= MAX_BATCH:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'Add between 1 and {MAX_BATCH} expenses at a time')
+        expenses = [expense_from_json(item) for item in items]
+        expenses = await asyncio.wrap_future(self.writes.add_many(expenses))
+        return HTTPStatus.CREATED, {'ids': [expense.id for expense in expenses]}
+
+    async def summary(self, query, body):
+        currency = query.get('currency', str.upper, DEFAULT_CURRENCY)
+        return HTTPStatus.OK, await self.readers.run(_summary, currency, query.get('convert', _flag, False))
+
+    async def forecast(self, query, body):
+        from .forecast import LEVELS
+
+        months = query.get('months', int, 1)
+        level = query.get('level', float, 0.95)
+        if not 1 <= months <= MAX_FORECAST_MONTHS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'months must be between 1 and {MAX_FORECAST_MONTHS}')
+        if level not in LEVELS:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f'level must be one of {", ".join(map(str, LEVELS))}')
+        currency = query.get('currency', str.upper, DEFAULT_CURRENCY)
+        convert = query.get('convert', _flag, False)
+        return HTTPStatus.OK, await self.readers.run(_forecast, months, level, currency, convert)
+
+    async def metrics(self, query, body):
+        # Text, not JSON, for Prometheus to scrape
+        return HTTPStatus.OK, to_prometheus()
+
+    # HTTP
+    async def _respond(self, method, target, headers, body):
+        if self.token is not None:
+            scheme, _, credentials = headers.get('authorization', '').partition(' ')
+            if scheme.lower() != 'bearer' or not hmac.compare_digest(credentials.encode(), self.token.encode()):
+                raise HTTPError(HTTPStatus.UNAUTHORIZED, 'A valid bearer token is required')
+
+        url = urlsplit(target)
+        handler = self.routes.get((method, url.path))
+        if handler is None:
+            if any(path == url.path for _, path in self.routes):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, f'{method} is not supported on {url.path}')
+            raise HTTPError(HTTPStatus.NOT_FOUND, f'No such endpoint: {url.path}')
+        if not self.diagnostics:
+            return await handler(Query(url.query), body)
+        started = time.perf_counter()
+        try:
+            return await handler(Query(url.query), body)
+        finally:
+            recorder.record('api', f'{method} {url.path}', time.perf_counter() - started)
+
+    async def _serve_connection(self, reader, writer):
+        self._clients[writer] = asyncio.current_task()
+        try:
+            while True:
+                try:
+                    request_line = await reader.readline()
+                except ValueError:
+                    # Longer than the stream's limit (64 KiB); its rest would read as a request
+                    self._write_response(writer, HTTPStatus.BAD_REQUEST, {'error': 'Request line too long'}, False)
+                    await writer.drain()
+                    break
+                if not request_line:
+                    break
+                keep_alive = await self._serve_request(request_line, reader, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._clients.pop(writer, None)
+            writer.close()
+
+    async def _serve_request(self, request_line, reader, writer):
+        # Returns whether the connection stays open for another request
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            self._write_response(writer, HTTPStatus.BAD_REQUEST, {'error': 'Malformed request line'}, False)
+            return False
+
+        headers = {}
+        while True:
+            try:
+                line = await reader.readline()
+            except ValueError:
+                self._write_response(writer, HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE,
+                                     {'error': 'Header line too long'}, False)
+                return False
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+        length = headers.get('content-length', '0')
+        if not length.isdigit():
+            self._write_response(writer, HTTPStatus.BAD_REQUEST, {'error': 'Invalid Content-Length'}, False)
+            return False
+        if int(length) > MAX_BODY:
+            self._write_response(writer, HTTPStatus.REQUEST_ENTITY_TOO_LARGE, {'error': 'Request body too large'}, False)
+            return False
+        body = await reader.readexactly(int(length))
+
+        try:
+            status, payload = await self._respond(method, target, headers, body)
+        except HTTPError as error:
+            status, payload = error.status, {'error': str(error)}
+        except Exception as error:
+            status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': f'{type(error).__name__}: {error}'}
+        self._write_response(writer, status, payload, keep_alive)
+        return keep_alive
+
+    @staticmethod
+    def _write_response(writer, status, payload, keep_alive):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body = json.dumps(payload, default=_json_default, ensure_ascii=False).encode()
+            content_type = 'application/json'
+        writer.write(
+            f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: {content_type}; charset=utf-8\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'.encode('latin-1') + body
+        )
+
+
+async def serve(host=DEFAULT_HOST, port=DEFAULT_PORT, database=None, readers=READERS, token=None):
+    """Run the server until cancelled."""
+    server = ExpenseServer(database, readers=readers, token=token)
+    listener = await server.start(host, port)
+    print(f'Serving {server.database} on http://{host}:{server.port}')
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+
+DESCRIPTION = 'Serve the expenses as a local HTTP/JSON API.'
+
+
+def add_arguments(parser):
+    parser.add_argument('--host', default=DEFAULT_HOST,
+                        help=f'address to listen on (default: {DEFAULT_HOST}; 0.0.0.0 for the whole network)')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f'port to listen on (default: {DEFAULT_PORT})')
+    parser.add_argument('--readers', type=int, default=READERS, help=f'read connections (default: {READERS})')
+    parser.add_argument('--token', help='require this bearer token on every request')
+    parser.add_argument('--database', help='database file (default: from expense_tracker.ini)')
+
+
+def run(args, parser):
+    try:
+        asyncio.run(serve(args.host, args.port, args.database, args.readers, args.token))
+    except KeyboardInterrupt:
+        pass
+    except OSError as error:
+        parser.exit(1, f'{error}\n')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=DESCRIPTION)
+    add_arguments(parser)
+    run(parser.parse_args(argv), parser)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,284 @@
+"""Group commit: many small writes, few transactions.
+
+Committing is most of the cost of adding one expense: every commit takes
+the write lock, appends to the -wal file and, with durability = safe, waits
+for the disk.  `WriteQueue` commits writes from any thread on a thread of its
+own, and everything that arrives while one batch is being committed goes into
+the next one, up to `write_batch_rows` rows.  A lone write is committed
+straight away; a burst from several API clients costs a few commits instead
+of one per row.  `write_batch_ms` also holds a batch back until its first
+write has waited that long, to gather more; that only pays off for writers
+that do not wait for their result, and slows down those that do, so it is 0
+by default.
+
+Every write still succeeds or fails by itself: it runs under a savepoint,
+so an invalid amount or an archived expense only rolls back that write.
+Callers get a concurrent.futures.Future that resolves once their write is
+committed:
+
+    writes = WriteQueue()
+    expense = writes.add(Expense(datetime.date.today(), 'Cafe', 'Lunch', '12.50', 'Card', 'Food')).result()
+    writes.update(expense.id, amount='14.00')
+    writes.close()
+
+"database is locked" does not fail a batch straight away.  SQLite waits up
+to busy_timeout for a lock, but gives up at once when waiting could
+deadlock, and another program may hold the lock for longer; the whole batch
+is then retried after a growing, randomized pause (`backoff`), up to
+LOCK_RETRIES times.
+
+Once the writes pause for SETTLE_DELAY, and when the queue is closed, the
+running sums of the daily totals are settled (see schema.py).
+"""
+
+import queue
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+
+from .database import connect, load_settings
+from .repository import ExpenseRepository
+from .schema import settle_daily_totals
+
+# Retries of a batch that found the database locked, and the range of the
+# pause before them, in seconds
+LOCK_RETRIES = 5
+BACKOFF_START = 0.05
+BACKOFF_LIMIT = 2.0
+
+LOCKED_MESSAGES = ('database is locked', 'database is busy', 'database table is locked')
+
+# Seconds without writes after which the daily totals are settled
+SETTLE_DELAY = 1.0
+
+
+def is_locked(error):
+    """Whether `error` means another connection held a lock, so trying again later can work."""
+    return isinstance(error, sqlite3.OperationalError) and str(error).startswith(LOCKED_MESSAGES)
+
+
+def backoff(attempt, start=BACKOFF_START, limit=BACKOFF_LIMIT):
+    """Seconds to wait before retry number `attempt` (from 0): doubling up to `limit`, half of it random.
+
+    The random half keeps writers that were locked out together from all
+    coming back at the same moment.
+    """
+    pause = min(limit, start * 2 ** attempt)
+    return pause / 2 + random.uniform(0, pause / 2)
+
+
+class _Write:
+    def __init__(self, stage, finish, rows):
+        # stage(repository) runs in the batch transaction, finish(repository,
+        # staged) after the commit and returns the result of the future
+        self.stage = stage
+        self.finish = finish
+        self.rows = rows
+        self.future = Future()
+        self.queued = time.monotonic()
+
+
+class WriteQueue:
+    def __init__(self, database=None, settings=None, max_rows=None, max_delay=None, retries=LOCK_RETRIES):
+        self.settings = settings if settings is not None else load_settings()
+        self.database = database if database is not None else self.settings['database']
+        self.max_rows = max_rows if max_rows is not None else int(self.settings['write_batch_rows'])
+        self.max_delay = (max_delay if max_delay is not None
+                          else float(self.settings['write_batch_ms']) / 1000)
+        self.retries = retries
+
+        self._queue = queue.SimpleQueue()
+        self._closed = False
+        # What opening the connection raised, which every write then fails with
+        self._error = None
+        # Whether anything was committed since the daily totals were settled
+        self._written = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='WriteQueue', daemon=True)
+        self._thread.start()
+
+    # Any thread
+    def _submit(self, stage, finish, rows=1):
+        write = _Write(stage, finish, rows)
+        with self._lock:
+            if self._error is not None:
+                raise self._error
+            if self._closed:
+                raise RuntimeError('The write queue is closed')
+            self._queue.put(write)
+        return write.future
+
+    def add(self, expense):
+        """Store `expense`; the future resolves to it, with its new ID."""
+        def finish(repository, expense_id):
+            expense.id = expense_id
+            return expense
+
+        return self._submit(lambda repository: repository.stage_add(expense), finish)
+
+    def add_many(self, expenses):
+        """Store all of `expenses` or, if one of them fails, none; the future resolves to them with their IDs."""
+        expenses = list(expenses)
+
+        def finish(repository, ids):
+            for expense, expense_id in zip(expenses, ids):
+                expense.id = expense_id
+            return expenses
+
+        return self._submit(lambda repository: [repository.stage_add(expense) for expense in expenses], finish,
+                            max(len(expenses), 1))
+
+    def update(self, expense_id, **changes):
+        """Like ExpenseRepository.update; the future resolves to None."""
+        return self._submit(lambda repository: repository.stage_update(expense_id, **changes),
+                            lambda repository, found: _check_found(repository, expense_id, found))
+
+    def delete(self, expense_id):
+        """Like ExpenseRepository.delete; the future resolves to None."""
+        return self._submit(lambda repository: repository.stage_delete(expense_id),
+                            lambda repository, found: _check_found(repository, expense_id, found))
+
+    def close(self):
+        """Commit what is queued and stop the thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(None)
+        self._thread.join()
+
+    # Writer thread
+    def _run(self):
+        try:
+            connector = connect(self.database, self.settings)
+        except Exception as error:
+            self._fail(error)
+            return
+        repository = ExpenseRepository(connector)
+        try:
+            while True:
+                try:
+                    write = self._queue.get(timeout=SETTLE_DELAY if self._written else None)
+                except queue.Empty:
+                    self._settle(connector)
+                    continue
+                batch, more = self._next_batch(write)
+                if batch:
+                    self._commit(connector, repository, batch)
+                if not more:
+                    self._settle(connector)
+                    return
+        finally:
+            connector.close()
+
+    def _fail(self, error):
+        # Refuse new writes, then fail the ones already queued
+        with self._lock:
+            self._error = error
+            self._closed = True
+        while True:
+            try:
+                write = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if write is not None and write.future.set_running_or_notify_cancel():
+                write.future.set_exception(error)
+
+    def _settle(self, connector):
+        # Backdated writes leave the running sums of the daily totals to be
+        # settled (see schema.py); doing it once the writes pause keeps range
+        # totals quick without slowing the writes down
+        if not self._written:
+            return
+        self._written = False
+        try:
+            if connector.execute('SELECT 1 FROM UnsettledDays').fetchone() is None:
+                return
+            connector.execute('BEGIN IMMEDIATE')
+            settle_daily_totals(connector)
+            connector.commit()
+        except Exception as error:
+            connector.rollback()
+            # Tried again after the next pause; the scripts' maintenance settles them too
+            self._written = is_locked(error)
+
+    def _next_batch(self, write):
+        # Gathers more writes after `write` until the batch is full or the
+        # first write has waited max_delay; returns the batch and whether to
+        # go on.  Under load the first write already waited while the
+        # previous batch was committed, so the next batch starts at once.
+        if write is None:
+            return [], False
+        batch = [write]
+        rows = write.rows
+        deadline = write.queued + self.max_delay
+        while rows < self.max_rows:
+            try:
+                write = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                break
+            if write is None:
+                return self._started(batch), False
+            batch.append(write)
+            rows += write.rows
+        return self._started(batch), True
+
+    @staticmethod
+    def _started(batch):
+        # Writes whose future was cancelled while they waited are dropped
+        return [write for write in batch if write.future.set_running_or_notify_cancel()]
+
+    def _commit(self, connector, repository, batch):
+        attempt = 0
+        while True:
+            try:
+                staged = self._stage(connector, repository, batch)
+                connector.commit()
+                self._written = True
+                break
+            except Exception as error:
+                connector.rollback()
+                if is_locked(error) and attempt < self.retries:
+                    time.sleep(backoff(attempt))
+                    attempt += 1
+                    continue
+                for write in batch:
+                    write.future.set_exception(error)
+                return
+
+        for write, (value, error) in zip(batch, staged):
+            if error is None:
+                try:
+                    value = write.finish(repository, value)
+                except Exception as finish_error:
+                    error = finish_error
+            if error is None:
+                write.future.set_result(value)
+            else:
+                write.future.set_exception(error)
+
+    @staticmethod
+    def _stage(connector, repository, batch):
+        # (value, error) for every write; a locked database aborts the whole
+        # batch so that it can be retried
+        connector.execute('BEGIN IMMEDIATE')
+        staged = []
+        for write in batch:
+            connector.execute('SAVEPOINT write')
+            try:
+                staged.append((write.stage(repository), None))
+            except Exception as error:
+                if is_locked(error):
+                    raise
+                connector.execute('ROLLBACK TO write')
+                staged.append((None, error))
+            connector.execute('RELEASE write')
+        return staged
+
+
+def _check_found(repository, expense_id, found):
+    # An expense that was not in ExpenseTracker may be in a read-only archive
+    if not found:
+        repository.check_archived(expense_id)
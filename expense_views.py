@@ -0,0 +1,364 @@
+"""Windows and widgets the scripts share.
+
+"ai based.py", "import datetime.py" and main_charts.py only differ in their
+layout and in the buttons they offer, so the views behind those buttons live
+here once: the search bar above the expense table, the monthly summary, the
+totals by date, the AI suggestions, importing statements and exchange rates,
+exporting, and the messages shown when a write or a query fails.  Queries run
+on the script's DBWorker and writes go through its WriteQueue, as everywhere
+else; each script keeps its own handlers, which call these.
+"""
+
+import datetime
+from tkinter import (BOTH, BOTTOM, BROWSE, END, LEFT, NO, RIGHT, TOP, VERTICAL, E, W, X, Y, Button, Entry, Frame,
+                     Label, OptionMenu, Scrollbar, StringVar, Toplevel)
+import tkinter.filedialog as fd
+import tkinter.messagebox as mb
+import tkinter.ttk as ttk
+
+from tkcalendar import DateEntry
+
+from expense_core import (DEFAULT_CURRENCY, ArchivedExpenseError, expense_filter, export_file, format_amount,
+                          import_file, to_decimal)
+from lazy_imports import lazy_import
+from summary_tree import SummaryTree
+
+fx = lazy_import('expense_core.fx')
+forecast = lazy_import('expense_core.forecast')
+
+# Milliseconds of quiet typing before the search runs
+SEARCH_DELAY = 150
+
+
+def show_db_error(error):
+    mb.showerror('Database error', f'The expenses could not be loaded:\n{error}')
+
+
+def show_write_error(error):
+    if isinstance(error, ArchivedExpenseError):
+        mb.showerror('Archived expense', str(error))
+    elif isinstance(error, ValueError):
+        mb.showerror('Invalid expense', str(error))
+    else:
+        mb.showerror('Database error', f'The change could not be saved:\n{error}')
+
+
+def parse_search_date(value):
+    try:
+        return datetime.date.fromisoformat(value.strip())
+    except ValueError:
+        return None
+
+
+def parse_search_amount(value):
+    try:
+        return to_decimal(value)
+    except ValueError:
+        return None
+
+
+class SearchBar:
+    """As-you-type prefix search on payee and description, narrowed down by date, amount and category.
+
+    `on_search(expense_filter)` gets the filter to show.  Typing quickly runs
+    one query for the last keystroke only; fields that are empty or not filled
+    in completely yet are ignored.
+    """
+
+    def __init__(self, parent, root, categories, on_search, timed=None):
+        self.root = root
+        self.on_search = on_search
+        self._after = None
+        if timed is not None:
+            self.search = timed(self.search)
+
+        self.text = StringVar()
+        self.start = StringVar()
+        self.end = StringVar()
+        self.min_amount = StringVar()
+        self.max_amount = StringVar()
+        self.category = StringVar(value='All')
+
+        self.frame = Frame(parent)
+        self.frame.pack(side=TOP, fill=X)
+
+        Label(self.frame, text='Search:').pack(side=LEFT, padx=(5, 2))
+        Entry(self.frame, textvariable=self.text, width=20).pack(side=LEFT)
+        Label(self.frame, text='From:').pack(side=LEFT, padx=(8, 2))
+        Entry(self.frame, textvariable=self.start, width=11).pack(side=LEFT)
+        Label(self.frame, text='To:').pack(side=LEFT, padx=(8, 2))
+        Entry(self.frame, textvariable=self.end, width=11).pack(side=LEFT)
+        # Amount bounds only match expenses in the default currency
+        Label(self.frame, text=f'Amount ({DEFAULT_CURRENCY}):').pack(side=LEFT, padx=(8, 2))
+        Entry(self.frame, textvariable=self.min_amount, width=8).pack(side=LEFT)
+        Label(self.frame, text='-').pack(side=LEFT)
+        Entry(self.frame, textvariable=self.max_amount, width=8).pack(side=LEFT)
+        OptionMenu(self.frame, self.category, 'All', *categories).pack(side=LEFT, padx=(8, 2))
+        Button(self.frame, text='Clear', command=self.clear).pack(side=LEFT, padx=(2, 5))
+
+        for variable in self._variables() + (self.category,):
+            variable.trace_add('write', lambda *args: self.schedule())
+
+    def _variables(self):
+        return self.text, self.start, self.end, self.min_amount, self.max_amount
+
+    def schedule(self):
+        if self._after is not None:
+            self.root.after_cancel(self._after)
+        self._after = self.root.after(SEARCH_DELAY, self.search)
+
+    def search(self):
+        self._after = None
+        selected_category = self.category.get()
+        self.on_search(expense_filter(
+            self.text.get(),
+            start=parse_search_date(self.start.get()),
+            end=parse_search_date(self.end.get()),
+            categories=None if selected_category == 'All' else [selected_category],
+            min_amount=parse_search_amount(self.min_amount.get()),
+            max_amount=parse_search_amount(self.max_amount.get()),
+        ))
+
+    def clear(self):
+        for variable in self._variables():
+            variable.set('')
+        self.category.set('All')
+
+
+def summarize_expenses(root, db_worker, currency, on_error=show_db_error):
+    """Open the year -> month -> category summary of every expense converted into `currency`."""
+    summary_window = Toplevel(root)
+    summary_window.title("Expense Summary")
+    summary_window.geometry("600x600")
+    summary_window.configure(bg='#E9ECEF')  # Light grey background
+
+    Label(summary_window, text=f"Monthly Expense Summary ({currency})", font=("Helvetica", 20, 'bold'), bg='#E9ECEF', fg='#343A40').pack(pady=20)
+
+    close_btn = Button(summary_window, text="Close", command=lambda: close_summary(), font=("Helvetica", 12), bg='#007BFF', fg='white', bd=0, padx=10, pady=5)
+    close_btn.pack(side=BOTTOM, pady=20)
+
+    close_btn.bind("<Enter>", lambda e: close_btn.configure(bg='#0056b3'))
+    close_btn.bind("<Leave>", lambda e: close_btn.configure(bg='#007BFF'))
+
+    total_label = Label(summary_window, text="Crunching the numbers...", font=("Helvetica", 16), bg='#E9ECEF', fg='#343A40')
+    total_label.pack(side=BOTTOM, pady=10)
+
+    # Years open into months and months into categories, filled in as they are opened
+    summary_frame = Frame(summary_window, bg='#E9ECEF')
+    summary_frame.pack(fill=BOTH, expand=True, padx=10)
+
+    summary_table = ttk.Treeview(summary_frame, columns=('Total',), selectmode=BROWSE)
+    summary_table.heading('#0', text='Period', anchor=W)
+    summary_table.heading('Total', text='Total', anchor=E)
+    summary_table.column('Total', width=150, anchor=E, stretch=NO)
+    summary_scroller = Scrollbar(summary_frame, orient=VERTICAL, command=summary_table.yview)
+    summary_table.config(yscrollcommand=summary_scroller.set)
+    summary_scroller.pack(side=RIGHT, fill=Y)
+    summary_table.pack(fill=BOTH, expand=True)
+
+    summary = SummaryTree(summary_table)
+
+    def show_summary(pivot):
+        summary.show(pivot)
+        total_label.configure(text=f"Total Expenses: {format_amount(pivot.total(), currency)}")
+
+    # The monthly totals are read on the database worker; closing the window cancels it
+    summary_job = db_worker.submit(lambda connection: fx.converted_monthly_pivot(connection, currency), on_done=show_summary, on_error=on_error)
+
+    def close_summary():
+        db_worker.cancel(summary_job)
+        summary_window.destroy()
+
+    summary_window.protocol('WM_DELETE_WINDOW', close_summary)
+
+
+def totals_by_date(root, db_worker, currency, on_error=show_db_error, timed=None):
+    """Open a window with the totals per category between two dates, this month so far to begin with."""
+    totals_window = Toplevel(root)
+    totals_window.title(f"Totals by Date ({currency})")
+    totals_window.geometry("500x450")
+
+    today = datetime.date.today()
+    picker_frame = Frame(totals_window)
+    picker_frame.pack(side=TOP, pady=10)
+    Label(picker_frame, text='From:').pack(side=LEFT, padx=(5, 2))
+    range_from = DateEntry(picker_frame, date=today.replace(day=1), date_pattern='yyyy-mm-dd')
+    range_from.pack(side=LEFT)
+    Label(picker_frame, text='To:').pack(side=LEFT, padx=(8, 2))
+    range_to = DateEntry(picker_frame, date=today, date_pattern='yyyy-mm-dd')
+    range_to.pack(side=LEFT)
+    Button(picker_frame, text='Show', command=lambda: show_range()).pack(side=LEFT, padx=(8, 5))
+
+    total_label = Label(totals_window, text="Adding up...", font=("Helvetica", 14))
+    total_label.pack(side=BOTTOM, pady=10)
+
+    range_table = ttk.Treeview(totals_window, columns=('Category', 'Expenses', 'Total'), show='headings')
+    range_table.heading('Category', text='Category', anchor=W)
+    range_table.heading('Expenses', text='Expenses', anchor=E)
+    range_table.heading('Total', text='Total', anchor=E)
+    range_table.column('Expenses', width=80, anchor=E, stretch=NO)
+    range_table.column('Total', width=150, anchor=E, stretch=NO)
+    range_table.pack(fill=BOTH, expand=True, padx=10)
+
+    range_job = None
+
+    def read_range(connection, start, end):
+        # Two lookups in the running daily totals, however long the range, plus
+        # two a month for each other currency, converted at that month's rates
+        return fx.converted_range_totals(connection, start, end, currency)
+
+    def show_range():
+        nonlocal range_job
+        start, end = range_from.get_date(), range_to.get_date()
+        if start > end:
+            mb.showerror('Totals by Date', 'The first date is after the last one.', parent=totals_window)
+            return
+        db_worker.cancel(range_job)
+        range_job = db_worker.submit(lambda connection: read_range(connection, start, end), on_done=show_totals,
+                                     on_error=on_error)
+
+    def show_totals(totals):
+        categories, total = totals
+        range_table.delete(*range_table.get_children())
+        for name, row in categories:
+            range_table.insert('', END, values=(name or '(uncategorised)', row.expenses,
+                                                format_amount(row.total, currency)))
+        total_label.configure(text=f"Total: {format_amount(total.total, currency)} in {total.expenses} expenses")
+
+    def close_totals():
+        db_worker.cancel(range_job)
+        totals_window.destroy()
+
+    if timed is not None:
+        show_range = timed(show_range)
+    totals_window.protocol('WM_DELETE_WINDOW', close_totals)
+    show_range()
+
+
+class SpendingSuggestions:
+    """The AI suggestions: a forecast of next month's spending in `currency`, shown in a message box."""
+
+    def __init__(self, db_worker, currency, on_error=show_db_error):
+        self.db_worker = db_worker
+        self.currency = currency
+        self.on_error = on_error
+        self._job = None
+
+    def show(self):
+        # The query and the model fit run on the database worker so the window
+        # stays responsive; a new click replaces an unfinished request
+        self.db_worker.cancel(self._job)
+        self._job = self.db_worker.submit(self.predict, on_done=self._display, on_error=self.on_error)
+
+    def predict(self, connection):
+        # Trend and seasonality are fitted to the monthly totals kept in the
+        # database, converted into the reporting currency like the summary's, so
+        # no expense rows are read (None with fewer than 10 expenses)
+        return forecast.forecast_spending(connection, currency=self.currency, convert=True)
+
+    def _display(self, prediction):
+        if prediction is None:
+            mb.showinfo('Insufficient Data', 'Add more expense data to get AI-based suggestions.')
+            return
+
+        next_month = prediction.total[0]
+        predicted_expense = next_month.expected
+        top_category, top_amount = prediction.top_category, prediction.top_amount
+
+        def money(amount):
+            return format_amount(amount, self.currency)
+
+        suggestion_message = (
+            f"🔮 *AI Spending Suggestions*:\n\n"
+            f"- Based on your data, next month's predicted total expense is: {money(predicted_expense)}.\n"
+            f"- It will most likely be between {money(next_month.low)} and {money(next_month.high)} (95% interval).\n"
+        )
+        # Without any categorised expense there is no category to point at
+        if top_category is not None:
+            top_forecast = prediction.categories[top_category][0]
+            suggestion_message += (
+                f"- Your highest spending category so far is '{top_category}' with a total of {money(top_amount)}; "
+                f"next month it is expected to be {money(top_forecast.expected)}.\n"
+                f"- Try limiting your expenses in the '{top_category}' category if needed.\n"
+            )
+        suggestion_message += (
+            f"- You might want to set a spending limit for the next month to {money(predicted_expense * 0.9)}."
+        )
+
+        mb.showinfo("AI Expense Suggestions", suggestion_message)
+
+
+def import_statement(root, db_worker, on_finished=None):
+    """Ask for a bank statement and import it with a progress window; `on_finished()` once it is over."""
+    path = fd.askopenfilename(title='Import bank statement',
+                              filetypes=[('Bank statements', '*.csv *.ofx *.qfx'), ('All files', '*.*')])
+    if not path:
+        return
+
+    def finished():
+        progress_window.destroy()
+        if on_finished is not None:
+            on_finished()
+
+    progress_window = Toplevel(root)
+    progress_window.title('Importing statement')
+    progress_label = Label(progress_window, text='Reading the statement...')
+    progress_label.pack(padx=20, pady=10)
+    progress_bar = ttk.Progressbar(progress_window, length=300, maximum=1.0)
+    progress_bar.pack(padx=20, pady=10)
+
+    def show_progress(progress):
+        imported, fraction = progress
+        progress_bar['value'] = fraction
+        progress_label.configure(text=f'{imported:,} expenses imported...')
+
+    def import_done(imported):
+        finished()
+        mb.showinfo('Statement imported', f'{imported:,} expenses were imported from the statement.')
+
+    def import_failed(error):
+        finished()
+        mb.showerror('Import failed', f'The statement could not be imported:\n{error}')
+
+    # Batches are committed as they go; the import stops after the current one
+    # when cancelled, and the indexes and monthly totals are always rebuilt
+    import_job = db_worker.submit(
+        lambda connection, progress: import_file(connection, path, progress=lambda *value: progress(value)),
+        on_done=import_done, on_error=import_failed, on_progress=show_progress, interruptible=False
+    )
+
+    def cancel_import():
+        db_worker.cancel(import_job)
+        finished()
+
+    Button(progress_window, text='Cancel', command=cancel_import).pack(pady=10)
+    progress_window.protocol('WM_DELETE_WINDOW', cancel_import)
+
+
+def export_expenses(db_worker):
+    """Ask for a file and export every expense to it, in the format of its extension."""
+    path = fd.asksaveasfilename(title='Export expenses', defaultextension='.csv',
+                                filetypes=[('CSV', '*.csv'), ('JSON Lines', '*.jsonl'), ('Parquet', '*.parquet')])
+    if not path:
+        return
+
+    # Streams the table in batches on the database worker
+    db_worker.submit(
+        lambda connection: export_file(connection, path),
+        on_done=lambda exported: mb.showinfo('Expenses exported', f'{exported:,} expenses were exported to {path}.'),
+        on_error=lambda error: mb.showerror('Export failed', f'The expenses could not be exported:\n{error}')
+    )
+
+
+def import_exchange_rates(db_worker):
+    """Ask for a rate file and load its exchange rates."""
+    path = fd.askopenfilename(title='Import exchange rates', filetypes=[('Rate files', '*.csv'), ('All files', '*.*')])
+    if not path:
+        return
+
+    # The rates only feed the converted totals, so the table needs no reload
+    db_worker.submit(
+        lambda connection: fx.import_rates(connection, path),
+        on_done=lambda imported: mb.showinfo('Exchange rates imported', f'{imported:,} exchange rates were imported from {path}.'),
+        on_error=lambda error: mb.showerror('Import failed', f'The exchange rates could not be imported:\n{error}')
+    )
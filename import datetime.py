@@ -1,36 +1,41 @@
 import datetime
-import sqlite3
-import pandas as pd
 from tkcalendar import DateEntry
 from tkinter import *
 import tkinter.messagebox as mb
 import tkinter.ttk as ttk
-import matplotlib.pyplot as plt
-import numpy as np
-from sklearn.linear_model import LinearRegression
-import calendar  # For getting month names
+from paged_table import PagedTable
+from db_worker import DBWorker
+from expense_core import Expense, ExpenseRepository, WriteQueue, connect, display_row, load_settings, migrate
+from lazy_imports import lazy_import, warm_up
+from chart_panel import CHART_MODULES, ChartPanel
+from maintenance import Maintenance
+from diagnostics_panel import Diagnostics
+import expense_views as views
+from expense_views import SearchBar, SpendingSuggestions, show_db_error, show_write_error
+
+# The analytics stack is only imported when a chart or suggestion needs it
+forecast = lazy_import('expense_core.forecast')
 
 # Connecting to the Database
-connector = sqlite3.connect("Expense Tracker.db")
+connector = connect()
 cursor = connector.cursor()
 
-cursor.execute(
-    'CREATE TABLE IF NOT EXISTS ExpenseTracker (ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, Date DATETIME, Payee TEXT, Description TEXT, Amount FLOAT, ModeOfPayment TEXT, Category TEXT)'
-)
-connector.commit()
+# Creating the table, or upgrading an older database to the current schema
+migrate(connector)
+# Adds, edits and deletes are committed together with those of other windows and of the API server
+writes = WriteQueue()
+
+# The summary and the chart show every expense converted into this currency
+reporting_currency = load_settings()['reporting_currency']
 
 # Functions
 def list_all_expenses():
-    global connector, table
-    table.delete(*table.get_children())
-    all_data = connector.execute('SELECT * FROM ExpenseTracker')
-    data = all_data.fetchall()
-
-    for values in data:
-        table.insert('', END, values=values)
+    global expenses_view
+    # Only the first page is loaded here, the rest is fetched as the table scrolls
+    expenses_view.reset()
 
 def view_expense_details():
-    global table, date, payee, desc, amnt, MoP, category
+    global table, date, payee, desc, amnt, currency, MoP, category
     if not table.selection():
         mb.showerror('No expense selected', 'Please select an expense from the table to view its details')
         return
@@ -45,13 +50,15 @@ def view_expense_details():
     amnt.set(values[4])
     MoP.set(values[5])
     category.set(values[6])
+    currency.set(values[7])
 
 def clear_fields():
-    global desc, payee, amnt, MoP, date, category, table
+    global desc, payee, amnt, currency, MoP, date, category, table
     today_date = datetime.datetime.now().date()
     desc.set('')
     payee.set('')
-    amnt.set(0.0)
+    amnt.set('')
+    currency.set(reporting_currency)
     MoP.set('Cash')
     category.set('Food')
     date.set_date(today_date)
@@ -67,55 +74,71 @@ def remove_expense():
 
     surety = mb.askyesno('Are you sure?', f'Are you sure that you want to delete the record of {values_selected[2]}?')
     if surety:
-        connector.execute('DELETE FROM ExpenseTracker WHERE ID=?', (values_selected[0],))
-        connector.commit()
-        list_all_expenses()
-        mb.showinfo('Record deleted successfully!', 'The record you wanted to delete has been deleted successfully.')
+        def removed(_):
+            expenses_view.row_removed(values_selected[0])
+            mb.showinfo('Record deleted successfully!', 'The record you wanted to delete has been deleted successfully.')
+
+        # The window keeps running while the write waits for the database
+        db_worker.follow(writes.delete(values_selected[0]), on_done=removed, on_error=show_write_error)
 
 def remove_all_expenses():
     surety = mb.askyesno('Are you sure?', 'Are you sure that you want to delete all the expense items from the database?', icon='warning')
     if surety:
-        connector.execute('DELETE FROM ExpenseTracker')
-        connector.commit()
-        clear_fields()
-        list_all_expenses()
-        mb.showinfo('All Expenses deleted', 'All the expenses were successfully deleted.')
+        # Snapshot the ledger first; the expenses are only deleted once it is saved
+        maintenance.backup_now(then=lambda connection: ExpenseRepository(connection).delete_all(),
+                               on_done=all_expenses_removed, on_error=remove_all_failed)
     else:
         mb.showinfo('Ok then', 'The task was aborted and no expense was deleted!')
 
+def all_expenses_removed(snapshot_path):
+    clear_fields()
+    expenses_view.clear()
+    mb.showinfo('All Expenses deleted', f'All the expenses were successfully deleted.\nA copy of them was saved to {snapshot_path}')
+
+def remove_all_failed(error):
+    mb.showerror('Backup failed', f'The expenses could not be backed up, so nothing was deleted:\n{error}')
+
+def show_backup_error(error):
+    mb.showerror('Backup failed', f'The scheduled backup of the expenses failed:\n{error}')
+
 def add_another_expense():
-    global date, payee, desc, amnt, MoP, category, connector
+    global date, payee, desc, amnt, currency, MoP, category, expenses
 
     if not date.get() or not payee.get() or not desc.get() or not amnt.get() or not MoP.get() or not category.get():
         mb.showerror('Fields empty!', "Please fill all the missing fields before pressing the add button!")
     else:
-        connector.execute(
-            'INSERT INTO ExpenseTracker (Date, Payee, Description, Amount, ModeOfPayment, Category) VALUES (?, ?, ?, ?, ?, ?)',
-            (date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get(), category.get())
-        )
-        connector.commit()
-        clear_fields()
-        list_all_expenses()
-        mb.showinfo('Expense added', 'The expense whose details you just entered has been added to the database.')
+        try:
+            new_expense = Expense(date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get(), category.get(),
+                                  currency.get())
+        except ValueError as error:
+            mb.showerror('Invalid expense', str(error))
+            return
+
+        def added(stored):
+            clear_fields()
+            expenses_view.row_added(stored.id)
+            mb.showinfo('Expense added', 'The expense whose details you just entered has been added to the database.')
+
+        db_worker.follow(writes.add(new_expense), on_done=added, on_error=show_write_error)
 
 def edit_expense():
     global table
 
     def edit_existing_expense():
-        global date, amnt, desc, payee, MoP, category, connector
+        global date, amnt, currency, desc, payee, MoP, category, expenses
         current_selected_expense = table.item(table.focus())
         contents = current_selected_expense['values']
 
-        connector.execute(
-            'UPDATE ExpenseTracker SET Date=?, Payee=?, Description=?, Amount=?, ModeOfPayment=?, Category=? WHERE ID=?',
-            (date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get(), category.get(), contents[0])
-        )
-        connector.commit()
+        def updated(_):
+            clear_fields()
+            expenses_view.row_updated(contents[0])
+            mb.showinfo('Data edited', 'We have updated the data and stored it in the database as you wanted.')
+            edit_btn.destroy()
 
-        clear_fields()
-        list_all_expenses()
-        mb.showinfo('Data edited', 'We have updated the data and stored it in the database as you wanted.')
-        edit_btn.destroy()
+        db_worker.follow(writes.update(contents[0], date=date.get_date(), payee=payee.get(), description=desc.get(),
+                                       amount=amnt.get(), currency=currency.get(), mode_of_payment=MoP.get(),
+                                       category=category.get()),
+                         on_done=updated, on_error=show_write_error)
 
     if not table.selection():
         mb.showerror('No expense selected!', 'You have not selected any expense in the table for us to edit; please do that!')
@@ -127,118 +150,27 @@ def edit_expense():
     edit_btn.place(x=10, y=400)
 
 def summarize_expenses():
-    summary_window = Toplevel(root)
-    summary_window.title("Expense Summary")
-    summary_window.geometry("600x600")
-    summary_window.configure(bg='#E9ECEF')  # Light grey background
-
-    Label(summary_window, text="Monthly Expense Summary", font=("Helvetica", 20, 'bold'), bg='#E9ECEF', fg='#343A40').pack(pady=20)
-
-    monthly_summary = {}
-    yearly_total = 0
-
-    for row in connector.execute('SELECT strftime("%Y-%m", Date) as month, Category, SUM(Amount) FROM ExpenseTracker GROUP BY month, Category'):
-        month, category, total = row
-        yearly_total += total
-
-        if month not in monthly_summary:
-            monthly_summary[month] = {}
-        monthly_summary[month][category] = total
-
-    monthly_frame = Frame(summary_window, bg='#FFFFFF', bd=2, relief='flat')
-    monthly_frame.pack(pady=20, padx=10, fill='both', expand=True)
-
-    for month in sorted(monthly_summary.keys()):
-        month_year = month.split('-')
-        month_name = calendar.month_name[int(month_year[1])]
-        year = month_year[0]
-
-        month_header = Frame(monthly_frame, bg='#007BFF')
-        month_header.pack(fill='x', padx=10, pady=(10, 0))
-
-        Label(month_header, text=f"{month_name} {year}", font=("Helvetica", 16, 'bold'), bg='#007BFF', fg='white').pack(pady=10)
-
-        total_month = 0
-        for category, amount in monthly_summary[month].items():
-            Label(monthly_frame, text=f"{category}: ₹{amount:.2f}", anchor='w', bg='#FFFFFF', fg='#333').pack(anchor='w', padx=20, pady=5)
-            total_month += amount
+    views.summarize_expenses(root, db_worker, reporting_currency)
 
-        Label(monthly_frame, text=f"Total for {month_name} {year}: ₹{total_month:.2f}", font=("Helvetica", 14, 'italic'), bg='#F8F9FA', fg='#007BFF').pack(anchor='w', padx=20, pady=(5, 10))
-
-    yearly_frame = Frame(summary_window, bg='#F1F1F1', bd=2, relief='flat')
-    yearly_frame.pack(pady=20, padx=10, fill='both', expand=True)
-
-    Label(yearly_frame, text="--- Total Yearly Expenses ---", font=("Helvetica", 18, 'bold'), bg='#F1F1F1', fg='#343A40').pack(pady=10)
-    Label(yearly_frame, text=f"Total Yearly Expense: ₹{yearly_total:.2f}", font=("Helvetica", 16), bg='#F1F1F1', fg='#343A40').pack(pady=10)
-
-    close_btn = Button(summary_window, text="Close", command=summary_window.destroy, font=("Helvetica", 12), bg='#007BFF', fg='white', bd=0, padx=10, pady=5)
-    close_btn.pack(pady=20)
-
-    close_btn.bind("<Enter>", lambda e: close_btn.configure(bg='#0056b3'))
-    close_btn.bind("<Leave>", lambda e: close_btn.configure(bg='#007BFF'))
+def totals_by_date():
+    views.totals_by_date(root, db_worker, reporting_currency, timed=diagnostics.timed)
 
 def visualize_expenses():
-    data = connector.execute('SELECT strftime("%Y-%m", Date) as month, Category, SUM(Amount) FROM ExpenseTracker GROUP BY month, Category').fetchall()
-
-    categories = ['Food', 'Fun', 'Work', 'Misc', 'Home']
-    month_expenses = {}
-    
-    for row in data:
-        month, category, total = row
-        if month not in month_expenses:
-            month_expenses[month] = {cat: 0 for cat in categories}
-        month_expenses[month][category] += total
-
-    months = list(month_expenses.keys())
-    x = np.arange(len(months))
-    width = 0.15
-
-    for i, category in enumerate(categories):
-        heights = [month_expenses[month][category] for month in months]
-        plt.bar(x + i * width, heights, width, label=category)
-
-    plt.xlabel('Months')
-    plt.ylabel('Amount')
-    plt.title('Monthly Expenses by Category')
-    plt.xticks(x + width, months)
-    plt.legend(title='Categories')
-    plt.tight_layout()
-    plt.show()
+    chart_panel.show()
 
 # AI Suggestion Function
 def ai_spending_suggestions():
-    data = connector.execute('SELECT Date, Category, Amount FROM ExpenseTracker').fetchall()
-    
-    if len(data) < 10:
-        mb.showinfo('Insufficient Data', 'Add more expense data to get AI-based suggestions.')
-        return
-
-    df = pd.DataFrame(data, columns=['Date', 'Category', 'Amount'])
-    df['Date'] = pd.to_datetime(df['Date'])
-    df['Month'] = df['Date'].dt.to_period('M')
-
-    monthly_expenses = df.groupby('Month')['Amount'].sum().reset_index()
-
-    monthly_expenses['MonthIndex'] = range(len(monthly_expenses))
-    X = monthly_expenses[['MonthIndex']]
-    y = monthly_expenses['Amount']
-
-    model = LinearRegression()
-    model.fit(X, y)
-    predicted_expense = model.predict([[len(monthly_expenses)]])
+    suggestions.show()
 
-    category_spending = df.groupby('Category')['Amount'].sum().reset_index()
-    top_category = category_spending.loc[category_spending['Amount'].idxmax()]
+def import_statement():
+    # The table is listed again however the import ends
+    views.import_statement(root, db_worker, on_finished=list_all_expenses)
 
-    suggestion_message = (
-        f"🔮 *AI Spending Suggestions*:\n\n"
-        f"- Based on your data, next month's predicted total expense is: ₹{predicted_expense[0]:.2f}.\n"
-        f"- Your highest spending category so far is '{top_category['Category']}' with a total of ₹{top_category['Amount']:.2f}.\n"
-        f"- Try limiting your expenses in the '{top_category['Category']}' category if needed.\n"
-        f"- You might want to set a spending limit for the next month to ₹{(predicted_expense[0] * 0.9):.2f}."
-    )
+def export_expenses():
+    views.export_expenses(db_worker)
 
-    mb.showinfo("AI Expense Suggestions", suggestion_message)
+def import_exchange_rates():
+    views.import_exchange_rates(db_worker)
 
 # Function to configure scrolling when resizing
 def configure_canvas(event):
@@ -254,6 +186,16 @@ root.title('Personal Expense Tracker')
 root.geometry('1000x700')  # Adjusted size for better layout
 root.resizable(0, 0)
 
+# With diagnostics = on in expense_tracker.ini, the buttons are timed from the
+# click until the window is painted again, along with every query; F12 shows them
+diagnostics = Diagnostics(root)
+(list_all_expenses, view_expense_details, add_another_expense, edit_expense, remove_expense,
+ remove_all_expenses, summarize_expenses, totals_by_date, visualize_expenses, ai_spending_suggestions, import_statement,
+ export_expenses, import_exchange_rates) = diagnostics.timed(
+    list_all_expenses, view_expense_details, add_another_expense, edit_expense, remove_expense,
+    remove_all_expenses, summarize_expenses, totals_by_date, visualize_expenses, ai_spending_suggestions, import_statement,
+    export_expenses, import_exchange_rates)
+
 # Create a canvas and a scrollbar
 canvas = Canvas(root)
 scrollbar = Scrollbar(root, orient=VERTICAL, command=canvas.yview)
@@ -282,10 +224,11 @@ scrollbar.pack(side=RIGHT, fill=Y)
 Label(scrollable_frame, text='EXPENSE TRACKER', font=('Noto Sans CJK TC', 20, 'bold'), bg='IndianRed').pack(side=TOP, fill=X, pady=10)
 
 desc = StringVar()
-amnt = DoubleVar()
+amnt = StringVar()
 payee = StringVar()
 MoP = StringVar(value='Cash')
 category = StringVar(value='Food')
+currency = StringVar(value=reporting_currency)
 
 # Frames
 data_entry_frame = Frame(scrollable_frame, bg='white')
@@ -308,8 +251,9 @@ Entry(data_entry_frame, textvariable=payee, font=('Times 13 bold')).place(x=10,
 Label(data_entry_frame, text='Description:', font=('Georgia', 13), bg='white').place(x=10, y=170)
 Entry(data_entry_frame, textvariable=desc, font=('Times 13 bold')).place(x=10, y=200, width=150)
 
-Label(data_entry_frame, text='Amount:', font=('Georgia', 13), bg='white').place(x=10, y=240)
+Label(data_entry_frame, text='Amount and currency:', font=('Georgia', 13), bg='white').place(x=10, y=240)
 Entry(data_entry_frame, textvariable=amnt, font=('Times 13 bold')).place(x=10, y=270, width=150)
+Entry(data_entry_frame, textvariable=currency, font=('Times 13 bold')).place(x=170, y=270, width=60)
 
 Label(data_entry_frame, text='Mode of Payment:', font=('Georgia', 13), bg='white').place(x=10, y=310)
 OptionMenu(data_entry_frame, MoP, 'Cash', 'Card', 'Online').place(x=10, y=340)
@@ -330,10 +274,19 @@ Button(buttons_frame, text='Remove All Expenses', font=btn_font, bg=hlb_btn_bg,
 Button(buttons_frame, text='Summarize Expenses', font=btn_font, bg=hlb_btn_bg, command=summarize_expenses).grid(row=1, column=2, padx=10, pady=5, sticky='ew')
 Button(buttons_frame, text='Visualize Expenses', font=btn_font, bg=hlb_btn_bg, command=visualize_expenses).grid(row=1, column=3, padx=10, pady=5, sticky='ew')
 
-Button(buttons_frame, text='AI Suggestions', font=btn_font, bg=hlb_btn_bg, command=ai_spending_suggestions).grid(row=2, column=0, columnspan=4, padx=10, pady=5, sticky='ew')
+Button(buttons_frame, text='AI Suggestions', font=btn_font, bg=hlb_btn_bg, command=ai_spending_suggestions).grid(row=2, column=0, padx=10, pady=5, sticky='ew')
+Button(buttons_frame, text='Totals by Date', font=btn_font, bg=hlb_btn_bg, command=totals_by_date).grid(row=2, column=1, padx=10, pady=5, sticky='ew')
+Button(buttons_frame, text='Import FX Rates', font=btn_font, bg=hlb_btn_bg, command=import_exchange_rates).grid(row=2, column=2, columnspan=2, padx=10, pady=5, sticky='ew')
+Button(buttons_frame, text='Import Bank Statement', font=btn_font, bg=hlb_btn_bg, command=import_statement).grid(row=3, column=0, columnspan=2, padx=10, pady=5, sticky='ew')
+Button(buttons_frame, text='Export Expenses', font=btn_font, bg=hlb_btn_bg, command=export_expenses).grid(row=3, column=2, columnspan=2, padx=10, pady=5, sticky='ew')
+
+# Search bar: as-you-type prefix search on payee and description,
+# narrowed down by date, amount and category
+search_bar = SearchBar(tree_frame, root, ('Food', 'Fun', 'Work', 'Misc', 'Home'),
+                       on_search=lambda search: expenses_view.set_filter(search), timed=diagnostics.timed)
 
 # Treeview for displaying expenses
-columns = ('ID', 'Date', 'Payee', 'Description', 'Amount', 'ModeOfPayment', 'Category')
+columns = ('ID', 'Date', 'Payee', 'Description', 'Amount', 'ModeOfPayment', 'Category', 'Currency')
 table = ttk.Treeview(tree_frame, columns=columns, show='headings')
 table.heading('ID', text='ID')
 table.heading('Date', text='Date')
@@ -342,6 +295,7 @@ table.heading('Description', text='Description')
 table.heading('Amount', text='Amount')
 table.heading('ModeOfPayment', text='Mode of Payment')
 table.heading('Category', text='Category')
+table.heading('Currency', text='Currency')
 table.column('ID', width=50)
 table.column('Date', width=100)
 table.column('Payee', width=100)
@@ -349,13 +303,37 @@ table.column('Description', width=150)
 table.column('Amount', width=100)
 table.column('ModeOfPayment', width=100)
 table.column('Category', width=100)
+table.column('Currency', width=60)
 table.pack(fill=BOTH, expand=True)
 
+expenses_view = PagedTable(table, connector, columns, format_row=display_row)
+
+# Slow queries run on their own connection in the background;
+# Escape cancels whatever is still running
+db_worker = DBWorker(root)
+root.bind('<Escape>', lambda event: db_worker.cancel_all())
+
+# Snapshots and PRAGMA optimize on a schedule, on a connection of their own
+maintenance = Maintenance(root, on_error=show_backup_error)
+diagnostics.watch(db_worker, maintenance.worker)
+
+# The chart window, rendered on the worker and cached until the data changes
+chart_panel = ChartPanel(root, db_worker, reporting_currency, on_error=show_db_error)
+
+# Next month's forecast, fitted on the worker
+suggestions = SpendingSuggestions(db_worker, reporting_currency)
+
+# Load the analytics stack in the background once the window is showing
+root.after(1000, lambda: warm_up(forecast, *CHART_MODULES))
+
 # Initialize and populate the table
 list_all_expenses()
 
 # Run the application
 root.mainloop()
 
-# Close the database connection
+# Close the database connections
+maintenance.close()
+writes.close()
+db_worker.close()
 connector.close()
\ No newline at end of file
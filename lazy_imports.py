@@ -0,0 +1,58 @@
+"""Deferred imports for the heavy analytics stack.
+
+pandas, scikit-learn, matplotlib and numpy take well over a second and tens
+of MB to import, but only the summary chart and the AI suggestions need them.
+`lazy_import` returns a stand-in that imports the real module the first time
+one of its attributes is used; `warm_up` imports them on a background thread
+once the window is up, so the first click does not wait either.
+"""
+
+import importlib
+import threading
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__['_name'] = name
+        self.__dict__['_module'] = None
+        self.__dict__['_lock'] = threading.Lock()
+
+    def _load(self):
+        # The GUI, the DB worker and the warm-up thread may all ask at once
+        with self._lock:
+            if self._module is None:
+                self.__dict__['_module'] = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __setattr__(self, attribute, value):
+        setattr(self._load(), attribute, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded yet'
+        return f'<lazy module {self._name!r} ({state})>'
+
+
+def lazy_import(name):
+    return LazyModule(name)
+
+
+def warm_up(*modules):
+    """Import the given lazy modules on a daemon thread."""
+    def load_all():
+        for module in modules:
+            try:
+                module._load()
+            except ImportError:
+                # Reported properly when the feature that needs it is used
+                pass
+
+    thread = threading.Thread(target=load_all, name='warm-up', daemon=True)
+    thread.start()
+    return thread
@@ -1,31 +1,30 @@
 import datetime
-import sqlite3
 from tkcalendar import DateEntry
 
 from tkinter import *
 import tkinter.messagebox as mb
 import tkinter.ttk as ttk
 
+from paged_table import PagedTable
+from maintenance import Maintenance
+from diagnostics_panel import Diagnostics
+from expense_core import COLUMNS, ArchivedExpenseError, Expense, ExpenseRepository, WriteQueue, connect, display_row, migrate
+
 # Connecting to the Database
-connector = sqlite3.connect("Expense Tracker.db")
+connector = connect()
 cursor = connector.cursor()
 
-connector.execute(
-	'CREATE TABLE IF NOT EXISTS ExpenseTracker (ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, Date DATETIME, Payee TEXT, Description TEXT, Amount FLOAT, ModeOfPayment TEXT)'
-)
-connector.commit()
+# Creating the table, or upgrading an older database to the current schema
+migrate(connector)
+# Adds, edits and deletes are committed together with those of other windows and of the API server
+writes = WriteQueue()
 
 # Functions
 def list_all_expenses():
-	global connector, table
-
-	table.delete(*table.get_children())
-
-	all_data = connector.execute('SELECT * FROM ExpenseTracker')
-	data = all_data.fetchall()
+	global expenses_view
 
-	for values in data:
-		table.insert('', END, values=values)
+	# Only the first page is loaded here, the rest is fetched as the table scrolls
+	expenses_view.reset()
 
 
 def view_expense_details():
@@ -48,7 +47,7 @@ def clear_fields():
 
 	today_date = datetime.datetime.now().date()
 
-	desc.set('') ; payee.set('') ; amnt.set(0.0) ; MoP.set('Cash'), date.set_date(today_date)
+	desc.set('') ; payee.set('') ; amnt.set('') ; MoP.set('Cash'), date.set_date(today_date)
 	table.selection_remove(*table.selection())
 
 
@@ -63,45 +62,68 @@ def remove_expense():
 	surety = mb.askyesno('Are you sure?', f'Are you sure that you want to delete the record of {values_selected[2]}')
 
 	if surety:
-		connector.execute('DELETE FROM ExpenseTracker WHERE ID=%d' % values_selected[0])
-		connector.commit()
+		def removed(_):
+			expenses_view.row_removed(values_selected[0])
+			mb.showinfo('Record deleted successfully!', 'The record you wanted to delete has been deleted successfully')
 
-		list_all_expenses()
-		mb.showinfo('Record deleted successfully!', 'The record you wanted to delete has been deleted successfully')
+		# The window keeps running while the write waits for the database;
+		# this script has no DBWorker of its own, the maintenance one passes the result back
+		maintenance.worker.follow(writes.delete(values_selected[0]), on_done=removed, on_error=show_write_error)
 
 
 def remove_all_expenses():
 	surety = mb.askyesno('Are you sure?', 'Are you sure that you want to delete all the expense items from the database?', icon='warning')
 
 	if surety:
-		table.delete(*table.get_children())
+		# Snapshot the ledger first; the expenses are only deleted once it is saved
+		maintenance.backup_now(then=lambda connection: ExpenseRepository(connection).delete_all(),
+		                       on_done=all_expenses_removed, on_error=remove_all_failed)
+	else:
+		mb.showinfo('Ok then', 'The task was aborted and no expense was deleted!')
+
+
+def all_expenses_removed(snapshot_path):
+	clear_fields()
+	expenses_view.clear()
+	mb.showinfo('All Expenses deleted', f'All the expenses were successfully deleted\nA copy of them was saved to {snapshot_path}')
+
+
+def remove_all_failed(error):
+	mb.showerror('Backup failed', f'The expenses could not be backed up, so nothing was deleted:\n{error}')
 
-		connector.execute('DELETE FROM ExpenseTracker')
-		connector.commit()
 
-		clear_fields()
-		list_all_expenses()
-		mb.showinfo('All Expenses deleted', 'All the expenses were successfully deleted')
+def show_backup_error(error):
+	mb.showerror('Backup failed', f'The scheduled backup of the expenses failed:\n{error}')
+
+
+def show_write_error(error):
+	if isinstance(error, ArchivedExpenseError):
+		mb.showerror('Archived expense', str(error))
+	elif isinstance(error, ValueError):
+		mb.showerror('Invalid amount', str(error))
 	else:
-		mb.showinfo('Ok then', 'The task was aborted and no expense was deleted!')
+		mb.showerror('Database error', f'The change could not be saved:\n{error}')
 
 
 def add_another_expense():
 	global date, payee, desc, amnt, MoP
-	global connector
+	global writes
 
 	if not date.get() or not payee.get() or not desc.get() or not amnt.get() or not MoP.get():
 		mb.showerror('Fields empty!', "Please fill all the missing fields before pressing the add button!")
 	else:
-		connector.execute(
-		'INSERT INTO ExpenseTracker (Date, Payee, Description, Amount, ModeOfPayment) VALUES (?, ?, ?, ?, ?)',
-		(date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get())
-		)
-		connector.commit()
+		try:
+			new_expense = Expense(date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get())
+		except ValueError as error:
+			mb.showerror('Invalid amount', str(error))
+			return
+
+		def added(stored):
+			clear_fields()
+			expenses_view.row_added(stored.id)
+			mb.showinfo('Expense added', 'The expense whose details you just entered has been added to the database')
 
-		clear_fields()
-		list_all_expenses()
-		mb.showinfo('Expense added', 'The expense whose details you just entered has been added to the database')
+		maintenance.worker.follow(writes.add(new_expense), on_done=added, on_error=show_write_error)
 
 
 def edit_expense():
@@ -109,20 +131,22 @@ def edit_expense():
 
 	def edit_existing_expense():
 		global date, amnt, desc, payee, MoP
-		global connector, table
+		global writes, table
 
 		current_selected_expense = table.item(table.focus())
 		contents = current_selected_expense['values']
 
-		connector.execute('UPDATE ExpenseTracker SET Date = ?, Payee = ?, Description = ?, Amount = ?, ModeOfPayment = ? WHERE ID = ?',
-		                  (date.get_date(), payee.get(), desc.get(), amnt.get(), MoP.get(), contents[0]))
-		connector.commit()
+		# main.py has no category field, so the category is left as it is
+		def updated(_):
+			clear_fields()
+			expenses_view.row_updated(contents[0])
 
-		clear_fields()
-		list_all_expenses()
+			mb.showinfo('Data edited', 'We have updated the data and stored in the database as you wanted')
+			edit_btn.destroy()
 
-		mb.showinfo('Data edited', 'We have updated the data and stored in the database as you wanted')
-		edit_btn.destroy()
+		maintenance.worker.follow(writes.update(contents[0], date=date.get_date(), payee=payee.get(),
+		                                        description=desc.get(), amount=amnt.get(), mode_of_payment=MoP.get()),
+		                          on_done=updated, on_error=show_write_error)
 		return
 
 	if not table.selection():
@@ -182,11 +206,19 @@ root.title('Personal Expense Tracker')
 root.geometry('1200x550')
 root.resizable(0, 0)
 
+# With diagnostics = on in expense_tracker.ini, the buttons are timed from the
+# click until the window is painted again, along with every query; F12 shows them
+diagnostics = Diagnostics(root)
+(list_all_expenses, view_expense_details, add_another_expense, edit_expense, remove_expense,
+ remove_all_expenses, selected_expense_to_words) = diagnostics.timed(
+    list_all_expenses, view_expense_details, add_another_expense, edit_expense, remove_expense,
+    remove_all_expenses, selected_expense_to_words)
+
 Label(root, text='EXPENSE TRACKER', font=('Noto Sans CJK TC', 15, 'bold'), bg=hlb_btn_bg).pack(side=TOP, fill=X)
 
 # StringVar and DoubleVar variables
 desc = StringVar()
-amnt = DoubleVar()
+amnt = StringVar()
 payee = StringVar()
 MoP = StringVar(value='Cash')
 
@@ -246,7 +278,7 @@ Y_Scroller = Scrollbar(table, orient=VERTICAL, command=table.yview)
 X_Scroller.pack(side=BOTTOM, fill=X)
 Y_Scroller.pack(side=RIGHT, fill=Y)
 
-table.config(yscrollcommand=Y_Scroller.set, xscrollcommand=X_Scroller.set)
+table.config(xscrollcommand=X_Scroller.set)
 
 table.heading('ID', text='S No.', anchor=CENTER)
 table.heading('Date', text='Date', anchor=CENTER)
@@ -265,8 +297,19 @@ table.column('#6', width=125, stretch=NO)  # Mode of Payment column
 
 table.place(relx=0, y=0, relheight=1, relwidth=1)
 
+# The Treeview shows the first six of COLUMNS; Tk ignores the extra values
+expenses_view = PagedTable(table, connector, COLUMNS, format_row=display_row,
+                           scrollbar=Y_Scroller)
+
 list_all_expenses()
 
+# Snapshots and PRAGMA optimize on a schedule, in the background
+maintenance = Maintenance(root, on_error=show_backup_error)
+diagnostics.watch(maintenance.worker)
+
 # Finalizing the GUI window
 root.update()
 root.mainloop()
+
+maintenance.close()
+writes.close()
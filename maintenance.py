@@ -0,0 +1,94 @@
+"""Backups and upkeep while a script is running.
+
+Maintenance takes a snapshot of the ledger when the newest one is older than
+`backup_interval_hours`, and runs `expense_core.backup.maintain` every
+`maintenance_interval_hours` (both from expense_tracker.ini).  In between,
+every check settles the running sums of the daily totals, so that range
+totals do not have to add up many days changed since.  The work runs
+on a DBWorker of its own, so a backup never delays the queries of the
+window, and the backup copies a few pages at a time, so it never holds up
+the window's writes for long either.
+
+`backup_now` takes a snapshot straight away and can run a job right after
+it; the scripts use that to back the ledger up before deleting every expense.
+"""
+
+import datetime
+
+from db_worker import DBWorker
+from expense_core import load_settings
+from expense_core.backup import backup_directory, last_snapshot_time, maintain, snapshot
+from expense_core.schema import settle_daily_totals
+
+# When (ms after start) and how often the schedule is checked
+FIRST_CHECK = 60 * 1000
+CHECK_INTERVAL = 10 * 60 * 1000
+
+
+class Maintenance:
+    def __init__(self, root, settings=None, on_error=None, first_check=FIRST_CHECK, check_interval=CHECK_INTERVAL):
+        self.root = root
+        self.settings = settings if settings is not None else load_settings()
+        self.on_error = on_error
+        self.check_interval = check_interval
+
+        self.backup_interval = datetime.timedelta(hours=float(self.settings['backup_interval_hours']))
+        self.maintenance_interval = datetime.timedelta(hours=float(self.settings['maintenance_interval_hours']))
+        self._last_maintenance = None
+        self._job = None
+
+        self.worker = DBWorker(root, self.settings['database'])
+        self._after_id = self.root.after(first_check, self._check)
+
+    # Worker thread
+    def _snapshot(self, connection, progress):
+        # DBWorker progress reports are single values
+        return snapshot(connection, self.settings['backup_directory'], int(self.settings['backup_keep']),
+                        progress=lambda copied, total: progress((copied, total)))
+
+    def _scheduled(self, connection, progress):
+        now = datetime.datetime.now()
+        database = self.settings['database']
+        taken = last_snapshot_time(database, backup_directory(connection, self.settings['backup_directory']))
+        if taken is None or now - taken >= self.backup_interval:
+            self._snapshot(connection, progress)
+        if self._last_maintenance is None or now - self._last_maintenance >= self.maintenance_interval:
+            maintain(connection)
+            self._last_maintenance = now
+        else:
+            settle_daily_totals(connection)
+            connection.commit()
+
+    # Tk thread
+    def _check(self):
+        self._after_id = self.root.after(self.check_interval, self._check)
+        if self._job is None or self._job.finished:
+            # Cancelling it at exit stops the backup at its next step
+            self._job = self.worker.submit(self._scheduled, on_error=self._failed, on_progress=lambda value: None,
+                                           interruptible=False)
+
+    def _failed(self, error):
+        if self.on_error is not None:
+            self.on_error(error)
+
+    def backup_now(self, then=None, on_done=None, on_error=None):
+        """Take a snapshot, then run `then(connection)` if given; `on_done(snapshot path)` runs on the Tk thread.
+
+        `then` only runs if the snapshot was taken.
+        """
+        def work(connection, progress):
+            path = self._snapshot(connection, progress)
+            if then is not None:
+                then(connection)
+            return path
+
+        return self.worker.submit(work, on_done=on_done, on_error=on_error or self._failed,
+                                  on_progress=lambda value: None, interruptible=False)
+
+    def close(self):
+        try:
+            self.root.after_cancel(self._after_id)
+        except Exception:
+            # The Tk interpreter is already gone after mainloop returned
+            pass
+        self.worker.close()
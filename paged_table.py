@@ -0,0 +1,290 @@
+"""Windowed ("virtual") mode for the expenses ttk.Treeview.
+
+Instead of `SELECT * ... fetchall()` and inserting every row, PagedTable keeps
+only a few pages of ExpenseTracker in the Treeview.  Pages are fetched with
+keyset pagination (`WHERE key > last_key ORDER BY key LIMIT n`), so reading a
+page costs the same on page 1 and page 10,000, and pages that scroll far out
+of view are dropped again so memory stays flat as the ledger grows.
+
+`set_filter` narrows the table to the expenses matching an ExpenseFilter,
+e.g. a full-text search, and pages through those the same way.  Archived
+years are paged through together with the ledger: every query has one part
+per partition, which SQLite merges in key order (see expense_core.archive).
+
+Rows are shown through `format_row`, e.g. `expense_core.display_row` to turn
+the stored minor units into amounts; keys are always taken from the raw rows.
+"""
+
+from bisect import bisect_left
+from tkinter import END
+
+from expense_core import ExpenseFilter, partitioned_query
+
+# How close (as a fraction of the scroll region) to an edge the view has to be
+# before the next/previous page is fetched
+SCROLL_THRESHOLD = 0.1
+
+# Keyset columns for the supported sort orders.  ID alone is unique; Date is
+# made unique by adding ID as a tie breaker.
+SORT_KEYS = {
+    'ID': ('ID',),
+    'Date': ('Date', 'ID'),
+}
+
+# Key columns selected and compared as an expression.  NULL compares as
+# neither smaller nor larger, in SQL or Python, so undated expenses take the
+# empty string and come first (indexed as ExpenseDateOrder).
+KEY_EXPRESSIONS = {
+    'Date': "IFNULL(ExpenseTracker.Date, '')",
+}
+
+
+class PagedTable:
+    def __init__(self, table, connector, columns, sort='ID', page_size=200, max_pages=5, scrollbar=None,
+                 format_row=None):
+        if sort not in SORT_KEYS:
+            raise ValueError(f'Unsupported sort order {sort!r}, expected one of {sorted(SORT_KEYS)}')
+
+        self.table = table
+        self.connector = connector
+        self.columns = tuple(columns)
+        self.key_columns = SORT_KEYS[sort]
+        self.page_size = page_size
+        self.max_pages = max_pages
+        self.scrollbar = scrollbar
+        self.format_row = format_row if format_row is not None else tuple
+
+        # Positions of the key columns inside a fetched row
+        self._key_index = [self.columns.index(col) for col in self.key_columns]
+
+        # Each page is the list of Treeview item ids it holds, in key order, and
+        # _keys maps every item id to its key.  The keys of the first and last
+        # row currently shown drive the next fetch.
+        self._pages = []
+        self._keys = {}
+        self._first_key = None
+        self._last_key = None
+        self._at_start = True
+        self._at_end = False
+        self._loading = False
+
+        self.filter = ExpenseFilter()
+        self._key_sql = self._key_expressions()
+        self._expressions = {col: KEY_EXPRESSIONS[col] for col in self.key_columns if col in KEY_EXPRESSIONS}
+
+        self.table.config(yscrollcommand=self._on_scroll)
+
+    # Queries
+    def _key_expressions(self):
+        # The filter decides what ID is ordered by, see ExpenseFilter
+        return tuple(self.filter.id_column if col == 'ID' else KEY_EXPRESSIONS.get(col, f'ExpenseTracker.{col}')
+                     for col in self.key_columns)
+
+    def _select(self, key_condition, key, order):
+        # Each partition is filtered by the key expressions, the merged result
+        # is ordered by the key columns' names
+        sql, params = partitioned_query(self.connector, self.filter, self.columns, key_condition, key,
+                                        self._expressions)
+        order_by = ', '.join(f'{col} {order}' for col in self.key_columns)
+        return self.connector.execute(f'{sql} ORDER BY {order_by} LIMIT ?', (*params, self.page_size)).fetchall()
+
+    def _key_condition(self, op, key):
+        # The condition and its parameters
+        if len(self._key_sql) == 1:
+            return f'{self._key_sql[0]} {op} ?', key
+        # SQLite only seeks an index for a row value compared on plain
+        # columns, so the first key is also compared on its own
+        placeholders = ', '.join('?' * len(self._key_sql))
+        return f'{self._key_sql[0]} {op}= ? AND ({", ".join(self._key_sql)}) {op} ({placeholders})', (key[0], *key)
+
+    def _row_key(self, row):
+        return tuple(row[i] for i in self._key_index)
+
+    def _fetch_row(self, expense_id):
+        # None when the row does not exist or does not match the filter
+        sql, params = partitioned_query(self.connector, self.filter, self.columns, f'{self._key_sql[-1]} = ?',
+                                        (expense_id,), self._expressions)
+        return self.connector.execute(sql, params).fetchone()
+
+    # Page management
+    def _insert_page(self, rows, index):
+        items = []
+        for offset, values in enumerate(rows):
+            iid = str(values[0])
+            self.table.insert('', index if index == END else index + offset, iid=iid, values=self.format_row(values))
+            self._keys[iid] = self._row_key(values)
+            items.append(iid)
+        return items
+
+    def _update_bounds(self):
+        self._first_key = self._keys[self._pages[0][0]] if self._pages else None
+        self._last_key = self._keys[self._pages[-1][-1]] if self._pages else None
+
+    def _drop_page(self, index):
+        items = self._pages.pop(index)
+        self.table.delete(*items)
+        for iid in items:
+            del self._keys[iid]
+        self._update_bounds()
+
+    def _drop_first_page(self):
+        self._drop_page(0)
+        self._at_start = False
+
+    def _drop_last_page(self):
+        self._drop_page(-1)
+        self._at_end = False
+
+    def clear(self):
+        """Empty the table without touching the database."""
+        self.table.delete(*self.table.get_children())
+        self._pages = []
+        self._keys = {}
+        self._first_key = self._last_key = None
+        self._at_start = True
+        self._at_end = True
+
+    def reset(self):
+        """Throw away whatever is shown and load the first page again."""
+        self.clear()
+
+        rows = self._select(None, (), 'ASC')
+        if rows:
+            self._pages.append(self._insert_page(rows, END))
+            self._update_bounds()
+        self._at_end = len(rows) < self.page_size
+
+    def set_filter(self, expense_filter=None):
+        """Only show the expenses matching `expense_filter` (all of them for None) and reload."""
+        self.filter = expense_filter if expense_filter is not None else ExpenseFilter()
+        self._key_sql = self._key_expressions()
+        self.reset()
+
+    def load_next_page(self):
+        if self._at_end or self._last_key is None:
+            return False
+
+        rows = self._select(*self._key_condition('>', self._last_key), 'ASC')
+        if len(rows) < self.page_size:
+            self._at_end = True
+        if not rows:
+            return False
+
+        anchor = self.table.get_children()[-1]
+        self._pages.append(self._insert_page(rows, END))
+        self._update_bounds()
+
+        if len(self._pages) > self.max_pages:
+            self._drop_first_page()
+            self.table.see(anchor)
+        return True
+
+    def load_previous_page(self):
+        if self._at_start or self._first_key is None:
+            return False
+
+        rows = self._select(*self._key_condition('<', self._first_key), 'DESC')
+        if len(rows) < self.page_size:
+            self._at_start = True
+        if not rows:
+            return False
+
+        rows.reverse()
+        anchor = self.table.get_children()[0]
+        self._pages.insert(0, self._insert_page(rows, 0))
+        self._update_bounds()
+
+        if len(self._pages) > self.max_pages:
+            self._drop_last_page()
+        self.table.see(anchor)
+        return True
+
+    # Single-row updates.  These touch one Treeview item (plus a binary search
+    # over the loaded window) instead of reloading the table, so they cost the
+    # same however big the ledger is.
+    def _place(self, iid, values):
+        key = self._row_key(values)
+
+        if not self._pages:
+            # Nothing loaded means the table was empty or has just been cleared
+            if self._at_start and self._at_end:
+                self._pages.append([])
+            else:
+                return
+        elif key < self._first_key and not self._at_start:
+            return
+        elif key > self._last_key and not self._at_end:
+            # Beyond the loaded window, it will be fetched when scrolled to
+            return
+
+        # Find the page the key falls into, then its position inside the page
+        page_no = 0
+        while page_no < len(self._pages) - 1 and key > self._keys[self._pages[page_no][-1]]:
+            page_no += 1
+        page = self._pages[page_no]
+        position = bisect_left([self._keys[item] for item in page], key)
+
+        index = sum(len(p) for p in self._pages[:page_no]) + position
+        self.table.insert('', index, iid=iid, values=self.format_row(values))
+        self._keys[iid] = key
+        page.insert(position, iid)
+        self._update_bounds()
+
+    def _forget(self, iid):
+        self.table.delete(iid)
+        for page_no, page in enumerate(self._pages):
+            if iid in page:
+                page.remove(iid)
+                if not page:
+                    del self._pages[page_no]
+                break
+        del self._keys[iid]
+        self._update_bounds()
+
+    def row_added(self, expense_id):
+        """Show a freshly inserted row (e.g. cursor.lastrowid) if it falls in the loaded window."""
+        values = self._fetch_row(expense_id)
+        if values is not None:
+            self._place(str(values[0]), values)
+
+    def row_updated(self, expense_id):
+        """Refresh the item of an edited row in place."""
+        iid = str(expense_id)
+        values = self._fetch_row(expense_id)
+
+        if iid in self._keys:
+            if values is not None and self._row_key(values) == self._keys[iid]:
+                self.table.item(iid, values=self.format_row(values))
+                return
+            # The sort key changed, so the row has to move
+            self._forget(iid)
+
+        if values is not None:
+            self._place(iid, values)
+
+    def row_removed(self, expense_id):
+        """Drop the item of a deleted row."""
+        iid = str(expense_id)
+        if iid in self._keys:
+            self._forget(iid)
+            if not self._pages and not (self._at_start and self._at_end):
+                # The whole window was deleted, start again from the top
+                self.reset()
+
+    # Scrolling
+    def _on_scroll(self, first, last):
+        if self.scrollbar is not None:
+            self.scrollbar.set(first, last)
+
+        # Fetching a page scrolls the Treeview, which calls back in here
+        if self._loading:
+            return
+
+        self._loading = True
+        try:
+            if float(last) >= 1 - SCROLL_THRESHOLD:
+                self.load_next_page()
+            elif float(first) <= SCROLL_THRESHOLD:
+                self.load_previous_page()
+        finally:
+            self._loading = False
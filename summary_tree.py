@@ -0,0 +1,74 @@
+"""Collapsible year -> month -> category view of the monthly totals.
+
+The summary window used to create a Label for every month and category up
+front, which took seconds and thousands of widgets after a few years of
+expenses.  SummaryTree shows a MonthlyPivot (one read of the rollup table,
+see `expense_core.fx.converted_monthly_pivot`) in a ttk.Treeview instead:
+only the years are inserted at first, and the months of a year or the
+categories of a month are inserted the first time that node is opened, so
+the window costs the same however long the history is.
+"""
+
+import calendar
+from tkinter import END
+
+from expense_core import format_amount
+
+
+def month_title(month):
+    """'March 2024' for '2024-03'."""
+    year, number = month.split('-')
+    return f'{calendar.month_name[int(number)]} {year}'
+
+
+class SummaryTree:
+    def __init__(self, table):
+        self.table = table
+        self.pivot = None
+        self._month_totals = None
+        # Nodes whose children have not been inserted yet, with what inserts them
+        self._pending = {}
+
+        self.table.bind('<<TreeviewOpen>>', self._on_open)
+
+    def show(self, pivot):
+        """Replace the tree with the years of `pivot`."""
+        self.table.delete(*self.table.get_children())
+        self._pending.clear()
+        self.pivot = pivot
+        self._month_totals = pivot.month_totals()
+
+        for year, start, end in pivot.years():
+            total = pivot.amount(self._month_totals[start:end].sum())
+            item = self.table.insert('', END, text=year or 'Undated', values=(self._format(total),))
+            if year is None:
+                # Undated totals have no months to open
+                self._later(item, self._insert_categories, start)
+            else:
+                self._later(item, self._insert_months, start, end)
+
+    def _format(self, amount):
+        return format_amount(amount, self.pivot.currency)
+
+    def _later(self, item, insert, *args):
+        # A placeholder child makes the node openable until it is filled
+        self._pending[item] = (insert, args)
+        self.table.insert(item, END, text='...')
+
+    def _on_open(self, event):
+        item = self.table.focus()
+        insert, args = self._pending.pop(item, (None, ()))
+        if insert is not None:
+            self.table.delete(*self.table.get_children(item))
+            insert(item, *args)
+
+    def _insert_months(self, parent, start, end):
+        for index in range(start, end):
+            total = self.pivot.amount(self._month_totals[index])
+            item = self.table.insert(parent, END, text=month_title(self.pivot.months[index]),
+                                     values=(self._format(total),))
+            self._later(item, self._insert_categories, index)
+
+    def _insert_categories(self, parent, index):
+        for category, amount in self.pivot.cells(index):
+            self.table.insert(parent, END, text=category or 'Uncategorised', values=(self._format(amount),))
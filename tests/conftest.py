@@ -0,0 +1,36 @@
+"""Fixtures for the behavioural tests.
+
+    pytest tests
+
+Every test gets a fresh database in its own temporary directory, opened with
+the default settings whatever expense_tracker.ini says, and migrated to the
+current schema.
+"""
+
+import pytest
+
+from expense_core import ExpenseRepository, connect, migrate
+from expense_core.database import DEFAULT_SETTINGS
+
+
+@pytest.fixture
+def settings():
+    return dict(DEFAULT_SETTINGS)
+
+
+@pytest.fixture
+def database(tmp_path):
+    return str(tmp_path / 'Expense Tracker.db')
+
+
+@pytest.fixture
+def connector(database, settings):
+    connector = connect(database, settings)
+    migrate(connector)
+    yield connector
+    connector.close()
+
+
+@pytest.fixture
+def expenses(connector):
+    return ExpenseRepository(connector)
@@ -0,0 +1,55 @@
+"""Building ledgers and checking what the triggers derive from them."""
+
+import datetime
+
+from expense_core import Expense
+
+# Derived tables recomputed from ExpenseTracker, in the order the tables keep them
+MONTHLY_FROM_EXPENSES = (
+    "SELECT IFNULL(strftime('%Y-%m', Date), ''), IFNULL(Category, ''), Currency, IFNULL(SUM(Amount), 0), COUNT(*) "
+    "FROM ExpenseTracker GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+)
+DAILY_CATEGORY_FROM_EXPENSES = (
+    "SELECT IFNULL(Category, ''), Currency, date(Date), IFNULL(SUM(Amount), 0), COUNT(*) "
+    "FROM ExpenseTracker WHERE date(Date) IS NOT NULL GROUP BY 1, 2, 3 ORDER BY 1, 2, 3"
+)
+DAILY_FROM_EXPENSES = (
+    "SELECT Currency, date(Date), IFNULL(SUM(Amount), 0), COUNT(*) "
+    "FROM ExpenseTracker WHERE date(Date) IS NOT NULL GROUP BY 1, 2 ORDER BY 1, 2"
+)
+
+
+def expense(day, amount, category='Food', currency='INR', payee='cafe', description='coffee'):
+    if isinstance(day, str):
+        day = datetime.date.fromisoformat(day)
+    return Expense(day, payee, description, amount, 'Cash', category, currency)
+
+
+def stored_totals(connector):
+    """MonthlyCategoryTotals, DailyCategoryTotals and DailyTotals as the triggers left them."""
+    return (
+        connector.execute('SELECT Month, Category, Currency, Total, Entries FROM MonthlyCategoryTotals '
+                          'ORDER BY 1, 2, 3').fetchall(),
+        connector.execute('SELECT Category, Currency, Day, Total, Entries FROM DailyCategoryTotals '
+                          'ORDER BY 1, 2, 3').fetchall(),
+        connector.execute('SELECT Currency, Day, Total, Entries FROM DailyTotals ORDER BY 1, 2').fetchall(),
+    )
+
+
+def recomputed_totals(connector):
+    """The same totals aggregated from the expenses."""
+    return tuple(connector.execute(sql).fetchall()
+                 for sql in (MONTHLY_FROM_EXPENSES, DAILY_CATEGORY_FROM_EXPENSES, DAILY_FROM_EXPENSES))
+
+
+def running_sums_are_settled(connector):
+    """Whether every running sum of DailyTotals equals the total of its day and all the days before."""
+    rows = connector.execute('SELECT Currency, Day, Total, Entries, RunningTotal, RunningEntries FROM DailyTotals '
+                             'ORDER BY Currency, Day').fetchall()
+    sums = {}
+    for currency, _, total, entries, running_total, running_entries in rows:
+        previous_total, previous_entries = sums.get(currency, (0, 0))
+        sums[currency] = (previous_total + total, previous_entries + entries)
+        if sums[currency] != (running_total, running_entries):
+            return False
+    return True
@@ -0,0 +1,66 @@
+import datetime
+import os
+import stat
+from decimal import Decimal
+
+import pytest
+
+from expense_core import ArchivedExpenseError, RangeTotal, archive_year
+from expense_core.archive import archive_path, archives, closed_years
+from expense_core.schema import rebuild_rollups
+
+from .helpers import expense, stored_totals
+
+
+@pytest.fixture
+def archived(connector, expenses, database):
+    """A ledger with 2022 and 2023 archived; the IDs of its expenses by year."""
+    ids = {}
+    for day, amount in (('2022-06-01', '10.00'), ('2023-01-01', '1.00'), ('2023-12-31', '2.00'),
+                        ('2024-01-01', '4.00')):
+        ids.setdefault(int(day[:4]), []).append(expenses.add(expense(day, amount, payee=f'shop {day}')).id)
+
+    totals = stored_totals(connector)
+    assert archive_year(connector, 2023) == 2
+    assert archive_year(connector, 2022, vacuum=True) == 1
+    assert stored_totals(connector) == totals
+    return ids
+
+
+def test_archives_are_listed_and_read_only(connector, database, archived):
+    assert list(archives(connector)) == [2022, 2023]
+    path = archive_path(database, 2023)
+    assert os.path.exists(path)
+    assert not os.stat(path).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+    assert connector.execute('SELECT COUNT(*) FROM ExpenseTracker').fetchone()[0] == 1
+    # 2024 is over but still in the ledger
+    assert closed_years(connector) == [2024]
+
+
+def test_listings_include_archived_years(expenses, archived):
+    assert [found.date.isoformat() for found in expenses.list()] == ['2022-06-01', '2023-01-01', '2023-12-31',
+                                                                      '2024-01-01']
+    listed = expenses.list(start='2023-06-01', end='2024-06-01')
+    assert [found.id for found in listed] == archived[2023][1:] + archived[2024]
+    assert [found.id for found in expenses.list(text='shop 2023')] == archived[2023]
+    assert expenses.get(archived[2022][0]).amount == Decimal('10.00')
+
+
+def test_totals_include_archived_years(connector, expenses, archived):
+    assert expenses.total() == Decimal('17.00')
+    year = expenses.range_total(datetime.date(2023, 1, 1), datetime.date(2023, 12, 31))
+    assert year == RangeTotal(Decimal('3.00'), 2)
+
+    # Rebuilding the rollups from the ledger adds the archived totals back in
+    rebuild_rollups(connector)
+    connector.commit()
+    assert expenses.total() == Decimal('17.00')
+    assert expenses.range_total(datetime.date(2022, 1, 1)) == RangeTotal(Decimal('17.00'), 4)
+
+
+def test_archived_expenses_cannot_change(expenses, archived):
+    with pytest.raises(ArchivedExpenseError):
+        expenses.update(archived[2023][0], amount='5.00')
+    with pytest.raises(ArchivedExpenseError):
+        expenses.delete(archived[2022][0])
+    assert expenses.total() == Decimal('17.00')
@@ -0,0 +1,48 @@
+import sqlite3
+import time
+
+import pytest
+
+from db_worker import DBWorker
+
+
+class Root:
+    """The part of Tk that DBWorker uses: `after` callbacks, run by `pump`."""
+
+    def __init__(self):
+        self.callbacks = {}
+        self.ids = 0
+
+    def after(self, ms, callback):
+        self.ids += 1
+        self.callbacks[self.ids] = callback
+        return self.ids
+
+    def after_cancel(self, after_id):
+        self.callbacks.pop(after_id, None)
+
+    def pump(self, until, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not until() and time.monotonic() < deadline:
+            callbacks, self.callbacks = self.callbacks, {}
+            for callback in callbacks.values():
+                callback()
+            time.sleep(0.01)
+
+
+def test_jobs_report_back_on_the_tk_thread(database, connector):
+    root = Root()
+    worker = DBWorker(root, database)
+    results, errors = [], []
+    worker.query('SELECT COUNT(*) FROM ExpenseTracker', on_done=results.append)
+    worker.query('SELECT * FROM NoSuchTable', on_done=results.append, on_error=errors.append)
+    root.pump(lambda: results and errors)
+    worker.close()
+    assert results == [[(0,)]]
+    assert isinstance(errors[0], sqlite3.OperationalError)
+
+
+def test_a_failed_connection_is_raised(tmp_path):
+    # Instead of waiting forever for the worker thread to be ready
+    with pytest.raises(sqlite3.OperationalError):
+        DBWorker(Root(), str(tmp_path / 'missing' / 'Expense Tracker.db'))
@@ -0,0 +1,38 @@
+import errno
+
+import pytest
+
+from expense_core.exporter import export_file, main
+
+from .helpers import expense
+
+
+@pytest.fixture
+def ledger(expenses):
+    for day in range(1, 4):
+        expenses.add(expense(f'2024-01-{day:02d}', f'{day}.00'))
+    return expenses
+
+
+def test_a_failed_export_leaves_the_earlier_one(connector, ledger, tmp_path):
+    path = tmp_path / 'expenses.csv'
+    assert export_file(connector, str(path)) == 3
+    exported = path.read_text(encoding='utf-8')
+    ledger.add(expense('2024-01-04', '4.00'))
+
+    def disk_full(rows):
+        raise OSError(errno.ENOSPC, 'No space left on device')
+
+    with pytest.raises(OSError):
+        export_file(connector, str(path), progress=disk_full)
+    assert path.read_text(encoding='utf-8') == exported
+    assert [found.name for found in tmp_path.glob('expenses.*')] == ['expenses.csv']
+
+
+def test_the_command_exits_on_a_write_error(connector, database, tmp_path, capsys):
+    path = tmp_path / 'missing' / 'expenses.csv'
+    with pytest.raises(SystemExit) as exited:
+        main([str(path), '--database', database])
+    assert exited.value.code == 1
+    assert 'Could not export' in capsys.readouterr().err
+    assert not path.parent.exists()
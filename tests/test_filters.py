@@ -0,0 +1,28 @@
+from decimal import Decimal
+
+from expense_core import DEFAULT_CURRENCY, expense_filter
+
+from .helpers import expense
+
+
+def ledger(expenses):
+    for day, amount, currency in (('2024-01-01', '500.00', 'INR'), ('2024-01-02', '50000', 'JPY'),
+                                  ('2024-01-03', '500.00', 'USD'), ('2024-01-04', '50.00', 'INR')):
+        expenses.add(expense(day, amount, currency=currency))
+
+
+def test_amount_bounds_are_in_one_currency(expenses):
+    ledger(expenses)
+    # Yen and dollars above 10000 minor units are not over 100 rupees
+    found = expenses.list(min_amount=Decimal('100'))
+    assert [(item.amount, item.currency) for item in found] == [(Decimal('500.00'), DEFAULT_CURRENCY)]
+    found = expenses.list(min_amount=Decimal('1000'), currency='JPY')
+    assert [(item.amount, item.currency) for item in found] == [(Decimal('50000'), 'JPY')]
+    assert len(expenses.list()) == 4
+
+
+def test_filter_conditions():
+    search = expense_filter('super groc', start='2024-01-01', categories=['Food'], min_amount=Decimal('1.5'))
+    assert 'ExpenseTracker.Currency = ?' in search.conditions
+    assert search.params == ('"super"* "groc"*', '2024-01-01', 'Food', DEFAULT_CURRENCY, 150)
+    assert expense_filter('').conditions == ()
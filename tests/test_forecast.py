@@ -0,0 +1,26 @@
+import pytest
+
+from expense_core import forecast
+
+from .helpers import expense
+
+expense_views = pytest.importorskip('expense_views')
+
+
+@pytest.fixture
+def uncategorised(expenses):
+    for month in range(1, 13):
+        expenses.add(expense(f'2024-{month:02d}-10', f'{month}.00', category=None))
+    return expenses
+
+
+def test_suggestions_without_a_category(connector, uncategorised, monkeypatch):
+    prediction = forecast.forecast_spending(connector)
+    assert prediction.top_category is None and prediction.top_amount == 0.0
+    assert list(prediction.categories) == [None]
+
+    shown = []
+    monkeypatch.setattr(expense_views.mb, 'showinfo', lambda title, message: shown.append(message))
+    expense_views.SpendingSuggestions(None, 'INR')._display(prediction)
+    assert 'category' not in shown[0] and 'None' not in shown[0]
+    assert "next month's predicted total expense" in shown[0]
@@ -0,0 +1,112 @@
+import io
+
+import pytest
+
+from expense_core import StatementError, import_file
+from expense_core.importer import parse_amount, read_csv, read_ofx
+
+from .helpers import recomputed_totals, running_sums_are_settled, stored_totals
+
+
+def csv_rows(text, **options):
+    return list(read_csv(io.StringIO(text), **options))
+
+
+def test_columns_are_found_by_their_usual_names():
+    rows = csv_rows('Txn Date,Narration,Merchant,Withdrawal,Ccy\n'
+                    '2024-03-01,Groceries,SuperMart,"1,234.50",\n'
+                    '2024-03-02,Lunch,Cafe,12.00,usd\n')
+    assert rows == [
+        ('2024-03-01', 'SuperMart', 'Groceries', 123450, 'Bank Import', 'Misc', 'INR'),
+        ('2024-03-02', 'Cafe', 'Lunch', 1200, 'Bank Import', 'Misc', 'USD'),
+    ]
+
+
+def test_explicit_mapping_and_date_format():
+    rows = csv_rows('When;Who;How much\n05/03/2024;Cafe;4.5\n', delimiter=';', date_format='%d/%m/%Y',
+                    mapping={'Date': 'When', 'Payee': 'Who', 'Amount': 'How much'}, category='Food')
+    assert rows == [('2024-03-05', 'Cafe', '', 450, 'Bank Import', 'Food', 'INR')]
+
+    with pytest.raises(StatementError):
+        csv_rows('Date,Amount\n2024-01-01,1\n', mapping={'Payee': 'Merchant'})
+
+
+def test_date_format_is_detected():
+    rows = csv_rows('Date,Amount\n31.12.2023,1\n01.01.2024,2\n')
+    assert [row[0] for row in rows] == ['2023-12-31', '2024-01-01']
+
+
+@pytest.mark.parametrize('text, minor', [
+    ('1234.5', 123450),
+    ('₹1,234.50', 123450),
+    ('(12.00)', -1200),
+    ('-7', -700),
+    (' 3 ', 300),
+])
+def test_parse_amount(text, minor):
+    assert parse_amount(text) == minor
+
+
+@pytest.mark.parametrize('text', ['', ' ', '-', '(  )', 'n/a'])
+def test_parse_amount_needs_digits(text):
+    with pytest.raises(ValueError):
+        parse_amount(text)
+
+
+def test_rows_without_a_date_are_skipped():
+    rows = csv_rows('Date,Amount\n\n,5\n2024-01-01,1\n')
+    assert [row[0] for row in rows] == ['2024-01-01']
+
+
+def test_rows_without_an_amount_are_skipped():
+    # The credits of an export with separate withdrawal and deposit columns
+    rows = csv_rows('Date,Narration,Withdrawal,Deposit\n2024-01-01,Rent,500.00,\n2024-01-02,Salary,,9000.00\n')
+    assert [(row[0], row[3]) for row in rows] == [('2024-01-01', 50000)]
+
+
+def test_errors_name_the_line():
+    with pytest.raises(StatementError, match='Line 3'):
+        csv_rows('Date,Amount\n2024-01-01,1\n2024-01-02,1.001\n')
+    with pytest.raises(StatementError, match='date'):
+        csv_rows('Date,Amount\nyesterday,1\n')
+    with pytest.raises(StatementError, match='Amount'):
+        csv_rows('Date,Payee\n2024-01-01,Cafe\n')
+    with pytest.raises(StatementError, match='Line 3: 1 columns where the header has 3'):
+        csv_rows('Payee,Date,Amount\nCafe,2024-01-01,1\nCafe\n')
+    with pytest.raises(StatementError, match='Line 2'):
+        csv_rows('Date,Amount\n2024-01-01,-\n')
+    # Trailing cells left out are only missing if they are needed
+    assert csv_rows('Date,Amount,Payee,Category\n2024-01-01,1\n') == [
+        ('2024-01-01', '', '', 100, 'Bank Import', 'Misc', 'INR')]
+
+
+def test_ofx():
+    statement = ('OFXHEADER:100\n<OFX><STMTRS><CURDEF>USD<BANKTRANLIST>'
+                 '<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240301120000<TRNAMT>-12.50<NAME>Cafe<MEMO>Lunch</STMTTRN>'
+                 '<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240302<TRNAMT>100.00<NAME>Refund</STMTTRN>'
+                 '<STMTTRN><NAME>No date</STMTTRN>'
+                 '</BANKTRANLIST></STMTRS></OFX>')
+    # Blocks smaller than a transaction split tags across reads
+    rows = list(read_ofx(io.StringIO(statement), block_size=16))
+    assert rows == [
+        ('2024-03-01', 'Cafe', 'Lunch', 1250, 'Debit', 'Misc', 'USD'),
+        ('2024-03-02', 'Refund', '', -10000, 'Credit', 'Misc', 'USD'),
+    ]
+
+
+@pytest.mark.parametrize('rebuild_indexes', [False, True])
+def test_import_file_keeps_the_totals(connector, expenses, tmp_path, rebuild_indexes):
+    path = tmp_path / 'statement.csv'
+    path.write_text('Date,Payee,Description,Amount,Category\n'
+                    + ''.join(f'2024-0{month}-1{day},shop,item {day},{month}.{day}0,Food\n'
+                              for month in range(1, 4) for day in range(5)), encoding='utf-8')
+
+    progress = []
+    imported = import_file(connector, str(path), batch_size=4, rebuild_indexes=rebuild_indexes,
+                           progress=lambda rows, fraction: progress.append(rows))
+    assert imported == 15
+    assert progress == [4, 8, 12, 15]
+    assert expenses.count() == 15
+    assert stored_totals(connector) == recomputed_totals(connector)
+    assert running_sums_are_settled(connector)
+    assert len(expenses.list(text='item')) == 15
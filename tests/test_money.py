@@ -0,0 +1,64 @@
+from decimal import Decimal
+
+import pytest
+
+from expense_core import format_amount, from_minor, to_decimal, to_minor
+from expense_core.money import parse_minor
+
+from .helpers import expense
+
+
+@pytest.mark.parametrize('currency, amount, minor', [
+    ('INR', '1250.50', 125050),
+    ('INR', '0.10', 10),
+    ('USD', '-3.07', -307),
+    ('JPY', '1500', 1500),
+    ('KWD', '2.125', 2125),
+    ('INR', '92233720368547758.07', 9223372036854775807),
+])
+def test_round_trip(currency, amount, minor):
+    assert to_minor(amount, currency) == minor
+    assert from_minor(minor, currency) == Decimal(amount)
+    assert parse_minor(amount, currency) == minor
+
+
+def test_too_many_decimal_places():
+    with pytest.raises(ValueError):
+        to_minor('1.005', 'INR')
+    with pytest.raises(ValueError):
+        to_minor('10.5', 'JPY')
+    # Search bounds are rounded instead
+    assert to_minor('1.005', 'INR', exact=False) == 100
+    assert to_minor('1.015', 'INR', exact=False) == 102
+
+
+def test_to_decimal():
+    assert to_decimal(0.1) == Decimal('0.1')
+    assert to_decimal('1,234.50') == Decimal('1234.50')
+    assert to_decimal(7) == Decimal(7)
+    for value in ('abc', 'nan', 'inf', ''):
+        with pytest.raises(ValueError):
+            to_decimal(value)
+
+
+def test_format_amount():
+    assert format_amount(Decimal('1250.5')) == '₹1250.50'
+    assert format_amount(Decimal('1500'), 'JPY') == '¥1500'
+    assert format_amount(Decimal('2.125'), 'KWD') == '2.125 KWD'
+
+
+def test_amounts_are_stored_exactly(connector, expenses):
+    stored = expenses.add(expense('2024-05-01', '0.10'))
+    expenses.add(expense('2024-05-01', '0.20'))
+    expenses.add(expense('2024-05-02', '999', currency='JPY'))
+
+    assert connector.execute('SELECT Amount FROM ExpenseTracker WHERE ID = ?', (stored.id,)).fetchone() == (10,)
+    assert expenses.get(stored.id).amount == Decimal('0.10')
+    assert expenses.total() == Decimal('0.30')
+    assert expenses.total('JPY') == Decimal('999')
+
+    expenses.update(stored.id, amount='12.34')
+    assert expenses.get(stored.id).amount == Decimal('12.34')
+    # A new amount is in the new currency
+    expenses.update(stored.id, amount='500', currency='JPY')
+    assert connector.execute('SELECT Amount FROM ExpenseTracker WHERE ID = ?', (stored.id,)).fetchone() == (500,)
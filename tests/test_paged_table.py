@@ -0,0 +1,86 @@
+import datetime
+
+import pytest
+
+from expense_core import COLUMNS, archive_year
+from paged_table import PagedTable
+
+from .helpers import expense
+
+
+class Treeview:
+    """The part of ttk.Treeview that PagedTable uses, without Tk."""
+
+    def __init__(self):
+        self.children = []
+        self.values = {}
+
+    def config(self, **options):
+        pass
+
+    def insert(self, parent, index, iid=None, values=()):
+        self.children.insert(len(self.children) if index == 'end' else index, iid)
+        self.values[iid] = tuple(values)
+
+    def delete(self, *items):
+        for iid in items:
+            self.children.remove(iid)
+            del self.values[iid]
+
+    def get_children(self, item=''):
+        return tuple(self.children)
+
+    def item(self, iid, option=None, **options):
+        self.values[iid] = tuple(options['values'])
+
+    def see(self, iid):
+        pass
+
+
+@pytest.fixture
+def ledger(expenses):
+    """IDs of 12 expenses in date order: three undated ones first, then one a month of 2023 and 2024."""
+    undated = [expenses.add(expense(None, '1.00')).id for _ in range(3)]
+    dated = [expenses.add(expense(datetime.date(2023 + month // 6, month % 6 * 2 + 1, 10), '2.00')).id
+             for month in reversed(range(9))]
+    return undated + dated[::-1]
+
+
+def shown(treeview):
+    return [int(iid) for iid in treeview.get_children()]
+
+
+@pytest.mark.parametrize('archived', [False, True])
+def test_date_order_pages_through_undated_expenses(connector, ledger, archived):
+    if archived:
+        archive_year(connector, 2023)
+    treeview = Treeview()
+    view = PagedTable(treeview, connector, COLUMNS, sort='Date', page_size=2, max_pages=2)
+
+    view.reset()
+    while view.load_next_page():
+        pass
+    # Only the last two pages are kept
+    assert shown(treeview) == ledger[-4:]
+
+    while view.load_previous_page():
+        pass
+    assert shown(treeview) == ledger[:4]
+
+
+def test_undated_expenses_are_placed_and_moved(connector, expenses, ledger):
+    treeview = Treeview()
+    view = PagedTable(treeview, connector, COLUMNS, sort='Date', page_size=20)
+    view.reset()
+
+    added = expenses.add(expense(None, '3.00')).id
+    view.row_added(added)
+    assert shown(treeview) == ledger[:3] + [added] + ledger[3:]
+
+    expenses.update(added, date=datetime.date(2030, 1, 1))
+    view.row_updated(added)
+    assert shown(treeview) == ledger + [added]
+
+    expenses.update(ledger[-1], date=None)
+    view.row_updated(ledger[-1])
+    assert shown(treeview) == ledger[:3] + [ledger[-1]] + ledger[3:-1] + [added]
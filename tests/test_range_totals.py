@@ -0,0 +1,86 @@
+import datetime
+from decimal import Decimal
+
+import pytest
+
+from expense_core import RangeTotal, archive_year
+from expense_core.fx import MissingRateError, converted_range_totals, import_rates
+from expense_core.schema import settle_daily_totals
+
+from .helpers import expense, running_sums_are_settled
+
+DAYS = ('2023-03-01', '2023-07-15', '2023-12-31', '2024-01-01', '2024-02-29', '2024-06-30')
+
+
+def day(value):
+    return datetime.date.fromisoformat(value)
+
+
+def listed_total(expenses, start, end, currency='INR'):
+    """The range total added up from the expenses themselves."""
+    found = expenses.list(start=start, end=end, currency=currency)
+    return RangeTotal(sum((item.amount for item in found), Decimal('0.00')), len(found))
+
+
+@pytest.fixture
+def ledger(connector, expenses):
+    for number, date in enumerate(DAYS, start=1):
+        expenses.add(expense(date, f'{number}.00', 'Food' if number % 2 else 'Fun'))
+    settle_daily_totals(connector)
+    connector.commit()
+    return expenses
+
+
+def assert_ranges_match(expenses):
+    for start, end in [(DAYS[0], DAYS[-1]), ('2023-05-01', '2024-01-31'), ('2023-12-31', '2024-01-01')]:
+        assert expenses.range_total(day(start), day(end)) == listed_total(expenses, start, end)
+
+
+def test_range_across_a_backdated_write(connector, ledger):
+    assert_ranges_match(ledger)
+
+    # An expense dated before days whose running sums are already settled
+    ledger.add(expense('2023-08-01', '100.00'))
+    assert connector.execute('SELECT Since FROM UnsettledDays').fetchone() == ('2023-08-01',)
+    assert ledger.range_total(day('2023-07-01'), day('2023-12-31')) == RangeTotal(Decimal('105.00'), 3)
+    assert_ranges_match(ledger)
+
+    settle_daily_totals(connector)
+    connector.commit()
+    assert connector.execute('SELECT * FROM UnsettledDays').fetchall() == []
+    assert running_sums_are_settled(connector)
+    assert ledger.range_total(day('2023-07-01'), day('2023-12-31')) == RangeTotal(Decimal('105.00'), 3)
+    assert_ranges_match(ledger)
+
+
+def test_range_over_an_archived_year(connector, ledger):
+    assert archive_year(connector, 2023) == 3
+    assert ledger.range_total(day('2023-01-01'), day('2023-12-31')) == RangeTotal(Decimal('6.00'), 3)
+    assert ledger.range_total(day('2023-07-01'), day('2024-01-31')) == RangeTotal(Decimal('9.00'), 3)
+    assert dict(ledger.range_category_totals(day('2023-01-01'), day('2023-12-31'))) == {
+        'Food': RangeTotal(Decimal('4.00'), 2), 'Fun': RangeTotal(Decimal('2.00'), 1)}
+
+
+@pytest.mark.parametrize('date, total', [(DAYS[0], '1.00'), (DAYS[-1], '6.00'), ('2024-03-01', '0.00')])
+def test_one_day_ranges(ledger, date, total):
+    expected = RangeTotal(Decimal(total), 0 if total == '0.00' else 1)
+    assert ledger.range_total(day(date), day(date)) == expected
+    assert sum(row.expenses for _, row in ledger.range_category_totals(day(date), day(date))) == expected.expenses
+
+
+def test_converted_range_totals(connector, expenses, tmp_path):
+    for date, amount, currency in (('2024-01-10', '5.00', 'INR'), ('2024-01-20', '10.00', 'USD'),
+                                   ('2024-02-05', '1.00', 'USD'), ('2024-02-20', '2.00', 'USD')):
+        expenses.add(expense(date, amount, currency=currency))
+    with pytest.raises(MissingRateError):
+        converted_range_totals(connector, day('2024-01-01'), day('2024-02-10'))
+
+    rates = tmp_path / 'rates.csv'
+    rates.write_text('Date,Currency,Rate\n2024-01-02,INR,80\n2024-02-01,INR,90\n', encoding='utf-8')
+    import_rates(connector, str(rates), base='USD')
+
+    # 10 dollars at January's rate and 1 at February's; 20 February is outside the range
+    categories, total = converted_range_totals(connector, day('2024-01-01'), day('2024-02-10'))
+    assert total == RangeTotal(Decimal('895.00'), 3)
+    assert categories == [('Food', total)]
+    assert converted_range_totals(connector)[1] == RangeTotal(Decimal('1075.00'), 4)
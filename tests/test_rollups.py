@@ -0,0 +1,81 @@
+import datetime
+from decimal import Decimal
+
+from expense_core import RangeTotal
+from expense_core.schema import rebuild_rollups, settle_daily_totals
+
+from .helpers import expense, recomputed_totals, running_sums_are_settled, stored_totals
+
+
+def ledger(expenses):
+    return [expenses.add(expense(*row)).id for row in (
+        ('2024-01-10', '100.00', 'Food'),
+        ('2024-01-10', '20.50', 'Fun'),
+        ('2024-01-31', '3.00', None),
+        ('2024-02-01', '40.00', 'Food', 'USD'),
+        ('2024-03-15', '7.25', 'Home'),
+    )]
+
+
+def test_totals_follow_adds_updates_and_deletes(connector, expenses):
+    ids = ledger(expenses)
+    assert stored_totals(connector) == recomputed_totals(connector)
+
+    # Every column the totals are keyed or summed on
+    expenses.update(ids[0], amount='99.99')
+    expenses.update(ids[1], category='Food')
+    expenses.update(ids[2], date=datetime.date(2023, 12, 31))
+    expenses.update(ids[3], currency='EUR')
+    expenses.update(ids[4], payee='hardware store')
+    assert stored_totals(connector) == recomputed_totals(connector)
+
+    expenses.delete(ids[1])
+    expenses.add(expense('2024-01-10', '1.00', 'Food'))
+    assert stored_totals(connector) == recomputed_totals(connector)
+
+    expenses.delete_all()
+    assert stored_totals(connector) == ([], [], [])
+
+
+def test_undated_expenses_count_in_the_monthly_totals_only(connector, expenses):
+    connector.execute("INSERT INTO ExpenseTracker (Date, Payee, Amount, Currency) VALUES (NULL, 'cafe', 500, 'INR')")
+    connector.commit()
+
+    assert expenses.monthly_totals() == [(None, None, Decimal('5.00'))]
+    assert expenses.range_total() == RangeTotal(Decimal('0.00'), 0)
+    assert stored_totals(connector) == recomputed_totals(connector)
+
+
+def test_aggregations(expenses):
+    ledger(expenses)
+    assert expenses.monthly_totals() == [
+        ('2024-01', None, Decimal('3.00')),
+        ('2024-01', 'Food', Decimal('100.00')),
+        ('2024-01', 'Fun', Decimal('20.50')),
+        ('2024-03', 'Home', Decimal('7.25')),
+    ]
+    assert expenses.category_totals() == [('Food', Decimal('100.00')), ('Fun', Decimal('20.50')),
+                                          ('Home', Decimal('7.25')), (None, Decimal('3.00'))]
+    assert expenses.total() == Decimal('130.75')
+    assert expenses.total('USD') == Decimal('40.00')
+    assert expenses.count() == 5
+
+
+def test_cached_aggregations_see_every_change(expenses):
+    ids = ledger(expenses)
+    assert expenses.total() == Decimal('130.75')
+    expenses.update(ids[0], amount='1.00')
+    assert expenses.total() == Decimal('31.75')
+    expenses.delete(ids[0])
+    assert expenses.total() == Decimal('30.75')
+
+
+def test_rebuild_rollups_matches_the_triggers(connector, expenses):
+    ledger(expenses)
+    settle_daily_totals(connector)
+    before = stored_totals(connector)
+
+    rebuild_rollups(connector)
+    connector.commit()
+    assert stored_totals(connector) == before
+    assert running_sums_are_settled(connector)
@@ -0,0 +1,121 @@
+import sqlite3
+
+import pytest
+
+from expense_core import SCHEMA_VERSION, ExpenseRepository, connect, migrate
+from expense_core.repository import INSERT_EXPENSE
+from expense_core.schema import (CHANGE_TRIGGERS, MIGRATIONS, MONTHLY_TOTALS_TRIGGERS, SEARCH_TRIGGERS, TRIGGERS,
+                                 begin_bulk_load, repair, schema_version, settle_daily_totals)
+
+from .helpers import expense, recomputed_totals, running_sums_are_settled, stored_totals
+
+
+def triggers(connector):
+    return {name for name, in connector.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+
+
+def test_new_database(connector):
+    assert schema_version(connector) == SCHEMA_VERSION
+    assert triggers(connector) == set(TRIGGERS) | set(CHANGE_TRIGGERS)
+    assert ExpenseRepository(connector).count() == 0
+
+
+def test_migrate_from_version_0(database, settings):
+    # The table main.py used to create: rupees as floats and no Category column
+    old = sqlite3.connect(database)
+    old.execute('CREATE TABLE ExpenseTracker (ID INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, Date DATETIME, '
+                'Payee TEXT, Description TEXT, Amount FLOAT, ModeOfPayment TEXT)')
+    old.executemany('INSERT INTO ExpenseTracker (Date, Payee, Description, Amount, ModeOfPayment) '
+                    'VALUES (?, ?, ?, ?, ?)', [
+        ('2024-01-05', 'market', 'vegetables', 100.1, 'Cash'),
+        ('2024-01-20', 'cinema', 'tickets', 0.3, 'Card'),
+        ('2024-02-02', 'gone', 'deleted later', 5.0, 'Cash'),
+    ])
+    old.execute('DELETE FROM ExpenseTracker WHERE ID = 3')
+    old.commit()
+    old.close()
+
+    connector = connect(database, settings)
+    try:
+        assert migrate(connector) == 0
+        assert schema_version(connector) == SCHEMA_VERSION
+        rows = connector.execute('SELECT ID, Amount, Category, Currency FROM ExpenseTracker ORDER BY ID').fetchall()
+        assert rows == [(1, 10010, None, 'INR'), (2, 30, None, 'INR')]
+        assert stored_totals(connector) == recomputed_totals(connector)
+        assert running_sums_are_settled(connector)
+
+        expenses = ExpenseRepository(connector)
+        assert [found.id for found in expenses.list(text='veg')] == [1]
+        # The ID of the deleted expense is not handed out again
+        assert expenses.add(expense('2024-03-01', '1.00')).id == 4
+
+        # A second run has nothing left to do
+        assert migrate(connector) == SCHEMA_VERSION
+    finally:
+        connector.close()
+
+
+def test_each_version_only_has_triggers_for_its_tables(database, settings):
+    # A database left at version 5 by an older program
+    connector = connect(database, settings)
+    try:
+        connector.execute('BEGIN')
+        for target, step in enumerate(MIGRATIONS[:5], start=1):
+            step(connector)
+            connector.execute(f'PRAGMA user_version = {target}')
+        connector.commit()
+        assert triggers(connector) == set(MONTHLY_TOTALS_TRIGGERS) | set(SEARCH_TRIGGERS)
+
+        # Which that program can still write to, before the daily totals exist
+        connector.execute("INSERT INTO ExpenseTracker (Date, Payee, Description, Amount, ModeOfPayment) "
+                          "VALUES ('2024-01-05', 'market', 'vegetables', 10010, 'Cash')")
+        connector.commit()
+
+        assert migrate(connector) == 5
+        assert triggers(connector) == set(TRIGGERS) | set(CHANGE_TRIGGERS)
+        assert stored_totals(connector) == recomputed_totals(connector)
+    finally:
+        connector.close()
+
+
+def test_newer_database_is_refused(connector):
+    connector.execute(f'PRAGMA user_version = {SCHEMA_VERSION + 1}')
+    with pytest.raises(RuntimeError):
+        migrate(connector)
+
+
+def test_repair_finishes_an_interrupted_bulk_load(connector, expenses):
+    expenses.add(expense('2024-01-01', '10.00'))
+    begin_bulk_load(connector)
+    connector.commit()
+    # Killed after a batch was committed, before end_bulk_load
+    connector.execute(INSERT_EXPENSE, expense('2023-12-31', '2.50', payee='bakery').values())
+    connector.commit()
+    assert not triggers(connector) & set(TRIGGERS)
+
+    assert repair(connector)
+    assert triggers(connector) == set(TRIGGERS) | set(CHANGE_TRIGGERS)
+    assert stored_totals(connector) == recomputed_totals(connector)
+    assert [found.payee for found in expenses.list(text='bak')] == ['bakery']
+    assert not repair(connector)
+
+
+def test_migrate_puts_back_missing_change_counters(connector, expenses):
+    connector.execute('DROP TRIGGER ExpenseChangesDelete')
+    connector.commit()
+
+    migrate(connector)
+    assert 'ExpenseChangesDelete' in triggers(connector)
+    version = expenses.data_version()
+    expenses.delete(expenses.add(expense('2024-01-01', '1.00')).id)
+    assert expenses.data_version() != version
+
+
+def test_settle_daily_totals(connector, expenses):
+    expenses.add(expense('2024-03-01', '5.00'))
+    expenses.add(expense('2024-01-01', '7.00'))
+    settle_daily_totals(connector)
+    connector.commit()
+
+    assert running_sums_are_settled(connector)
+    assert connector.execute('SELECT COUNT(*) FROM UnsettledDays').fetchone()[0] == 0
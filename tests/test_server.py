@@ -0,0 +1,106 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+
+import pytest
+
+from expense_core.server import ExpenseServer
+
+TOKEN = 'secret'
+
+
+@pytest.fixture
+def server(database, settings, connector):
+    """An ExpenseServer on a free port of 127.0.0.1, run by an event loop of its own thread."""
+    loop = asyncio.new_event_loop()
+    server = ExpenseServer(database, settings, readers=2, token=TOKEN)
+    loop.run_until_complete(server.start('127.0.0.1', 0))
+    thread = threading.Thread(target=loop.run_forever)
+    thread.start()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    loop.close()
+
+
+def request(server, method, path, body=None, token=TOKEN):
+    """(status, decoded JSON) of one request on a new connection."""
+    client = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    try:
+        headers = {'Authorization': f'Bearer {token}'} if token is not None else {}
+        client.request(method, path, body=json.dumps(body) if body is not None else None, headers=headers)
+        response = client.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        client.close()
+
+
+def expense(day, amount='1.00', **fields):
+    return {'date': day, 'payee': 'cafe', 'description': 'coffee', 'amount': amount, **fields}
+
+
+def test_pages_follow_each_other(server):
+    status, added = request(server, 'POST', '/expenses', [expense(f'2024-01-{day:02d}', f'{day}.50')
+                                                          for day in range(1, 8)])
+    assert status == 201 and len(added['ids']) == 7
+
+    dates, after = [], ''
+    while True:
+        status, page = request(server, 'GET', f'/expenses?limit=3{after}')
+        assert status == 200 and len(page['expenses']) <= 3
+        dates += [found['date'] for found in page['expenses']]
+        if not page['next']:
+            break
+        after = f'&after={page["next"]}'
+    assert dates == [f'2024-01-{day:02d}' for day in range(1, 8)]
+
+    status, page = request(server, 'GET', '/expenses?from=2024-01-06')
+    assert [(found['date'], found['amount']) for found in page['expenses']] == [('2024-01-06', '6.50'),
+                                                                                  ('2024-01-07', '7.50')]
+
+
+def test_a_posted_list_is_added_in_one_transaction(server):
+    status, added = request(server, 'POST', '/expenses', [expense('2024-02-01', '2.00', category='Food'),
+                                                          expense('2024-02-02', '3.00', currency='usd')])
+    assert status == 201
+    status, page = request(server, 'GET', '/expenses')
+    assert [(found['id'], found['amount'], found['currency']) for found in page['expenses']] == [
+        (added['ids'][0], '2.00', 'INR'), (added['ids'][1], '3.00', 'USD')]
+
+    # One bad expense and none of the list is added
+    status, error = request(server, 'POST', '/expenses', [expense('2024-02-03'), expense('2024-02-04', 'lots')])
+    assert status == 400 and 'error' in error
+    assert len(request(server, 'GET', '/expenses')[1]['expenses']) == 2
+
+
+@pytest.mark.parametrize('body', [b'{"payee": ', b'[]', b'{"payee": "cafe"}', b'{"amount": "1.001", "payee": "a"}'])
+def test_bad_expenses_are_refused(server, body):
+    client = http.client.HTTPConnection('127.0.0.1', server.port, timeout=10)
+    client.request('POST', '/expenses', body=body, headers={'Authorization': f'Bearer {TOKEN}'})
+    response = client.getresponse()
+    assert response.status == 400 and 'error' in json.loads(response.read())
+    client.close()
+
+
+@pytest.mark.parametrize('token', [None, 'wrong'])
+def test_a_bearer_token_is_required(server, token):
+    assert request(server, 'GET', '/expenses', token=token)[0] == 401
+    assert request(server, 'POST', '/expenses', expense('2024-01-01'), token=token)[0] == 401
+    assert request(server, 'GET', '/expenses')[1]['expenses'] == []
+
+
+@pytest.mark.parametrize('head, status', [
+    (b'GET /expenses?q=' + b'x' * 70000 + b' HTTP/1.1\r\n\r\n', 400),
+    (b'GET /expenses HTTP/1.1\r\nX-Padding: ' + b'x' * 70000 + b'\r\n\r\n', 431),
+], ids=['request line', 'header'])
+def test_overlong_lines_are_answered_and_closed(server, head, status):
+    with socket.create_connection(('127.0.0.1', server.port), timeout=10) as client:
+        client.sendall(head)
+        response = b''
+        while chunk := client.recv(65536):
+            response += chunk
+    assert response.startswith(f'HTTP/1.1 {status} '.encode())
+    assert b'Connection: close' in response
@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from expense_core import WriteQueue
+
+from .helpers import expense
+
+
+def test_writes_are_committed(connector, expenses, database, settings):
+    writes = WriteQueue(database, settings)
+    added = writes.add_many([expense('2024-01-01', '1.00'), expense('2024-01-02', '2.00')]).result(timeout=10)
+    writes.delete(added[0].id).result(timeout=10)
+    writes.close()
+    assert [found.id for found in expenses.list()] == [added[1].id]
+
+
+def test_a_failed_connection_fails_every_write(tmp_path, settings):
+    writes = WriteQueue(str(tmp_path / 'missing' / 'Expense Tracker.db'), settings)
+    # Queued before or after the thread gave up, the write fails rather than waiting forever
+    future = writes.add(expense('2024-01-01', '1.00'))
+    with pytest.raises(sqlite3.OperationalError):
+        future.result(timeout=10)
+    with pytest.raises(sqlite3.OperationalError):
+        writes.add(expense('2024-01-02', '2.00'))
+    writes.close()